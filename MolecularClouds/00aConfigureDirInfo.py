@@ -4,9 +4,12 @@ from configparser import ConfigParser
 '''
 This is the zeroth stage of the BLOSMapping method where the necessary configuration files are created
 
-    - When run, this file will initialize a set of configuration files with default values into the same directory.
+    - When run, this file will initialize a set of configuration files with default values into the same directory
+      (the directory of this file, where Classes/config.py reads them).
     - Do not run if the config files are already present, as it will overwrite the config files again!
 '''
+scriptDir = os.path.dirname(os.path.abspath(__file__))
+
 # -------- DEFINE STARTING VARIABLES. --------
 configStartSettings = ConfigParser()
 configStartSettings['Cloud'] = {
@@ -14,6 +17,8 @@ configStartSettings['Cloud'] = {
     }
 configStartSettings['Judgement'] = {
     'Interpolate Bad Extinction Values': True,
+    'Interpolation Engine': 'Global',
+    'Interpolation Window': 2,
     'Off Disk Latitude': 15.,
     'On Disk Extinction Threshold': 2.,
     'Off Disk Extinction Threshold': 1.,
@@ -21,7 +26,44 @@ configStartSettings['Judgement'] = {
     'High Extinction Threshold Multiplier': 5,
     'Anomalous Values Standard Deviation': 3.
     }
-with open('configStartSettings.ini', 'w') as output_file:
+configStartSettings['Processing'] = {
+    'Crop Margin': 50,
+    'Sensitivity Workers': 1
+    }
+# Choices used by BatchRun.py in place of the user's input. Left blank, the suggested value is used.
+configStartSettings['Batch'] = {
+    'Workers': 0,
+    'Extinction Threshold': '',
+    'Number of Reference Points': '',
+    'Pixel Check Range': '',
+    'High Extinction Threshold': '',
+    'Anomalous Values Standard Deviation': '',
+    'Reference Points': '',
+    'Points to Plot': 10,
+    'Minimum Extinction to Plot': '-inf',
+    'Maximum Extinction to Plot': 'inf'
+    }
+# Monte Carlo estimate of the BLOS uncertainties in stage 07. 0 samples skips it; a blank seed differs from run to run.
+configStartSettings['Monte Carlo'] = {
+    'Samples': 0,
+    'Workers': 1,
+    'Seed': '',
+    'Temperature Change': 20,
+    'Density Change': 50
+    }
+# Headless saves the figures without showing them; they are then rendered by a background process unless
+# Background Rendering is False.
+# Label Placement is how the points of the maps are labelled: Free (each figure's own placement), Grid (labels which
+# would overlap are left out) or Auto (Free up to Free Label Limit labels on the map, Grid beyond). At most Label Limit
+# points are labelled.
+configStartSettings['Figures'] = {
+    'Headless': False,
+    'Background Rendering': True,
+    'Label Placement': 'Auto',
+    'Free Label Limit': 100,
+    'Label Limit': 500
+    }
+with open(os.path.join(scriptDir, 'configStartSettings.ini'), 'w') as output_file:
     configStartSettings.write(output_file)
 # -------- DEFINE STARTING VARIABLES. --------
 
@@ -29,7 +71,7 @@ with open('configStartSettings.ini', 'w') as output_file:
 configDirectoryAndNames = ConfigParser()
 
 configDirectoryAndNames['Output File Locations'] = {
-    'Root': os.path.abspath(os.getcwd()),
+    'Root': scriptDir,
     'File Output': 'FileOutput',
     'Plots': 'Plots',
     'Density Sensitivity': 'DensitySensitivity',
@@ -58,7 +100,7 @@ configDirectoryAndNames['Input File Names'] = {
     'RM Catalogue': 'RMCatalogue.txt'
     }
 
-with open('configDirectoryAndNames.ini', 'w') as output_file:
+with open(os.path.join(scriptDir, 'configDirectoryAndNames.ini'), 'w') as output_file:
     configDirectoryAndNames.write(output_file)
 # -------- DEFINE DIRECTORIES AND NAMES. --------
 
@@ -70,7 +112,7 @@ configConstants['Conversion Factors'] = {
     'Parsecs to Centimeters': 3.24078e-19
     }
 
-with open('configConstants.ini', 'w') as output_file:
+with open(os.path.join(scriptDir, 'configConstants.ini'), 'w') as output_file:
     configConstants.write(output_file)
 # -------- DEFINE CONSTANTS. --------
 
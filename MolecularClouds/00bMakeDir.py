@@ -6,9 +6,10 @@ This is the zeroth stage of the BLOSMapping method where the necessary directori
 """
 import os
 import Classes.config as config
+from Classes.util import askUser
 
 # -------- CHOOSE THE REGION OF INTEREST --------
-cloudName = input("Enter the name of the region of interest: ")
+cloudName = askUser("Enter the name of the region of interest: ", 'Cloud')
 cloudName = cloudName.capitalize()  # Ensure only the first letter is capitalized
 #cloudName = config.cloud
 # -------- CHOOSE THE REGION OF INTEREST. --------
@@ -4,19 +4,23 @@ This is the third stage of the BLOSMapping method where the reference points are
 import os
 import pandas as pd
 import numpy as np
-from astropy.wcs import WCS
-from astropy.io import fits
 import math
-import matplotlib.pyplot as plt
 from Classes.RegionOfInterest import Region
+from astropy.wcs import WCS
+from astropy.io import fits
+from Classes.ExtinctionMap import ExtinctionMap
 from Classes.FindAllPotentialRefPoints import FindAllPotentialReferencePoints
 from Classes.FindOptimalRefPoints import FindOptimalRefPoints
-import adjustText
-from Classes.CalculateB import CalculateB
+from Classes.FigureQueue import renderFigure, waitForFigures
+from Classes.Figures import plotRefPointMap, plotBLOSvsNRef
+from Classes.CalculateB import sweepReferencePoints
 import Classes.config as config
+from Classes.util import askUser
+import Classes.ConversionLibrary as cl
+import Classes.RefJudgeLib as rjl
 
 # -------- CHOOSE THE REGION OF INTEREST --------
-cloudName = input("Enter the name of the region of interest: ")
+cloudName = askUser("Enter the name of the region of interest: ", 'Cloud')
 cloudName = cloudName.capitalize()  # Ensure only the first letter is capitalized
 #cloudName = config.cloud
 regionOfInterest = Region(cloudName)
@@ -35,13 +39,15 @@ saveFigureDir_RefPointMap = os.path.join(config.dir_root, config.dir_fileOutput,
 MatchedRMExtincPath = os.path.join(config.dir_root, config.dir_fileOutput, cloudName, config.prefix_RMExtinctionMatch + cloudName + '.txt')
 # -------- Load matched rm and extinction data.
 
+cacheDir = os.path.join(config.dir_root, config.dir_fileOutput, cloudName)
+
 # -------- DEFINE FILES AND PATHS. --------
 
-# -------- READ FITS FILE --------
-hdulist = fits.open(regionOfInterest.fitsFilePath)
-hdu = hdulist[0]
-wcs = WCS(hdu.header)
-# -------- READ FITS FILE. --------
+# -------- READ FITS HEADER --------
+# Only the header is read; the map is drawn from the cached background (see Classes/BaseMap.py)
+header = fits.getheader(regionOfInterest.fitsFilePath)
+wcs = WCS(header)
+# -------- READ FITS HEADER. --------
 
 # -------- CHOOSE THE THRESHOLD EXTINCTION --------
 print('\n---------------------')
@@ -57,10 +63,11 @@ else:
     print('\t-For clouds that appear off the disk, such as {}, an appropriate threshold value is {}.'
           .format(cloudName, Av_threshold))
 
-chooseAvThreshold = input("Given this information, would you like to set the threshold extinction to the suggested {}? "
-                          "(y/n)".format(Av_threshold))
+chooseAvThreshold = askUser("Given this information, would you like to set the threshold extinction to the suggested {}? "
+                            "(y/n)".format(Av_threshold), 'Use Suggested Extinction Threshold', 'y')
 if chooseAvThreshold == 'n':
-    Av_threshold = float(input('Please enter the threshold extinction you would like to use instead: '))
+    Av_threshold = float(askUser('Please enter the threshold extinction you would like to use instead: ',
+                                 'Extinction Threshold', Av_threshold))
 # -------- CHOOSE THE THRESHOLD EXTINCTION. --------
 
 # -------- FIND ALL POTENTIAL REFERENCE POINTS --------
@@ -78,83 +85,16 @@ Dec_AllRef = list(AllPotenitalRefPoints.AllRefPoints['Dec(deg)'])
 RM_AllRef = list(AllPotenitalRefPoints.AllRefPoints['Rotation_Measure(rad/m2)'])
 Av_AllRef = list(AllPotenitalRefPoints.AllRefPoints['Extinction_Value'])
 # ---- Convert Ra and Dec of reference points into pixel values of the fits file
-x_AllRef = []  # x pixel coordinate of reference
-y_AllRef = []  # y pixel coordinate of reference
-for i in range(len(Ra_AllRef)):
-    pixelRow, pixelColumn = wcs.wcs_world2pix(Ra_AllRef[i], Dec_AllRef[i], 0)
-    x_AllRef.append(pixelRow)
-    y_AllRef.append(pixelColumn)
+# x and y pixel coordinate of reference
+x_AllRef, y_AllRef = cl.RADec2xy(Ra_AllRef, Dec_AllRef, wcs)
 # ---- Convert Ra and Dec of reference points into pixel values of the fits file.
 # -------- PREPARE TO PLOT ALL POTENTIAL REFERENCE POINTS. --------
 
 # -------- CREATE A FIGURE - ALL POTENTIAL REF POINTS MAP --------
-fig = plt.figure(figsize=(8, 8), dpi=120, facecolor='w', edgecolor='k')
-ax = fig.add_subplot(111, projection=wcs)
-
-plt.title('All Potential Reference Points' + ' in the ' + cloudName + ' region\n', fontsize=12, y=1.08)
-im = plt.imshow(hdu.data, origin='lower', cmap='BrBG', interpolation='nearest')
-plt.scatter(x_AllRef, y_AllRef, marker='o', facecolor='green', linewidth=.5, edgecolors='black', s=50)
-
-# ---- Annotate the chosen reference points
-text = []
-for i, number in enumerate(n_AllRef):
-    # Each point is labelled in order of increasing extinction value
-    # To label with ID number use: txt = ax.text(x_AllRef[i], y_AllRef[i], str(number), size=9, color='w')
-    txt = ax.text(x_AllRef[i], y_AllRef[i], str(i + 1), size=9, color='w')
-    text.append(txt)
-adjustText.adjust_text(text)
-# ---- Annotate the chosen reference points
-
-# ---- Style the main axes and their grid
-if not math.isnan(regionOfInterest.xmax) and not math.isnan(regionOfInterest.xmin):
-    ax.set_xlim(regionOfInterest.xmin, regionOfInterest.xmax)
-if not math.isnan(regionOfInterest.ymax) and not math.isnan(regionOfInterest.ymin):
-    ax.set_ylim(regionOfInterest.ymin, regionOfInterest.ymax)
-
-ra = ax.coords[0]
-dec = ax.coords[1]
-ra.set_major_formatter('d')
-dec.set_major_formatter('d')
-ra.set_axislabel('RA (degree)')
-dec.set_axislabel('Dec (degree)')
-
-dec.set_ticks(number=10)
-ra.set_ticks(number=20)
-ra.display_minor_ticks(True)
-dec.display_minor_ticks(True)
-ra.set_minor_frequency(10)
-
-ra.grid(color='black', alpha=0.5, linestyle='solid')
-dec.grid(color='black', alpha=0.5, linestyle='solid')
-# ---- Style the main axes and their grid.
-
-# ---- Style the overlay and its grid
-overlay = ax.get_coords_overlay('galactic')
-
-overlay[0].set_axislabel('Longitude')
-overlay[1].set_axislabel('Latitude')
-
-overlay[0].set_ticks(color='grey', number=20)
-overlay[1].set_ticks(color='grey', number=20)
-
-overlay.grid(color='grey', linestyle='solid', alpha=0.7)
-# ---- Style the overlay and its grid.
-
-# ---- Style the colour bar
-if regionOfInterest.fitsDataType == 'HydrogenColumnDensity':
-    cb = plt.colorbar(im, ticklocation='right', fraction=0.02, pad=0.145, format='%.0e')
-    cb.ax.set_title('Hydrogen Column Density', linespacing=0.5, fontsize=12)
-elif regionOfInterest.fitsDataType == 'VisualExtinction':
-    cb = plt.colorbar(im, ticklocation='right', fraction=0.02, pad=0.145)
-    cb.ax.set_title(' A' + r'$_V$', linespacing=0.5, fontsize=12)
-# ---- Style the colour bar.
-
-# ---- Display or save the figure
+# The map is rendered in the background in headless mode while the reference points are assessed
 saveFigurePath_RefPointMap = saveFigureDir_RefPointMap + os.sep + 'RefPointMap_AllPotentialRefPoints.png'
-plt.savefig(saveFigurePath_RefPointMap)
-plt.show()
-plt.close()
-# ---- Display or save the figure.
+renderFigure(plotRefPointMap, regionOfInterest, cloudName, x_AllRef, y_AllRef, saveFigurePath_RefPointMap,
+             cacheDir=cacheDir)
 print('Saving the map of all potential reference points to '+saveFigurePath_RefPointMap)
 # -------- CREATE A FIGURE - ALL POTENTIAL REF POINTS MAP. --------
 
@@ -168,16 +108,19 @@ OptimalRefPoints_from_AllPotentialRefPoints = FindOptimalRefPoints(cloudName, Al
 OptimalNumRefPoints_from_AllPotentialRefPoints = OptimalRefPoints_from_AllPotentialRefPoints. \
     Optimal_NumRefPoints_firstMode
 
-chooseOptimalNumRefPoints = input("Given this information, would you like to select the suggested {} reference points? "
-                                  "(y/n)".
-                                  format(OptimalNumRefPoints_from_AllPotentialRefPoints))
+chooseOptimalNumRefPoints = askUser("Given this information, would you like to select the suggested {} reference points? "
+                                    "(y/n)".
+                                    format(OptimalNumRefPoints_from_AllPotentialRefPoints),
+                                    'Use Suggested Number of Reference Points', 'y')
 if chooseOptimalNumRefPoints == 'y':
     print('The recommended reference points, numbered in order of increasing extinction, are: {}'.format(
         list([i + 1 for i in range(0, OptimalNumRefPoints_from_AllPotentialRefPoints)])))
 
 if chooseOptimalNumRefPoints == 'n':
-    OptimalNumRefPoints_from_AllPotentialRefPoints = int(input('Please enter the number of reference points you '
-                                                               'would like to use instead: '))
+    OptimalNumRefPoints_from_AllPotentialRefPoints = int(askUser('Please enter the number of reference points you '
+                                                                 'would like to use instead: ',
+                                                                 'Number of Reference Points',
+                                                                 OptimalNumRefPoints_from_AllPotentialRefPoints))
     print('The recommended reference points, numbered in order of increasing extinction, are: {}'.format(
         list([i + 1 for i in range(0, OptimalNumRefPoints_from_AllPotentialRefPoints)])))
 
@@ -201,49 +144,38 @@ cloudDistance = regionOfInterest.distance  # [pc]
 cloudJeansLength = config.cloudJeansLength   # [pc]
 minDiff = np.degrees(np.arctan(cloudJeansLength / cloudDistance))  # [deg]
 
-minDiff_pix = minDiff / abs(hdu.header['CDELT1'])
+minDiff_pix = minDiff / abs(header['CDELT1'])
 NDelt = config.pixelCheckMultiplier * math.ceil(minDiff_pix)  # Round up
-chooseNDelt = input("\t-Would you like the define a region around the given point to the suggested {} pixels? (y/n)".
-                    format(NDelt))
+chooseNDelt = askUser("\t-Would you like the define a region around the given point to the suggested {} pixels? (y/n)".
+                      format(NDelt), 'Use Suggested Pixel Check Range', 'y')
 if chooseNDelt == 'n':
-    NDelt = int(float(input('\tPlease enter the value you would like to use instead: ')))
+    NDelt = int(float(askUser('\tPlease enter the value you would like to use instead: ', 'Pixel Check Range', NDelt)))
 
 # Choose the minimum extinction value which you want to correspond to an "on" position
 highExtinctionThreshold = config.highExtinctionThreshMultiplier * Av_threshold
 
-chooseHighAvThreshold = input("\t-Would you like to define a region of high extinction to the suggested Av={}? (y/n)".
-                              format(highExtinctionThreshold))
+chooseHighAvThreshold = askUser("\t-Would you like to define a region of high extinction to the suggested Av={}? (y/n)".
+                                format(highExtinctionThreshold), 'Use Suggested High Extinction Threshold', 'y')
 if chooseHighAvThreshold == 'n':
-    highExtinctionThreshold = float(input('\tPlease enter the value you would like to use instead: '))
+    highExtinctionThreshold = float(askUser('\tPlease enter the value you would like to use instead: ',
+                                            'High Extinction Threshold', highExtinctionThreshold))
 # -------- Define the range.
 
-# -------- For each potential reference point
-nearHighExtinctionRegion = []
-for i in range(len(AllPotenitalRefPoints.AllRefPoints)):
-    idNum = AllPotenitalRefPoints.AllRefPoints['ID#'][i]
-    px = AllPotenitalRefPoints.AllRefPoints['Extinction_Index_x'][i]
-    py = AllPotenitalRefPoints.AllRefPoints['Extinction_Index_y'][i]
-
-    # ---- Find the extinction range for the given point
-    ind_xmax = px + NDelt + 1  # add 1 to be inclusive of the upper bound
-    ind_ymax = py + NDelt + 1  # add 1 to be inclusive of the upper bound
-    ind_xmin = px - NDelt
-    ind_ymin = py - NDelt
-    # ---- Find the extinction range for the given point.
-
-    # ---- Cycle through extinction values within the range
-    # If an extinction value within this range is too high, then it cannot be considered as a reference point
-    highExtinction = False
-    for pxx in range(ind_xmin, ind_xmax):
-        for pyy in range(ind_ymin, ind_ymax):
-            if 0 <= pxx < hdu.data.shape[1] and 0 <= pyy < hdu.data.shape[0]:
-                extinction_val = hdu.data[pyy, pxx]
-                if extinction_val > highExtinctionThreshold:
-                    highExtinction = True
-    if highExtinction == True:
-        nearHighExtinctionRegion.append(i + 1)  # To identify points numbered in order of increasing extinction
-    # ---- Cycle through extinction values within the range.
-# -------- For each potential reference point.
+# -------- Load the preprocessed extinction map around the potential reference points
+# This is the map prepared in stage 02 if it covers the points; otherwise it is prepared (and cached) here
+refX = AllPotenitalRefPoints.AllRefPoints['Extinction_Index_x']
+refY = AllPotenitalRefPoints.AllRefPoints['Extinction_Index_y']
+checkData = ExtinctionMap(regionOfInterest, np.min(refX), np.max(refX) + 1, np.min(refY), np.max(refY) + 1,
+                          margin=NDelt, cacheDir=cacheDir)
+# -------- Load the preprocessed extinction map around the potential reference points.
+
+# -------- Check all potential reference points at once
+# If an extinction value within the range of a point is too high, then it cannot be considered as a reference point
+highExtinction = rjl.nearHighExtinctionBatch(refX - checkData.xOffset, refY - checkData.yOffset, checkData.data, NDelt,
+                                             highExtinctionThreshold)
+# To identify points numbered in order of increasing extinction
+nearHighExtinctionRegion = (np.flatnonzero(highExtinction) + 1).tolist()
+# -------- Check all potential reference points at once.
 if len(nearHighExtinctionRegion) != 0:
     print('The potential reference point(s) {} are near a region of high extinction'.format(nearHighExtinctionRegion))
 
@@ -270,11 +202,13 @@ rm_std = np.std(matchedRMExtinctionData['Rotation_Measure(rad/m2)'])
 coeffSTD = config.anomalousSTDNum
 rm_upperLimit = rm_avg + coeffSTD * rm_std
 rm_lowerLimit = rm_avg - coeffSTD * rm_std
-chooseAnomalousRMThreshold = input("\t-Would you like to define anomalous rotation measure values to be greater or less"
-                                   " than the the suggested {} standard deviations from the mean (rm < {:.2f}rad/m^2 or"
-                                   " rm > {:.2f}rad/m^2)? (y/n)".format(coeffSTD, rm_lowerLimit, rm_upperLimit))
+chooseAnomalousRMThreshold = askUser("\t-Would you like to define anomalous rotation measure values to be greater or less"
+                                     " than the the suggested {} standard deviations from the mean (rm < {:.2f}rad/m^2 or"
+                                     " rm > {:.2f}rad/m^2)? (y/n)".format(coeffSTD, rm_lowerLimit, rm_upperLimit),
+                                     'Use Suggested Anomalous Values Standard Deviation', 'y')
 if chooseAnomalousRMThreshold == 'n':
-    coeffSTD = float(input('\tPlease enter the number of standard deviations you would like to use instead: '))
+    coeffSTD = float(askUser('\tPlease enter the number of standard deviations you would like to use instead: ',
+                             'Anomalous Values Standard Deviation', coeffSTD))
     rm_upperLimit = rm_avg + coeffSTD * rm_std
     rm_lowerLimit = rm_avg - coeffSTD * rm_std
 # -------- Define "anomalous".
@@ -299,8 +233,15 @@ print('---------------------\n')
 
 
 # -------- ASK THE USER WHICH POINTS THEY WANT TO USE AS REFERENCE POINTS --------
-chosenRefPoints_Num = [int(item) - 1 for item in input('Please enter the numbers of the reference points you would '
-                                                       'like to use as comma separated values').split(',')]
+# In a batch run, the recommended reference points are used unless they are near high extinction or anomalous
+numRecommended = min(OptimalNumRefPoints_from_AllPotentialRefPoints, AllPotenitalRefPoints.numAllRefPoints)
+recommendedRefPoints = [i + 1 for i in range(0, numRecommended)
+                        if i + 1 not in nearHighExtinctionRegion and i + 1 not in anomalousRMIndex]
+if len(recommendedRefPoints) == 0:
+    recommendedRefPoints = [i + 1 for i in range(0, numRecommended)]
+chosenRefPoints_Num = [int(item) - 1 for item in askUser('Please enter the numbers of the reference points you would '
+                                                         'like to use as comma separated values', 'Reference Points',
+                                                         ','.join(str(i) for i in recommendedRefPoints)).split(',')]
 chosenRefPoints = AllPotenitalRefPoints.AllRefPoints.loc[chosenRefPoints_Num].sort_values('Extinction_Value')
 
 print(chosenRefPoints)
@@ -314,35 +255,12 @@ However, we also want to include points which come after the chosen reference po
 The following selects all of the chosen reference points and then adds any of the potential reference points with
 extinction greater than the extinction of the last chosen reference point/
 '''
-RefPoints = chosenRefPoints[:-1].append(AllPotenitalRefPoints.AllRefPoints.set_index('ID#').
-                                        loc[list(chosenRefPoints['ID#'])[-1]:].reset_index())\
-    .reset_index(drop=True)
-# -------- Read the reference point data
-numRefPoints = len(RefPoints)
-# -------- Read the reference point data.
-
-# -------- Create a table for all blos data
-# The rows of this table will represent the number of reference points and the columns of this table will
-# represent the individual BLOS points.  Each entry in the table is a calculated BLOS value.
-AllData = pd.DataFrame()
-# -------- Create a table for all blos data.
-
+RefPoints = pd.concat([chosenRefPoints[:-1], AllPotenitalRefPoints.AllRefPoints.set_index('ID#').
+                      loc[list(chosenRefPoints['ID#'])[-1]:].reset_index()]).reset_index(drop=True)
 # -------- Calculate blos as a function of # ref points
-for num in range(numRefPoints):
-    # -------- Extract {num} points from the table of potential reference points
-    # The extracted potential reference points will be referred to as "candidates"
-    candidateRefPoints = RefPoints.loc[:num]
-    # -------- Extract {num} points from the table of potential reference points.
-
-    # -------- Use the candidate reference points to calculate BLOS
-    B = CalculateB(regionOfInterest.AvFilePath, MatchedRMExtincPath, candidateRefPoints, saveFilePath='none')
-    BLOSData = B.BLOSData.set_index('ID#', drop=True)
-    # -------- Use the candidate reference points to calculate BLOS
-
-    # -------- Add calculated BLOS to the table of BLOS vs number of reference points
-    AllData[str(num + 1)] = BLOSData['Magnetic_Field(uG)']
-    # -------- Add calculated BLOS to the table of BLOS vs number of reference points
-
+# The rows of this table will represent the individual BLOS points and the columns of this table will
+# represent the number of reference points.  Each entry in the table is a calculated BLOS value.
+AllData = sweepReferencePoints(regionOfInterest.AvFilePath, MatchedRMExtincPath, RefPoints)
 # -------- CALCULATE BLOS AS A FUNCTION OF # REF POINTS. --------
 
 # -------- FIND OPTIMAL NUM REF POINTS --------
@@ -353,32 +271,8 @@ Identifiers = list(DataNoRef.index)
 DataNoRef = DataNoRef.reset_index(drop=True)
 
 # -------- CREATE A FIGURE --------
-plt.figure(figsize=(6, 4), dpi=120, facecolor='w', edgecolor='k')
-
-plt.title('Calculated BLOS value as a function of the number of reference points \n ' + cloudName, fontsize=12,
-          y=1.08)
-plt.xlabel('Number of reference points')
-plt.ylabel('Calculated BLOS value ' + r'($\mu G$)')
-
-x = [int(col) for col in DataNoRef.columns]
-plt.xticks(x, list(DataNoRef.columns))
-
-cmap = plt.get_cmap('terrain')
-colors = [cmap(i) for i in np.linspace(0, 1, len(DataNoRef.index))]
-
-# For each BLOS Point
-for i, number in enumerate(DataNoRef.index):
-    plt.plot(x, list(DataNoRef.loc[number]), '-o', color=colors[i], markersize=3)
-
-yLower, yUpper = plt.ylim()
-plt.vlines(OptimalNumRefPoints_from_AllPotentialRefPoints, yLower, yUpper, color='black', label='Suggested optimal '
-                                                                                                'number of reference '
-                                                                                                'points')
-plt.legend(loc='center right', bbox_to_anchor=(1.1, 0.5), ncol=2, framealpha=1)
-
-plt.savefig(saveFigurePath_BLOSvsNRef_ChosenPotentialRefPoints)
-plt.show()
-plt.close()
+renderFigure(plotBLOSvsNRef, DataNoRef, cloudName, saveFigurePath_BLOSvsNRef_ChosenPotentialRefPoints,
+             optimalNumRefPoints=OptimalNumRefPoints_from_AllPotentialRefPoints)
 # -------- CREATE A FIGURE. --------
 # -------- REASSESS STABILITY. --------
 
@@ -407,3 +301,7 @@ print('Reference values were saved to {}'.format(saveFilePath_ReferenceData))
 chosenRefPoints.to_csv(saveFilePath_ReferencePoints, index=False, sep='\t')
 print('Chosen reference points were saved to {}'.format(saveFilePath_ReferencePoints))
 # -------- SAVE REFERENCE POINTS. --------
+
+# -------- WAIT FOR THE FIGURES --------
+waitForFigures()
+# -------- WAIT FOR THE FIGURES. --------
@@ -3,14 +3,15 @@ This is the fifth stage of the BLOSMapping method where the dependence on densit
     - All parameters except for density are held constant, and the magnetic field is calculated with electron abundances
     corresponding to changes of 0 and +/- 1, 2.5, 5, 10, 20, 20, 40, and 50 % the fiducial input density
 """
-from Classes.CalculateB import CalculateB
+from Classes.SensitivityExecutor import runSensitivityVariants
 import os
-from MolecularClouds.Classes.RegionOfInterest import Region
+from Classes.RegionOfInterest import Region
 import pandas as pd
 import Classes.config as config
+from Classes.util import askUser
 
 # -------- CHOOSE THE REGION OF INTEREST --------
-cloudName = input("Enter the name of the region of interest: ")
+cloudName = askUser("Enter the name of the region of interest: ", 'Cloud')
 cloudName = cloudName.capitalize()  # Ensure only the first letter is capitalized
 #cloudName = config.cloud
 regionOfInterest = Region(cloudName)
@@ -34,14 +35,18 @@ p = [1, 2.5, 5, 10, 20, 30, 40, 50]  # Percents of the input density
 percent = ['-{}'.format(i) for i in p[::-1]] + ['0'] + ['+{}'.format(i) for i in p]
 errPercent = []
 
+variants = {}
 for value in percent:
     AvAbundanceName = 'Av_T0_n' + value
     AvAbundancePath = regionOfInterest.AvFileDir + os.sep + AvAbundanceName + '.out'
     saveFilePath = saveFileDir + os.sep + 'B_' + AvAbundanceName + '.txt'
-    try:
-        B = CalculateB(AvAbundancePath, MatchedRMExtincPath, refPointTable, saveFilePath)
-    except:
-        errPercent.append(value)
+    variants[value] = (AvAbundancePath, saveFilePath)
+
+# The variants are independent, so they are calculated in parallel
+failedVariants = runSensitivityVariants(variants, MatchedRMExtincPath, refPointTable)
+for value, errorTraceback in failedVariants.items():
+    print('The density change of {}% failed:\n{}'.format(value, errorTraceback))
+    errPercent.append(value)
 
 if len(errPercent) > 0:
     print('-------------------------------------------------------------------------------')
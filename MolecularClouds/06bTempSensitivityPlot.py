@@ -7,11 +7,12 @@ import matplotlib.pyplot as plt
 import numpy as np
 import os
 import pandas as pd
-from MolecularClouds.Classes.RegionOfInterest import Region
+from Classes.RegionOfInterest import Region
 import Classes.config as config
+from Classes.util import askUser
 
 # -------- CHOOSE THE REGION OF INTEREST --------
-cloudName = input("Enter the name of the region of interest: ")
+cloudName = askUser("Enter the name of the region of interest: ", 'Cloud')
 cloudName = cloudName.capitalize()  # Ensure only the first letter is capitalized
 #cloudName = config.cloud
 regionOfInterest = Region(cloudName)
@@ -64,9 +65,9 @@ for i, value in enumerate(percent):
 # -------- EXTRACT BLOS FOR EACH PERCENT OF THE INPUT DENSITY. -------
 
 # -------- CHOOSE INDICES OF BLOS POINTS TO PLOT -------
-numToPlot = int(input("Choose the number of points to plot: "))
-AvMinToPlot = float(input("Choose the minimum extinction to plot: "))
-AvMaxToPlot = float(input("Choose the maximum extinction to plot: "))
+numToPlot = int(askUser("Choose the number of points to plot: ", 'Points to Plot', 10))
+AvMinToPlot = float(askUser("Choose the minimum extinction to plot: ", 'Minimum Extinction to Plot', '-inf'))
+AvMaxToPlot = float(askUser("Choose the maximum extinction to plot: ", 'Maximum Extinction to Plot', 'inf'))
 
 indMin = list(np.where(np.array(InitialBData['Scaled_Extinction']) >= AvMinToPlot)[0])
 indMax = list(np.where(np.array(InitialBData['Scaled_Extinction']) <= AvMaxToPlot)[0])
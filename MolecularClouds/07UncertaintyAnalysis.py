@@ -1,32 +1,37 @@
 """
 This is the seventh stage of the BLOSMapping method where the uncertainties in the BLOS values are calculated
+    - The uncertainties are combined from the RM error, the range of extinction about each point, and the density and
+    temperature sensitivity (stages 05a, 06a)
+    - If Monte Carlo samples are configured, the distribution of each BLOS value is also estimated by Monte Carlo
+    sampling (see Classes/MonteCarloUncertainty.py); this does not need the sensitivity stages
 """
 import os
+import numpy as np
 import pandas as pd
 from Classes.RegionOfInterest import Region
+from Classes.MonteCarloUncertainty import monteCarloBLOS
 import Classes.config as config
+from Classes.util import askUser
 
 # -------- FUNCTION DEFINITION --------
 def extinctionChemUncertainties(B, BHigher, BLower):
-    if max(B, BHigher, BLower) == B:
-        BLowerValue = min(BHigher, BLower)
-        BHigherValue = B
-    elif min(B, BHigher, BLower) == B:
-        BHigherValue = max(BHigher, BLower)
-        BLowerValue = B
-    else:
-        BHigherValue = max(BHigher, BLower)
-        BLowerValue = min(BHigher, BLower)
-
-    upperDelta = BHigherValue - B
-    lowerDelta = B - BLowerValue
-
+    """
+    Finds how far the BLOS values found with changed inputs reach above and below the BLOS values
+    :param B: Array of BLOS values
+    :param BHigher: Array of BLOS values found with one change of the inputs (eg. an increase of the density)
+    :param BLower: Array of BLOS values found with the opposite change of the inputs
+    :return: upperDelta, lowerDelta: Arrays of the distances (>= 0) from B to the greatest and to the least of the values
+    """
+    B = np.asarray(B, dtype=float)
+    stackedB = np.stack([B, np.asarray(BHigher, dtype=float), np.asarray(BLower, dtype=float)])
+    upperDelta = np.max(stackedB, axis=0) - B
+    lowerDelta = B - np.min(stackedB, axis=0)
     return upperDelta, lowerDelta
 # -------- FUNCTION DEFINITION. --------
 
 
 # -------- CHOOSE THE REGION OF INTEREST --------
-cloudName = input("Enter the name of the region of interest: ")
+cloudName = askUser("Enter the name of the region of interest: ", 'Cloud')
 cloudName = cloudName.capitalize()  # Ensure only the first letter is capitalized
 #cloudName = config.cloud
 regionOfInterest = Region(cloudName)
@@ -34,6 +39,8 @@ regionOfInterest = Region(cloudName)
 
 # -------- DEFINE FILES AND PATHS --------
 BFilePath = os.path.join(config.dir_root, config.dir_fileOutput, cloudName, config.prefix_BLOSPointData + cloudName + '.txt')
+MatchedRMExtincPath = os.path.join(config.dir_root, config.dir_fileOutput, cloudName, config.prefix_RMExtinctionMatch + cloudName + '.txt')
+RefPointPath = os.path.join(config.dir_root, config.dir_fileOutput, cloudName, config.prefix_selRefPoints + cloudName + '.txt')
 
 BData_DensityPathFragment = os.path.join(config.dir_root, config.dir_fileOutput, cloudName, config.dir_densitySensitivity)
 BData_TempPathFragment = os.path.join(config.dir_root, config.dir_fileOutput, cloudName, config.dir_temperatureSensitivity)
@@ -69,9 +76,6 @@ TotalRMErrStDevinB = (BData['Magnetic_Field(uG)']) * (BData['TotalRMScaledErrWit
                                                                          BData['Scaled_RM'])
 
 # -------- CALCULATE UNCERTAINTIES --------
-BTotalUpperUncertainty = []
-BTotalLowerUncertainty = []
-
 BChemDensIncrease = None
 BChemDensDecrease = None
 BChemTempIncrease = None
@@ -87,8 +91,8 @@ for densPercent in DensPercent:
     try:
         BData_DensityIncreasePath = os.path.join(BData_DensityPathFragment, "B_Av_T0_n+{}.txt".format(densPercent))
         BData_DensityDecreasePath = os.path.join(BData_DensityPathFragment, "B_Av_T0_n-{}.txt".format(densPercent))
-        BChemDensIncrease = list(pd.read_csv(BData_DensityIncreasePath, sep='\t')['Magnetic_Field(uG)'])
-        BChemDensDecrease = list(pd.read_csv(BData_DensityDecreasePath, sep='\t')['Magnetic_Field(uG)'])
+        BChemDensIncrease = pd.read_csv(BData_DensityIncreasePath, sep='\t')['Magnetic_Field(uG)'].to_numpy()
+        BChemDensDecrease = pd.read_csv(BData_DensityDecreasePath, sep='\t')['Magnetic_Field(uG)'].to_numpy()
         break
     except:
         errDensPercent.append(densPercent)
@@ -106,8 +110,8 @@ for tempPercent in TempPercent:
     try:
         BData_TempIncreasePath = os.path.join(BData_TempPathFragment, "B_Av_T+{}_n0.txt".format(tempPercent))
         BData_TempDecreasePath = os.path.join(BData_TempPathFragment, "B_Av_T-{}_n0.txt".format(tempPercent))
-        BChemTempIncrease = list(pd.read_csv(BData_TempIncreasePath, sep='\t')['Magnetic_Field(uG)'])
-        BChemTempDecrease = list(pd.read_csv(BData_TempDecreasePath, sep='\t')['Magnetic_Field(uG)'])
+        BChemTempIncrease = pd.read_csv(BData_TempIncreasePath, sep='\t')['Magnetic_Field(uG)'].to_numpy()
+        BChemTempDecrease = pd.read_csv(BData_TempDecreasePath, sep='\t')['Magnetic_Field(uG)'].to_numpy()
         break
     except:
         errTempPercent.append(tempPercent)
@@ -120,39 +124,56 @@ if len(errTempPercent) > 0:
     print('Please review the results.')
     print('-------------------------------------------------------------------------------')
 
-if BChemDensDecrease is None or BChemDensIncrease is None or BChemTempDecrease is None or BChemTempIncrease is None:
+haveChemData = not (BChemDensDecrease is None or BChemDensIncrease is None or BChemTempDecrease is None or BChemTempIncrease is None)
+if not haveChemData:
     print('-------------------------------------------------------------------------------')
     print(
         'Warning: There is insufficient data to calculate the uncertainty with!')
     print('Make sure the last two scripts (5, 6) were run before this script.')
-    print('This script will fail.')
+    if config.monteCarloSamples > 0:
+        print('Only the Monte Carlo uncertainties will be calculated.')
+    else:
+        print('This script will fail.')
     print('Please review the results.')
     print('-------------------------------------------------------------------------------')
 
-for index in range(len(BData)):
+# Without the sensitivity data only the Monte Carlo uncertainties can be calculated
+if haveChemData or config.monteCarloSamples == 0:
     upperDeltaBExt, lowerDeltaBExt = extinctionChemUncertainties(
-        BData['Magnetic_Field(uG)'][index], BData['BField_of_Min_Extinction'][index],
-        BData['BField_of_Max_Extinction'][index])
+        BData['Magnetic_Field(uG)'], BData['BField_of_Min_Extinction'], BData['BField_of_Max_Extinction'])
 
     upperDeltaBChemDens, lowerDeltaBChemDens = extinctionChemUncertainties(
-        BData['Magnetic_Field(uG)'][index], BChemDensIncrease[index], BChemDensDecrease[index])
+        BData['Magnetic_Field(uG)'], BChemDensIncrease, BChemDensDecrease)
 
     upperDeltaBChemTemp, lowerDeltaBChemTemp = extinctionChemUncertainties(
-        BData['Magnetic_Field(uG)'][index], BChemTempIncrease[index], BChemTempDecrease[index])
-
-    # Calculate uncertainties
-    BTotalUpperUncertainty.append("{0:.0f}".format(round(((TotalRMErrStDevinB[index]) ** 2 + upperDeltaBExt ** 2
-                                                          + upperDeltaBChemDens ** 2 + upperDeltaBChemTemp ** 2) ** (
-                                                                 1 / 2), 0)))
+        BData['Magnetic_Field(uG)'], BChemTempIncrease, BChemTempDecrease)
 
-    BTotalLowerUncertainty.append("{0:.0f}".format(round(((TotalRMErrStDevinB[index]) ** 2 + lowerDeltaBExt ** 2
-                                                          + lowerDeltaBChemDens ** 2 + lowerDeltaBChemTemp ** 2) ** (
-                                                                 1 / 2), 0)))
+    # Calculate uncertainties, rounded to the nearest uG
+    BTotalUpperUncertainty = ((TotalRMErrStDevinB ** 2 + upperDeltaBExt ** 2
+                               + upperDeltaBChemDens ** 2 + upperDeltaBChemTemp ** 2) ** (1 / 2)).round(0)
+    BTotalLowerUncertainty = ((TotalRMErrStDevinB ** 2 + lowerDeltaBExt ** 2
+                               + lowerDeltaBChemDens ** 2 + lowerDeltaBChemTemp ** 2) ** (1 / 2)).round(0)
 
-FinalBLOSResults['TotalUpperBUncertainty'] = BTotalUpperUncertainty
-FinalBLOSResults['TotalLowerBUncertainty'] = BTotalLowerUncertainty
+    FinalBLOSResults['TotalUpperBUncertainty'] = BTotalUpperUncertainty
+    FinalBLOSResults['TotalLowerBUncertainty'] = BTotalLowerUncertainty
 # -------- CALCULATE UNCERTAINTIES. --------
 
+# -------- ESTIMATE UNCERTAINTIES BY MONTE CARLO SAMPLING --------
+if config.monteCarloSamples > 0:
+    print('Drawing {} Monte Carlo samples of the magnetic field values'.format(config.monteCarloSamples))
+    MatchedRMExtincData = pd.read_csv(MatchedRMExtincPath, sep='\t')
+    refPointTable = pd.read_csv(RefPointPath, sep='\t')
+    BLower, BMedian, BUpper = monteCarloBLOS(BData['ID#'], MatchedRMExtincData, refPointTable,
+                                             regionOfInterest.AvFileDir, config.monteCarloSamples)
+    FinalBLOSResults['MonteCarloMedianB'] = BMedian
+    FinalBLOSResults['MonteCarloUpperBUncertainty'] = BUpper - BMedian
+    FinalBLOSResults['MonteCarloLowerBUncertainty'] = BMedian - BLower
+
+    numUnsampled = int(np.sum(np.isnan(BMedian)))
+    if numUnsampled > 0:
+        print('Warning: {} points had no valid Monte Carlo sample (negative scaled extinction in every sample).'.format(numUnsampled))
+# -------- ESTIMATE UNCERTAINTIES BY MONTE CARLO SAMPLING. --------
+
 # -------- SAVE FINAL BLOS RESULTS --------
 FinalBLOSResults.to_csv(saveFilePath, index=False, sep='\t')
 
@@ -0,0 +1,246 @@
+"""
+This file runs the stages of the BLOSMapping method (00b to 07) for several regions of interest without any interaction.
+
+    - Usage: python BatchRun.py [--force] [region names]
+      If no region is named, every region in the cloud parameter folder is run.
+    - Regions are run in parallel, each in its own worker process; the stages of a region are run in order.
+    - The choices the stages usually ask the user for are taken from the [Batch] section of configStartSettings.ini.
+      A region may override them in a [Batch] section of its cloud parameter file. Choices left blank take the
+      suggested value; the reference points default to the suggested ones which are neither near high extinction nor
+      anomalous.
+    - The output of each region is written to BatchLog<Region>.txt in the file output folder, and figures are saved
+      without being shown (in the background unless [Figures] Background Rendering is False; see FigureQueue.py).
+    - Stages are only rerun when their inputs have changed: each stage is fingerprinted from its script, the Classes
+      package, the input files it reads (catalogue, fits file, cloud parameter file, configuration files, abundance
+      profiles), its choices and the outputs of the stages it reads from (see Classes/PipelineState.py). A stage whose
+      fingerprint is unchanged, and whose outputs are as it left them, is skipped.
+      Giving --force reruns every stage.
+"""
+import os
+import sys
+import glob
+import runpy
+import traceback
+import contextlib
+from configparser import ConfigParser
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import Classes.config as config
+import Classes.util as util
+from Classes.RegionOfInterest import Region
+from Classes.PipelineState import PipelineState
+
+stageScripts = ['00bMakeDir.py', '01RMMapping.py', '02RMMatching.py', '03DetermineRefPoints.py', '04CalculateBLOS.py',
+                '05aDensitySensitivity.py', '05bDensitySensitivityPlot.py', '06aTempSensitivity.py',
+                '06bTempSensitivityPlot.py', '07UncertaintyAnalysis.py']
+
+# Choices for which a suggested value is offered; giving a value answers 'n' to the suggestion
+suggestedChoices = ['Extinction Threshold', 'Number of Reference Points', 'Pixel Check Range',
+                    'High Extinction Threshold', 'Anomalous Values Standard Deviation']
+otherChoices = ['Reference Points', 'Points to Plot', 'Minimum Extinction to Plot', 'Maximum Extinction to Plot']
+
+# Input files (see getStageInputs) and choices of each stage, and the stages whose outputs it reads
+stageInputs = {'00bMakeDir.py': [],
+               '01RMMapping.py': ['catalogue', 'fits'],
+               '02RMMatching.py': ['catalogue', 'fits'],
+               '03DetermineRefPoints.py': ['catalogue', 'fits', 'abundance'],
+               '04CalculateBLOS.py': ['catalogue', 'fits', 'abundance'],
+               '05aDensitySensitivity.py': ['abundance'],
+               '05bDensitySensitivityPlot.py': [],
+               '06aTempSensitivity.py': ['abundance'],
+               '06bTempSensitivityPlot.py': [],
+               '07UncertaintyAnalysis.py': ['abundance']}
+stageChoices = {'03DetermineRefPoints.py': suggestedChoices + ['Use Suggested ' + choice for choice in suggestedChoices]
+                + ['Reference Points'],
+                '05bDensitySensitivityPlot.py': otherChoices[1:],
+                '06bTempSensitivityPlot.py': otherChoices[1:]}
+# Sections of configStartSettings.ini which only some stages use
+stageSettingSections = {'Monte Carlo': ['07UncertaintyAnalysis.py'],
+                        'Figures': ['01RMMapping.py', '03DetermineRefPoints.py', '04CalculateBLOS.py']}
+stageDependencies = {'00bMakeDir.py': [],
+                     '01RMMapping.py': ['00bMakeDir.py'],
+                     '02RMMatching.py': ['00bMakeDir.py'],
+                     '03DetermineRefPoints.py': ['02RMMatching.py'],
+                     '04CalculateBLOS.py': ['02RMMatching.py', '03DetermineRefPoints.py'],
+                     '05aDensitySensitivity.py': ['02RMMatching.py', '03DetermineRefPoints.py'],
+                     '05bDensitySensitivityPlot.py': ['05aDensitySensitivity.py'],
+                     '06aTempSensitivity.py': ['02RMMatching.py', '03DetermineRefPoints.py'],
+                     '06bTempSensitivityPlot.py': ['06aTempSensitivity.py'],
+                     '07UncertaintyAnalysis.py': ['02RMMatching.py', '03DetermineRefPoints.py', '04CalculateBLOS.py',
+                                                  '05aDensitySensitivity.py', '06aTempSensitivity.py']}
+
+
+# -------- FUNCTION DEFINITION --------
+def getBatchAnswers(cloudName):
+    """
+    Collects the answers to the choices of the stages for a region of interest
+    :param cloudName: Name of the region of interest
+    :return: Dictionary of answers keyed by choice, for util.batchAnswers
+    """
+    cloudParams = ConfigParser()
+    cloudParams.read(os.path.join(config.dir_root, config.dir_data, config.dir_cloudParameters, cloudName.lower() + '.ini'))
+
+    answers = {'Cloud': cloudName}
+    for choice in suggestedChoices + otherChoices:
+        value = config.configStartSettings.get('Batch', choice, fallback='')
+        value = cloudParams.get('Batch', choice, fallback=value).strip()
+        if value == '':
+            continue
+        if choice in suggestedChoices:
+            answers['Use Suggested ' + choice] = 'n'
+        answers[choice] = value
+    return answers
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def getStageInputs(cloudName, stage):
+    """
+    Lists the files a stage of a region of interest reads, other than the outputs of earlier stages
+    :param cloudName: Name of the region of interest
+    :param stage: File name of the stage script
+    :return: List of paths
+    """
+    scriptDir = os.path.dirname(os.path.abspath(__file__))
+    inputPaths = [os.path.join(scriptDir, stage)]
+    inputPaths += sorted(glob.glob(os.path.join(scriptDir, 'Classes', '*.py')))
+    # configStartSettings.ini is fingerprinted through getStageChoices, without its [Batch] section
+    inputPaths += [os.path.join(scriptDir, name) for name in ['configDirectoryAndNames.ini', 'configConstants.ini']]
+    inputPaths.append(os.path.join(config.dir_root, config.dir_data, config.dir_cloudParameters, cloudName.lower() + '.ini'))
+
+    if len(stageInputs[stage]) > 0:
+        regionOfInterest = Region(cloudName)
+        if 'catalogue' in stageInputs[stage]:
+            inputPaths.append(os.path.join(config.dir_root, config.dir_data, config.file_RMCatalogue))
+        if 'fits' in stageInputs[stage]:
+            inputPaths.append(regionOfInterest.fitsFilePath)
+        if 'abundance' in stageInputs[stage]:
+            inputPaths += sorted(glob.glob(os.path.join(glob.escape(regionOfInterest.AvFileDir), '*.out')))
+    return inputPaths
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def getStageChoices(stage):
+    """
+    Collects the settings and choices a stage of a region of interest is run with
+    :param stage: File name of the stage script
+    :return: Dictionary of the settings of configStartSettings.ini (other than the [Batch] section and the sections
+             the stage does not use) and the stage's answers from util.batchAnswers
+    """
+    choices = {section: dict(config.configStartSettings.items(section)) for section in config.configStartSettings.sections()
+               if section != 'Batch' and stage in stageSettingSections.get(section, [stage])}
+    choices['Batch'] = {choice: util.batchAnswers[choice] for choice in stageChoices.get(stage, [])
+                        if choice in util.batchAnswers}
+    return choices
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def runRegion(cloudName, force=False):
+    """
+    Runs the stages for a region of interest whose inputs have changed, stopping at the first stage which fails
+    :param cloudName: Name of the region of interest
+    :param force: If True, every stage is run
+    :return: cloudName, the stage which failed (None if all succeeded) and its traceback
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from Classes.FigureQueue import waitForFigures, closeFigureQueue
+
+    # Figures are saved without being shown
+    config.useSnapshot(config.getSnapshot()._replace(figuresHeadless=True))
+    util.batchAnswers = getBatchAnswers(cloudName)
+    scriptDir = os.path.dirname(os.path.abspath(__file__))
+    logDir = os.path.join(config.dir_root, config.dir_fileOutput)
+    os.makedirs(logDir, exist_ok=True)
+    logPath = os.path.join(logDir, 'BatchLog' + cloudName.capitalize() + '.txt')
+    outputDir = os.path.join(config.dir_root, config.dir_fileOutput, cloudName.capitalize())
+    pipelineState = PipelineState(outputDir)
+
+    with open(logPath, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            for stage in stageScripts:
+                print('-------- {} --------'.format(stage))
+                try:
+                    # -------- CHECK WHETHER THE STAGE IS UP TO DATE --------
+                    fingerprint = pipelineState.fingerprint(getStageInputs(cloudName, stage), getStageChoices(stage),
+                                                            stageDependencies[stage])
+                    if not force and pipelineState.isUpToDate(stage, fingerprint):
+                        print('The inputs of this stage are unchanged; it is skipped.')
+                        print('-------- {}. --------\n'.format(stage))
+                        continue
+                    # -------- CHECK WHETHER THE STAGE IS UP TO DATE. --------
+
+                    signaturesBefore = pipelineState.outputSignatures()
+                    runpy.run_path(os.path.join(scriptDir, stage), run_name='__main__')
+                    waitForFigures()  # The figures of the stage are among its outputs
+                    pipelineState.record(stage, fingerprint, signaturesBefore)
+                    pipelineState.save()
+                except BaseException:  # including SystemExit from a stage
+                    errorTraceback = traceback.format_exc()
+                    print(errorTraceback)
+                    pipelineState.stages.pop(stage, None)  # The stage is rerun next time
+                    pipelineState.save()
+                    return cloudName, stage, errorTraceback
+                finally:
+                    plt.close('all')
+                    os.chdir(scriptDir)  # Stages may change directory
+                print('-------- {}. --------\n'.format(stage))
+        finally:
+            closeFigureQueue()  # Otherwise this process cannot exit
+    return cloudName, None, ''
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def runRegionInNewProcess(cloudName, force, snapshot):
+    """
+    Runs the stages for a region of interest in a new process of its own, so no state is carried from one region to
+    the next.  The process is not a daemon, so the stages may start worker processes of their own.
+    :param cloudName: Name of the region of interest
+    :param force: If True, every stage is run
+    :param snapshot: Configuration snapshot given to the process rather than reading the configuration again
+    :return: cloudName, the stage which failed (None if all succeeded) and its traceback
+    """
+    with ProcessPoolExecutor(max_workers=1, initializer=config.useSnapshot, initargs=(snapshot,)) as executor:
+        return executor.submit(runRegion, cloudName, force).result()
+# -------- FUNCTION DEFINITION. --------
+
+
+if __name__ == '__main__':
+    # -------- CHOOSE THE REGIONS OF INTEREST --------
+    force = '--force' in sys.argv[1:]
+    cloudNames = [arg for arg in sys.argv[1:] if arg != '--force']
+    if len(cloudNames) == 0:
+        cloudParameterFiles = glob.glob(os.path.join(config.dir_root, config.dir_data, config.dir_cloudParameters, '*.ini'))
+        cloudNames = sorted(os.path.basename(path)[:-len('.ini')] for path in cloudParameterFiles
+                            if 'template' not in os.path.basename(path).lower())
+    # -------- CHOOSE THE REGIONS OF INTEREST. --------
+
+    # -------- RUN THE REGIONS IN PARALLEL --------
+    numWorkers = config.batchWorkers if config.batchWorkers > 0 else os.cpu_count()
+    numWorkers = max(1, min(numWorkers, len(cloudNames)))
+    print('Running {} region(s) of interest with {} worker(s): {}'.format(len(cloudNames), numWorkers, cloudNames))
+
+    failures = []
+    # Each region is run in a new process (see runRegionInNewProcess); the threads only limit how many run at once
+    with ThreadPoolExecutor(max_workers=numWorkers) as executor:
+        futures = [executor.submit(runRegionInNewProcess, cloudName, force, config.getSnapshot())
+                   for cloudName in cloudNames]
+        for future in as_completed(futures):
+            cloudName, failedStage, errorTraceback = future.result()
+            if failedStage is None:
+                print('{}: all stages completed'.format(cloudName))
+            else:
+                print('{}: failed in {}\n{}'.format(cloudName, failedStage, errorTraceback))
+                failures.append((cloudName, failedStage))
+    # -------- RUN THE REGIONS IN PARALLEL. --------
+
+    if len(failures) > 0:
+        print('-------------------------------------------------------------------------------')
+        print('Warning: The following regions of interest did not complete (region, stage):')
+        print('{}'.format(failures))
+        print('Please review their logs in {}'.format(os.path.join(config.dir_root, config.dir_fileOutput)))
+        print('-------------------------------------------------------------------------------')
@@ -0,0 +1,137 @@
+"""
+This file contains the class to interpolate the extinction and electron abundance profiles of a parameter directory
+(Data/ChemicalAbundance/<parameters>/) at any change of the fiducial temperature and density.
+
+-  The profiles of a directory (Av_T<temperature change>_n<density change>.out) share one grid of cloud depths, so the
+    extinction and electron abundance of each depth are interpolated across the changes in temperature and density.
+    The profiles given by the chemical evolution code are reproduced exactly.
+-  If the directory has a profile for every combination of the temperature and density changes, the interpolation is
+    bilinear.  If it only has the changes in temperature at the fiducial density and the changes in density at the
+    fiducial temperature (as for the sensitivity stages), the two changes are combined: added for the extinction and
+    multiplied for the electron abundance (ie. added in log space), which keeps the abundance positive:
+        Av(T, n) = Av(T, 0) + Av(0, n) - Av(0, 0)
+        xe(T, n) = xe(T, 0) * xe(0, n) / xe(0, 0)
+-  Every evaluated profile is checked to have a non-negative electron abundance and an extinction which does not
+    decrease with depth
+-  The profiles are read once when the interpolator is made; evaluating it reads no files.  The fiducial density,
+    temperature and radiation field select the directory (see RegionOfInterest); they are not interpolated.
+"""
+import os
+import re
+import numpy as np
+from .AbundanceProfiles import readAbundanceProfile
+
+profileNamePattern = re.compile(r'^Av_T([+-]?[0-9.]+)_n([+-]?[0-9.]+)\.out$')
+
+
+# -------- FUNCTION DEFINITION --------
+def interpolationWeights(grid, values):
+    """
+    Finds the grid points on either side of each value, and the weight of the upper one, for linear interpolation
+    :param grid: Sorted grid points
+    :param values: Array of values within the grid
+    :return: indLower, indUpper, weight: Indices of the lower and upper grid points and the weight of the upper point
+    """
+    values = np.asarray(values, dtype=float)
+    if np.any(values < grid[0]) or np.any(values > grid[-1]) or np.any(np.isnan(values)):
+        raise ValueError('Value is outside the range {} to {} of the abundance grid'.format(grid[0], grid[-1]))
+    indUpper = np.clip(np.searchsorted(grid, values, side='left'), 1, max(len(grid) - 1, 1))
+    indLower = indUpper - 1
+    if len(grid) == 1:
+        return np.zeros_like(indLower), np.zeros_like(indLower), np.zeros(values.shape)
+    weight = (values - grid[indLower]) / (grid[indUpper] - grid[indLower])
+    return indLower, indUpper, weight
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- CLASS DEFINITION --------
+class AbundanceInterpolator:
+    def __init__(self, AvFileDir):
+        """
+        Reads the profiles of a parameter directory and prepares their interpolation
+
+        :param AvFileDir: Path to the directory of the profiles (eg. regionOfInterest.AvFileDir)
+
+        Attributes:
+            tempPercents: Changes (%) of the fiducial temperature which have profiles
+            densityPercents: Changes (%) of the fiducial density which have profiles
+            Av: Extinction of each depth of the profiles (temperature change, density change, depth); nan where the
+                directory has no profile
+            eAbundance: Electron abundance of each depth of the profiles, in the same form as Av
+            isComplete: Whether the directory has a profile for every combination of the changes
+        """
+        # -------- FIND THE PROFILES OF THE DIRECTORY --------
+        profiles = {}
+        for name in os.listdir(AvFileDir):
+            match = profileNamePattern.match(name)
+            if match:
+                profiles[(float(match.group(1)), float(match.group(2)))] = os.path.join(AvFileDir, name)
+        if (0., 0.) not in profiles:
+            raise FileNotFoundError('{} has no fiducial profile (Av_T0_n0.out)'.format(AvFileDir))
+        # -------- FIND THE PROFILES OF THE DIRECTORY. --------
+
+        # -------- READ THE PROFILES ONTO THE GRID --------
+        self.tempPercents = np.array(sorted({temp for temp, density in profiles}))
+        self.densityPercents = np.array(sorted({density for temp, density in profiles}))
+        numLayers = len(readAbundanceProfile(profiles[(0., 0.)])[0])
+
+        self.Av = np.full((len(self.tempPercents), len(self.densityPercents), numLayers), np.nan)
+        self.eAbundance = np.full((len(self.tempPercents), len(self.densityPercents), numLayers), np.nan)
+        for (temp, density), path in profiles.items():
+            Av, eAbundance = readAbundanceProfile(path)
+            if len(Av) != numLayers:
+                raise ValueError('{} does not have the same depths as the other profiles of its directory'.format(path))
+            i = np.searchsorted(self.tempPercents, temp)
+            j = np.searchsorted(self.densityPercents, density)
+            self.Av[i, j] = Av
+            self.eAbundance[i, j] = eAbundance
+        # -------- READ THE PROFILES ONTO THE GRID. --------
+
+        # Both quantities in one array (quantity, temperature change, density change, depth), so that they are
+        # interpolated together
+        self.values = np.stack([self.Av, self.eAbundance])
+        self.isComplete = not np.any(np.isnan(self.Av[:, :, 0]))
+        self.indTemp0 = np.searchsorted(self.tempPercents, 0.)
+        self.indDensity0 = np.searchsorted(self.densityPercents, 0.)
+        if not self.isComplete and (np.any(np.isnan(self.Av[:, self.indDensity0, 0]))
+                                    or np.any(np.isnan(self.Av[self.indTemp0, :, 0]))):
+            raise ValueError('{} needs every temperature change at the fiducial density and every density change at '
+                             'the fiducial temperature'.format(AvFileDir))
+
+    def evaluate(self, tempPercent, densityPercent):
+        """
+        Interpolates the profile at changes of the fiducial temperature and density
+        :param tempPercent: Change (%) of the fiducial temperature; a number or an array
+        :param densityPercent: Change (%) of the fiducial density; a number or an array of the same shape
+        :return: Av, eAbundance: Extinction and electron abundance of each depth, with the depths along the last axis
+        """
+        tempPercent, densityPercent = np.broadcast_arrays(np.asarray(tempPercent, dtype=float),
+                                                          np.asarray(densityPercent, dtype=float))
+        values = self.values
+        iT0, iT1, wT = interpolationWeights(self.tempPercents, tempPercent)
+        iN0, iN1, wN = interpolationWeights(self.densityPercents, densityPercent)
+        wT = wT[..., np.newaxis]
+        wN = wN[..., np.newaxis]
+
+        if self.isComplete:
+            lower = values[:, iT0, iN0] * (1 - wN) + values[:, iT0, iN1] * wN
+            upper = values[:, iT1, iN0] * (1 - wN) + values[:, iT1, iN1] * wN
+            result = lower * (1 - wT) + upper * wT
+        else:
+            tempChange = values[:, iT0, self.indDensity0] * (1 - wT) + values[:, iT1, self.indDensity0] * wT
+            densityChange = values[:, self.indTemp0, iN0] * (1 - wN) + values[:, self.indTemp0, iN1] * wN
+            fiducial = values[:, self.indTemp0, self.indDensity0].reshape((2,) + (1,) * tempPercent.ndim + (-1,))
+            Av = tempChange[0] + (densityChange[0] - fiducial[0])
+            eAbundance = tempChange[1] * np.divide(densityChange[1], fiducial[1], out=np.zeros(densityChange[1].shape),
+                                                   where=fiducial[1] != 0)
+            # Written so that profiles along either change are reproduced exactly
+            result = np.stack([Av, eAbundance])
+            result = np.where((tempPercent == 0)[..., np.newaxis], densityChange, result)
+            result = np.where((densityPercent == 0)[..., np.newaxis], tempChange, result)
+
+        if np.any(result[1] < 0) or np.any(np.diff(result[0], axis=-1) < 0):
+            raise ValueError('The interpolated abundance profile has a negative electron abundance or an extinction '
+                             'which decreases with depth')
+        return result[0], result[1]
+
+# -------- CLASS DEFINITION. --------
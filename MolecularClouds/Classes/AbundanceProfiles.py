@@ -0,0 +1,147 @@
+"""
+This file contains the functions to read the extinction and electron abundance profiles produced by chemical evolution
+code (the Av_*.out files in Data/ChemicalAbundance/<parameters>/)
+
+-  The first time a profile of a parameter directory is read, every profile of the directory is parsed into one binary
+    file (AbundanceProfiles.npy in the directory) which is memory mapped in later runs.  The size and modification time
+    of each profile are kept in the file, and the file is rebuilt when a profile is added or modified.
+-  Profiles which have been read are kept in memory (least recently used first out), keyed by their path, size and
+    modification time, so a profile is only read from disk once per process no matter how many times it is used
+"""
+import os
+import glob
+from functools import lru_cache
+import numpy as np
+
+profileExtension = '.out'
+storeFileName = 'AbundanceProfiles.npy'
+
+
+# -------- FUNCTION DEFINITION --------
+def parseAbundanceProfile(AvAbundancePath):
+    """
+    Parses a profile produced by chemical evolution code
+    :param AvAbundancePath: Path to the profile
+    :return: Av: Extinction of each layer
+             eAbundance: Electron abundance of each layer
+    """
+    return np.loadtxt(AvAbundancePath, usecols=(1, 2), unpack=True, skiprows=2)
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def buildProfileStore(directory):
+    """
+    Parses every profile of a directory into one structured array, with one row per profile and the fields 'name',
+    'size', 'mtime', 'numLayers', 'Av' and 'eAbundance'.  Profiles with fewer layers than the longest are padded with
+    nan.  Profiles which cannot be parsed are given -1 layers.
+    :param directory: Path to the parameter directory
+    :return: Structured array
+    """
+    profiles = []
+    for path in sorted(glob.glob(os.path.join(glob.escape(directory), '*' + profileExtension))):
+        stat = os.stat(path)
+        try:
+            Av, eAbundance = parseAbundanceProfile(path)
+        except ValueError:
+            Av, eAbundance = None, None
+        profiles.append((os.path.basename(path), stat.st_size, stat.st_mtime_ns, Av, eAbundance))
+
+    numLayers = max([len(profile[3]) for profile in profiles if profile[3] is not None], default=0)
+    nameLength = max([len(profile[0]) for profile in profiles], default=1)
+    store = np.zeros(len(profiles), dtype=[('name', 'U{}'.format(nameLength)), ('size', np.int64),
+                                           ('mtime', np.int64), ('numLayers', np.int64),
+                                           ('Av', np.float64, (numLayers,)), ('eAbundance', np.float64, (numLayers,))])
+    store['Av'] = np.nan
+    store['eAbundance'] = np.nan
+    for row, (name, size, mtime, Av, eAbundance) in zip(store, profiles):
+        row['name'], row['size'], row['mtime'] = name, size, mtime
+        if Av is None:
+            row['numLayers'] = -1
+        else:
+            row['numLayers'] = len(Av)
+            row['Av'][:len(Av)] = Av
+            row['eAbundance'][:len(Av)] = eAbundance
+    return store
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+@lru_cache(maxsize=16)
+def loadProfileStore(directory, rebuild=False):
+    """
+    Loads the binary file of the profiles of a directory, building it first if the directory has none (or if asked to).
+    If the file cannot be written (eg the data directory is read only) the profiles are parsed in memory instead.
+    :param directory: Path to the parameter directory
+    :param rebuild: If True, the file is rebuilt from the profiles
+    :return: Structured array from buildProfileStore (memory mapped when read from the file) and a dictionary of
+             profile name: row
+    """
+    storePath = os.path.join(directory, storeFileName)
+    store = None
+    if not rebuild and os.path.isfile(storePath):
+        try:
+            store = np.load(storePath, mmap_mode='r')
+        except (OSError, ValueError):
+            store = None
+    if store is None:
+        store = buildProfileStore(directory)
+        try:
+            tempPath = '{}.{}.tmp'.format(storePath, os.getpid())
+            with open(tempPath, 'wb') as f:
+                np.save(f, store)
+            os.replace(tempPath, storePath)
+            store = np.load(storePath, mmap_mode='r')
+        except OSError:
+            pass
+    return store, {str(name): row for row, name in enumerate(store['name'])}
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+@lru_cache(maxsize=1024)
+def cachedAbundanceProfile(AvAbundancePath, size, mtime):
+    """
+    Reads a profile through the store of its parameter directory.  The arguments key the in-memory cache.
+    :param AvAbundancePath: Absolute path to the profile
+    :param size: Size of the profile file
+    :param mtime: Modification time of the profile file (ns)
+    :return: Av, eAbundance (read-only arrays)
+    """
+    directory, name = os.path.split(AvAbundancePath)
+    store, rows = loadProfileStore(directory)
+    if name not in rows or store[rows[name]]['size'] != size or store[rows[name]]['mtime'] != mtime:
+        # The profile was added or modified since the store was built
+        loadProfileStore.cache_clear()
+        store, rows = loadProfileStore(directory, rebuild=True)
+        loadProfileStore.cache_clear()
+
+    if name in rows and store[rows[name]]['numLayers'] >= 0:
+        profile = store[rows[name]]
+        Av = np.array(profile['Av'][:profile['numLayers']])
+        eAbundance = np.array(profile['eAbundance'][:profile['numLayers']])
+    else:
+        Av, eAbundance = parseAbundanceProfile(AvAbundancePath)
+    Av.setflags(write=False)
+    eAbundance.setflags(write=False)
+    return Av, eAbundance
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def readAbundanceProfile(AvAbundancePath):
+    """
+    Reads a profile produced by chemical evolution code
+    :param AvAbundancePath: Path to the profile
+    :return: Av: Extinction of each layer
+             eAbundance: Electron abundance of each layer
+             The arrays are shared by every caller and are read-only; copy them before modifying them
+    """
+    if not os.path.isfile(AvAbundancePath):
+        raise FileNotFoundError('{} not found.'.format(AvAbundancePath))
+    if not AvAbundancePath.endswith(profileExtension):
+        return parseAbundanceProfile(AvAbundancePath)
+
+    stat = os.stat(AvAbundancePath)
+    return cachedAbundanceProfile(os.path.abspath(AvAbundancePath), stat.st_size, stat.st_mtime_ns)
+# -------- FUNCTION DEFINITION. --------
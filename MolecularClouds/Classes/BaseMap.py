@@ -0,0 +1,243 @@
+"""
+This file contains the class which renders the styled background of the maps of the stages (the fits image of the region
+of interest with its RA/Dec grid, galactic overlay and colour bar) once, so that each map only draws its own points.
+    - The background is rendered to an image (raster) together with the position of its axes, and cached in memory and
+    in the output directory of the region, keyed by the fits file, the region, the style (figure size, resolution,
+    filled background) and this file.  Later maps, stages and reruns reuse the cached background.
+    - A map draws the background image across its figure and gives a transparent axes placed exactly over the axes of
+    the background, in the pixel coordinates of the full fits image, on which its points are drawn
+    - As the background is an image, it can not be panned or zoomed when the map is shown
+"""
+import os
+import glob
+import math
+import hashlib
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.transforms import Bbox
+from .FitsLoader import FitsLoader
+from .util import fileSignature
+from . import config
+
+# Backgrounds rendered (or loaded) in this process, by key
+renderedMaps = {}
+
+
+# -------- FUNCTION DEFINITION --------
+def drawMapImage(fig, regionOfInterest, fillBackground=False):
+    """
+    Draws the fits image of the region of interest
+    :param fig: Figure to draw on
+    :param regionOfInterest: Region of interest (RegionOfInterest.Region)
+    :param fillBackground: If True, the axes outside the image are filled with the lowest colour of the colour map
+    :return: ax, im: The axes of the map, whose pixel coordinates are those of the full fits image, and the image
+    """
+    # Only the region of interest (plus a margin) is read; pixel coordinates still refer to the full fits image
+    with FitsLoader(regionOfInterest.fitsFilePath, regionOfInterest.xmin, regionOfInterest.xmax,
+                    regionOfInterest.ymin, regionOfInterest.ymax) as fitsData:
+        ax = fig.add_subplot(111, projection=fitsData.fullWCS)
+
+        colourMap = plt.get_cmap('BrBG')
+        if fillBackground:
+            ax.patch.set_facecolor(colourMap(-1))
+        im = ax.imshow(fitsData.data, origin='lower', cmap=colourMap, interpolation='nearest',
+                       extent=fitsData.extent())
+    return ax, im
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def styleMap(fig, ax, im, regionOfInterest):
+    """
+    Limits a map to the region of interest and styles its RA/Dec grid, galactic overlay and colour bar
+    :param fig: Figure of the map
+    :param ax: Axes of the map (from drawMapImage)
+    :param im: Image of the map (from drawMapImage)
+    :param regionOfInterest: Region of interest (RegionOfInterest.Region)
+    """
+    # ---- Style the main axes and their grid
+    if not math.isnan(regionOfInterest.xmax) and not math.isnan(regionOfInterest.xmin):
+        ax.set_xlim(regionOfInterest.xmin, regionOfInterest.xmax)
+    if not math.isnan(regionOfInterest.ymax) and not math.isnan(regionOfInterest.ymin):
+        ax.set_ylim(regionOfInterest.ymin, regionOfInterest.ymax)
+
+    ra = ax.coords[0]
+    dec = ax.coords[1]
+    ra.set_major_formatter('d')
+    dec.set_major_formatter('d')
+    ra.set_axislabel('RA (degree)')
+    dec.set_axislabel('Dec (degree)')
+
+    dec.set_ticks(number=10)
+    ra.set_ticks(number=20)
+    ra.display_minor_ticks(True)
+    dec.display_minor_ticks(True)
+    ra.set_minor_frequency(10)
+
+    ra.grid(color='black', alpha=0.5, linestyle='solid')
+    dec.grid(color='black', alpha=0.5, linestyle='solid')
+    # ---- Style the main axes and their grid.
+
+    # ---- Style the overlay and its grid
+    overlay = ax.get_coords_overlay('galactic')
+
+    overlay[0].set_axislabel('Longitude')
+    overlay[1].set_axislabel('Latitude')
+
+    overlay[0].set_ticks(color='grey', number=20)
+    overlay[1].set_ticks(color='grey', number=20)
+
+    overlay.grid(color='grey', linestyle='solid', alpha=0.7)
+    # ---- Style the overlay and its grid.
+
+    # ---- Style the colour bar
+    if regionOfInterest.fitsDataType == 'HydrogenColumnDensity':
+        cb = fig.colorbar(im, ax=ax, ticklocation='right', fraction=0.02, pad=0.145, format='%.0e')
+        cb.ax.set_title('Hydrogen Column Density', linespacing=0.5, fontsize=12)
+    elif regionOfInterest.fitsDataType == 'VisualExtinction':
+        cb = fig.colorbar(im, ax=ax, ticklocation='right', fraction=0.02, pad=0.145)
+        cb.ax.set_title(' A' + r'$_V$', linespacing=0.5, fontsize=12)
+    # ---- Style the colour bar.
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def regionKey(regionOfInterest):
+    """
+    Gives a key which changes whenever the fits file, the region of interest or the way backgrounds are drawn change
+    :param regionOfInterest: Region of interest (RegionOfInterest.Region)
+    :return: Hexadecimal string
+    """
+    settings = [fileSignature(regionOfInterest.fitsFilePath), regionOfInterest.fitsDataType,
+                regionOfInterest.xmin, regionOfInterest.xmax, regionOfInterest.ymin, regionOfInterest.ymax,
+                config.cropMargin, fileSignature(os.path.abspath(__file__)), matplotlib.__version__]
+    return hashlib.sha1(repr(settings).encode()).hexdigest()[:16]
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- CLASS DEFINITION --------
+class BaseMap:
+    def __init__(self, regionOfInterest, figsize, dpi, fillBackground=False, cacheDir='none'):
+        """
+        Gives the styled background of the maps of the region of interest, rendering it only if it is not cached
+
+        :param regionOfInterest: Region of interest (RegionOfInterest.Region)
+        :param figsize: Size of the figure (width, height) in inches
+        :param dpi: Resolution of the figure in dots per inch
+        :param fillBackground: If True, the axes outside the image are filled with the lowest colour of the colour map
+        :param cacheDir: Directory in which backgrounds are cached. If 'none', only the memory of this process is used
+
+        Attributes:
+            raster: Image (RGBA) of the whole background figure
+            axesPosition: Position (left, bottom, width, height) of the axes of the map, as fractions of the figure
+            imageLimits: Limits (xmin, xmax, ymin, ymax) of the fits image which is drawn, in pixels of the full image
+            mapLimits: Limits (xmin, xmax, ymin, ymax) of the map (the region of interest)
+            tightBbox: Bounds (x0, y0, x1, y1) in inches of what is drawn on the background figure
+        """
+        key = regionKey(regionOfInterest)
+        styleKey = hashlib.sha1(repr([tuple(figsize), dpi, fillBackground]).encode()).hexdigest()[:8]
+        if (key, styleKey) in renderedMaps:
+            self.__dict__.update(renderedMaps[(key, styleKey)].__dict__)
+            return
+        cachePath = os.path.join(cacheDir, 'BaseMap_{}_{}.npz'.format(key, styleKey))
+
+        # -------- LOAD THE BACKGROUND FROM THE CACHE --------
+        if cacheDir != 'none' and os.path.isfile(cachePath):
+            try:
+                with np.load(cachePath) as cached:
+                    self.raster = cached['raster']
+                    self.axesPosition = tuple(cached['axesPosition'])
+                    self.imageLimits = tuple(cached['imageLimits'])
+                    self.mapLimits = tuple(cached['mapLimits'])
+                    self.tightBbox = tuple(cached['tightBbox'])
+                renderedMaps[(key, styleKey)] = self
+                return
+            except (OSError, ValueError, KeyError):
+                pass
+        # -------- LOAD THE BACKGROUND FROM THE CACHE. --------
+
+        # -------- RENDER THE BACKGROUND --------
+        # The figure is not made with pyplot, so it is never shown
+        fig = Figure(figsize=figsize, dpi=dpi, facecolor='w', edgecolor='k')
+        canvas = FigureCanvasAgg(fig)
+        ax, im = drawMapImage(fig, regionOfInterest, fillBackground)
+        self.imageLimits = ax.get_xlim() + ax.get_ylim()
+        styleMap(fig, ax, im, regionOfInterest)
+        self.mapLimits = ax.get_xlim() + ax.get_ylim()
+
+        canvas.draw()
+        self.raster = np.array(canvas.buffer_rgba())
+        self.axesPosition = tuple(ax.get_position().bounds)
+        self.tightBbox = tuple(fig.get_tightbbox(canvas.get_renderer()).extents)
+        renderedMaps[(key, styleKey)] = self
+        # -------- RENDER THE BACKGROUND. --------
+
+        # -------- SAVE THE BACKGROUND TO THE CACHE --------
+        if cacheDir != 'none':
+            try:
+                # Backgrounds of an older fits file or region are stale; other processes (eg in BatchRun.py) may be
+                # removing them or writing a background at the same time, so each process writes to its own file
+                for stalePath in glob.glob(os.path.join(cacheDir, 'BaseMap_*.npz')):
+                    if not os.path.basename(stalePath).startswith('BaseMap_{}_'.format(key)):
+                        try:
+                            os.remove(stalePath)
+                        except FileNotFoundError:
+                            pass  # Already removed by another process
+                tempPath = '{}.{}.tmp'.format(cachePath, os.getpid())
+                with open(tempPath, 'wb') as f:
+                    np.savez_compressed(f, raster=self.raster, axesPosition=self.axesPosition,
+                                        imageLimits=self.imageLimits, mapLimits=self.mapLimits,
+                                        tightBbox=self.tightBbox)
+                os.replace(tempPath, cachePath)
+            except OSError:
+                pass  # eg the output directory is read only; the background is then rendered again when needed
+        # -------- SAVE THE BACKGROUND TO THE CACHE. --------
+
+    def draw(self, fig):
+        """
+        Draws the background on a figure of the same size and resolution, and gives the axes to draw the points on.
+        The axes are limited to the whole fits image, so labels can be placed before the map is limited (see limit).
+        :param fig: Figure to draw on
+        :return: Axes over the map, whose pixel coordinates are those of the full fits image
+        """
+        background = fig.add_axes([0, 0, 1, 1])
+        background.imshow(self.raster, interpolation='nearest', aspect='auto')
+        background.set_axis_off()
+        background.set_in_layout(False)
+        background.set_navigate(False)
+
+        ax = fig.add_axes(self.axesPosition)
+        ax.set_axis_off()
+        ax.set_navigate(False)
+        ax.set_xlim(self.imageLimits[:2])
+        ax.set_ylim(self.imageLimits[2:])
+        return ax
+
+    def limit(self, ax):
+        """
+        Limits the axes given by draw to the map
+        :param ax: Axes over the map (from draw)
+        """
+        ax.set_xlim(self.mapLimits[:2])
+        ax.set_ylim(self.mapLimits[2:])
+
+    def save(self, fig, ax, saveFigurePath, tight=False):
+        """
+        Saves a figure drawn on the background
+        :param fig: Figure of the map
+        :param ax: Axes over the map (from draw)
+        :param saveFigurePath: Path the figure is saved to
+        :param tight: If True, the figure is cropped to what is drawn on it, as with bbox_inches='tight'
+        """
+        if tight:
+            # The background image covers the whole figure, so only the background and the axes over it are counted
+            axesBbox = ax.get_tightbbox(fig.canvas.get_renderer()).transformed(fig.dpi_scale_trans.inverted())
+            bbox = Bbox.union([Bbox.from_extents(*self.tightBbox), axesBbox])
+            fig.savefig(saveFigurePath, bbox_inches=bbox.padded(plt.rcParams['savefig.pad_inches']))
+        else:
+            fig.savefig(saveFigurePath)
+
+# -------- CLASS DEFINITION. --------
@@ -1,9 +1,10 @@
 """
-This file contains the class to calculate BLOS values.
+This file contains the class and functions to calculate BLOS values.
 
 """
 import pandas as pd
 import numpy as np
+from .AbundanceProfiles import readAbundanceProfile
 from . import config
 
 
@@ -15,197 +16,306 @@ class CalculateB:
         and calculates BLOS
 
         :param AvAbundancePath:  Path to extinction data produced by chemical evolution code
-        :param ExtincRMPath: Path to matched extinction and rotation measure data (produced in stage 02)
+        :param ExtincRMPath: Path to matched extinction and rotation measure data (produced in stage 02), or the table
+                             (pandas dataframe) read from it. The table is not modified.
         :param RefPointTable: Table (pandas dataframe)  of potential reference points
         :param saveFilePath: Path to which output is saved
         """
 
-        conversionFactor = config.VExtinct_2_Hcol  # to convert extinction to H column density
-        pcTocm = config.pcTocm
-
-        # -------- LOAD REFERENCE POINTS --------
-        refData = RefPointTable
-        # -------- LOAD REFERENCE POINTS. --------
-
-        # -------- LOAD MATCHED RM AND EXTINCTION DATA
-        AllMatchedRMExtinctionData = pd.read_csv(ExtincRMPath, sep='\t')
-        # -------- LOAD MATCHED RM AND EXTINCTION DATA.
-
-        # -------- LOAD ABUNDANCE DATA
-        Av, eAbundance = np.loadtxt(AvAbundancePath, usecols=(1, 2), unpack=True, skiprows=2)
-        # -------- LOAD ABUNDANCE DATA.
-
         # -------- FIND FIDUCIAL REFERENCE VALUES --------
-        self.fiducialRM = np.mean(refData['Rotation_Measure(rad/m2)'])
-        self.fiducialRMAvgErr = np.mean(refData['RM_Err(rad/m2)'])
-        # Standard error of the sampled mean:
-        self.fiducialRMStd = np.std(refData['Rotation_Measure(rad/m2)'], ddof=1) / np.sqrt(
-            len(refData['Rotation_Measure(rad/m2)']))
-        self.fiducialExtinction = np.mean(refData['Extinction_Value'])
+        self.fiducialRM, self.fiducialRMAvgErr, self.fiducialRMStd, self.fiducialExtinction = \
+            fiducialValues(RefPointTable)
         # -------- FIND FIDUCIAL REFERENCE VALUES. --------
 
-        # -------- REMOVE REFERENCE POINTS FROM THE MATCHED RM AND EXTINCTION DATA --------
-        # The rm points used as reference points should not be used to calculate BLOS
-        ind = refData['ID#']  # Indices of the reference points
-        RMExtinctionData = AllMatchedRMExtinctionData.copy().drop(ind).reset_index(drop=True)
-        # -------- REMOVE REFERENCE POINTS FROM THE MATCHED RM AND EXTINCTION DATA. --------
-
-        # -------- CREATE BLOS TABLE --------
-        cols = ['ID#', 'Ra(deg)', 'Dec(deg)', 'RM_Raw_Value', 'RM_Raw_Err', 'Scaled_RM', 'TotalRMScaledErrWithStDev',
-                'TotalRMScaledErrWithAvgErr', 'Extinction', 'Scaled_Extinction', 'eAbundance',
-                'BScaled_RM_ERR_with_0.05Uncty&StDev', 'BScaled_RM_ERR_with_0.05Uncty',
-                'Raw_Magnetic_FieldMagnetic_Field(uG)', 'Magnetic_Field(uG)',
-                'Reference_BField_RMErr(\u00B1)', 'BField_of_Min_Extinction', 'BField_of_Max_Extinction']
-        self.BLOSData = pd.DataFrame(columns=cols)
-        # -------- CREATE BLOS TABLE. --------
-
-        # -------- ADD TO BLOS TABLE --------
-        self.BLOSData['Ra(deg)'] = RMExtinctionData['Ra(deg)']
-        self.BLOSData['Dec(deg)'] = RMExtinctionData['Dec(deg)']
-        self.BLOSData['ID#'] = RMExtinctionData[
-            'ID#']  # Want to keep track of the 'original' index as well
-        self.BLOSData['RM_Raw_Value'] = RMExtinctionData['Rotation_Measure(rad/m2)']
-        self.BLOSData['RM_Raw_Err'] = RMExtinctionData['RM_Err(rad/m2)']
-        self.BLOSData['Extinction'] = RMExtinctionData['Extinction_Value']
-        # -------- ADD TO BLOS TABLE. --------
-
-        # -------- SCALE THE RM AND EXTINCTION DATA --------
-        self.BLOSData['Scaled_RM'] = RMExtinctionData['Rotation_Measure(rad/m2)'] - self.fiducialRM
-
-        self.BLOSData['Scaled_Extinction'] = RMExtinctionData['Extinction_Value'] - self.fiducialExtinction
-        Scaled_Min_Extinction_Value = RMExtinctionData['Min_Extinction_Value'] - self.fiducialExtinction
-        Scaled_Max_Extinction_Value = RMExtinctionData['Max_Extinction_Value'] - self.fiducialExtinction
-        # -------- SCALE THE RM AND EXTINCTION DATA. --------
-
-        # -------- CALCULATE THE RM ERROR --------
-        self.BLOSData['TotalRMScaledErrWithStDev'] = RMExtinctionData['RM_Err(rad/m2)'] + self.fiducialRMStd
-        self.BLOSData['TotalRMScaledErrWithAvgErr'] = RMExtinctionData['RM_Err(rad/m2)'] + self.fiducialRMAvgErr
-        # -------- CALCULATE THE RM ERROR. --------
-
-        # -------- FIND THE LAYER OF INTEREST --------
-        eAbundanceMatched = []
-        indLayerOfInterest = []
-        indLayerOfInterest_MinExt = []
-        indLayerOfInterest_MaxExt = []
-
-        # For each BLOS point:
-        for i in range(0, len(self.BLOSData['Scaled_Extinction'])):
-            '''We want to find the layer that is closest in value and greater than the half the scaled 
-             extinction value. Since Av is a list ordered from least to greatest, this corresponds to the first location 
-             where Av is greater than half the scaled extinction value 
-            '''
-
-            ind = np.where(Av >= self.BLOSData['Scaled_Extinction'][i] / 2)[0][0]
-
-            indLayerOfInterest.append(ind)
-            eAbundanceMatched.append(eAbundance[ind])
-
-            indMin = np.where(Av >= Scaled_Min_Extinction_Value[i] / 2)[0][0]
-            indLayerOfInterest_MinExt.append(indMin)
-
-            indMax = np.where(Av >= Scaled_Max_Extinction_Value[i] / 2)[0][0]
-            indLayerOfInterest_MaxExt.append(indMax)
-
-        self.BLOSData['eAbundance'] = eAbundanceMatched
-        # -------- FIND THE LAYER OF INTEREST. --------
-
-        # -------- CALCULATE THE TOTAL ELECTRON COLUMN DENSITY --------
-        LayerNe = []
-        LayerNeMinExt = []
-        LayerNeMaxExt = []
-
-        # -------- Matched Extinction Value
-        # For each BLOS point:
-        for i, val in enumerate(indLayerOfInterest):
-            # Temporary value
-            tempSumAvSubXe = 0
-            if val != 0:
-                for index3 in range(1, val):
-                    tempSumAvSubXe = tempSumAvSubXe + ((Av[index3] - Av[index3 - 1]) * eAbundance[index3])
-                # Interpolate:
-                xp = [Av[val], Av[val - 1]]
-                fp = [eAbundance[val], eAbundance[val - 1]]
-                interpAv = (self.BLOSData['Scaled_Extinction'][i] / 2)
-                interpEAbund = np.interp(interpAv, xp, fp)
-                tempSumAvSubXe = tempSumAvSubXe + ((Av[0]) * eAbundance[0]) + (interpAv - Av[val - 1]) * interpEAbund
-            else:
-                tempSumAvSubXe = tempSumAvSubXe + ((Av[0]) * eAbundance[0])
-            LayerNe.append(tempSumAvSubXe * conversionFactor)
-        # -------- Matched Extinction Value.
-
-        # -------- Minimum Extinction Value
-        # For each BLOS point:
-        for i, val in enumerate(indLayerOfInterest_MinExt):
-            # Temporary value
-            tempSumAvSubXe = 0
-            if val != 0:
-                for index3 in range(1, val):
-                    tempSumAvSubXe = tempSumAvSubXe + ((Av[index3] - Av[index3 - 1]) * eAbundance[index3])
-                # Interpolate:
-                xp = [Av[val], Av[val - 1]]
-                fp = [eAbundance[val], eAbundance[val - 1]]
-                interpAv = (Scaled_Min_Extinction_Value[i] / 2)
-                interpEAbund = np.interp(interpAv, xp, fp)
-                tempSumAvSubXe = tempSumAvSubXe + ((Av[0]) * eAbundance[0]) + (interpAv - Av[val - 1]) * interpEAbund
-            else:
-                tempSumAvSubXe = tempSumAvSubXe + ((Av[0]) * eAbundance[0])
-            LayerNeMinExt.append(tempSumAvSubXe * conversionFactor)
-        # -------- Minimum Extinction Value.
-
-        # -------- Maximum Extinction Value
-        # For each BLOS point:
-        for i, val in enumerate(indLayerOfInterest_MaxExt):
-            # Temporary value
-            tempSumAvSubXe = 0
-            if val != 0:
-                for index3 in range(1, val):
-                    tempSumAvSubXe = tempSumAvSubXe + ((Av[index3] - Av[index3 - 1]) * eAbundance[index3])
-                # Interpolate:
-                xp = [Av[val], Av[val - 1]]
-                fp = [eAbundance[val], eAbundance[val - 1]]
-                interpAv = (Scaled_Max_Extinction_Value[i] / 2)
-                interpEAbund = np.interp(interpAv, xp, fp)
-                tempSumAvSubXe = tempSumAvSubXe + ((Av[0]) * eAbundance[0]) + (interpAv - Av[val - 1]) * interpEAbund
-            else:
-                tempSumAvSubXe = tempSumAvSubXe + ((Av[0]) * eAbundance[0])
-            LayerNeMaxExt.append(tempSumAvSubXe * conversionFactor)
-        # -------- Maximum Extinction Value.
-        # -------- CALCULATE THE TOTAL ELECTRON COLUMN DENSITY. -------
-
-        # -------- CALCULATE THE MAGNETIC FIELD --------
-        self.BLOSData['Raw_Magnetic_FieldMagnetic_Field(uG)'] = self.BLOSData['RM_Raw_Value'] / (
-                0.812 * np.array(LayerNe) * pcTocm * 2)
-
-        self.BLOSData['Magnetic_Field(uG)'] = self.BLOSData['Scaled_RM'] / (
-                0.812 * np.array(LayerNe) * pcTocm * 2)
-
-        self.BLOSData['Reference_BField_RMErr(\u00B1)'] = (self.BLOSData['RM_Raw_Err'] / self.BLOSData['RM_Raw_Value']) \
-                                                     * self.BLOSData['Magnetic_Field(uG)']
-
-        self.BLOSData['BField_of_Min_Extinction'] = self.BLOSData['Scaled_RM'] / (0.812 * np.array(LayerNeMinExt) * pcTocm * 2)
-        self.BLOSData['BField_of_Max_Extinction'] = self.BLOSData['Scaled_RM'] / (0.812 * np.array(LayerNeMaxExt) * pcTocm * 2)
-
-        self.BLOSData['BScaled_RM_ERR_with_0.05Uncty&StDev'] = ((0.05 + self.fiducialRMStd)
-                                                           * self.BLOSData['Magnetic_Field(uG)']) / \
-                                                          self.BLOSData['Scaled_RM']
-
-        self.BLOSData['BScaled_RM_ERR_with_0.05Uncty'] = (0.1 * self.BLOSData['Magnetic_Field(uG)']) \
-                                                    / self.BLOSData['Scaled_RM']
-        # -------- CALCULATE THE MAGNETIC FIELD. --------
-        if ZeroNegativeExtinctionEntries:
-            negativeScaledExtinctionIndex = self.BLOSData[self.BLOSData['Scaled_Extinction'] < 0].index.tolist()
-            self.BLOSData.loc[negativeScaledExtinctionIndex, 'Raw_Magnetic_FieldMagnetic_Field(uG)'] = 0
-            self.BLOSData.loc[negativeScaledExtinctionIndex, 'Magnetic_Field(uG)'] = 0
-            self.BLOSData.loc[negativeScaledExtinctionIndex, 'Reference_BField_RMErr(\u00B1)'] = 0
-            self.BLOSData.loc[negativeScaledExtinctionIndex, 'BField_of_Min_Extinction'] = 0
-            self.BLOSData.loc[negativeScaledExtinctionIndex, 'BField_of_Max_Extinction'] = 0
-            self.BLOSData.loc[negativeScaledExtinctionIndex, 'BScaled_RM_ERR_with_0.05Uncty&StDev'] = 0
-            self.BLOSData.loc[negativeScaledExtinctionIndex, 'BScaled_RM_ERR_with_0.05Uncty'] = 0
+        # -------- CALCULATE AND SAVE BLOS --------
+        # The table is built in the same way as for several abundance profiles, with a single profile
+        BLOSTables = calculateBVariants([AvAbundancePath], ExtincRMPath, RefPointTable, [saveFilePath],
+                                        ZeroNegativeExtinctionEntries, DeleteNegativeExtinctionEntries)[1]
+        self.BLOSData = BLOSTables[0]
+        # -------- CALCULATE AND SAVE BLOS. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def readMatchedRMExtinction(ExtincRMPath):
+    """
+    Reads the matched extinction and rotation measure data, unless the table has already been read
+
+    :param ExtincRMPath: Path to matched extinction and rotation measure data (produced in stage 02), or the table
+                             (pandas dataframe) read from it
+    :return: Table (pandas dataframe) of the matched data
+    """
+    if isinstance(ExtincRMPath, pd.DataFrame):
+        return ExtincRMPath
+    return pd.read_csv(ExtincRMPath, sep='\t')
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def fiducialValues(RefPointTable):
+    """
+    Finds the fiducial reference values from the reference points
+
+    :param RefPointTable: Table (pandas dataframe) of the reference points
+    :return: fiducialRM: Mean rotation measure of the reference points
+             fiducialRMAvgErr: Mean rotation measure error of the reference points
+             fiducialRMStd: Standard error of the sampled mean rotation measure
+             fiducialExtinction: Mean extinction of the reference points
+    """
+    fiducialRM = np.mean(RefPointTable['Rotation_Measure(rad/m2)'])
+    fiducialRMAvgErr = np.mean(RefPointTable['RM_Err(rad/m2)'])
+    # Standard error of the sampled mean:
+    fiducialRMStd = np.std(RefPointTable['Rotation_Measure(rad/m2)'], ddof=1) / np.sqrt(
+        len(RefPointTable['Rotation_Measure(rad/m2)']))
+    fiducialExtinction = np.mean(RefPointTable['Extinction_Value'])
+    return fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def cumulativeElectronColumn(Av, eAbundance):
+    """
+    Tabulates the running sum of ΔAv·x_e through the layers of a chemical evolution profile
+
+    :param Av: Extinction of each layer produced by chemical evolution code, ordered from least to greatest.  Several
+               profiles, each with its own Av grid, may be given as the rows of a 2d array
+    :param eAbundance: Electron abundance of each layer.  Several profiles on the same Av grid may be given as the rows
+                       of a 2d array
+    :return: Array whose k-th entry (along the last axis) is the electron column (in units of extinction) integrated up
+             to and including layer k
+    """
+    cumulativeAvXe = np.empty(np.broadcast_shapes(np.shape(Av), np.shape(eAbundance)))
+    cumulativeAvXe[..., 0] = Av[..., 0] * eAbundance[..., 0]
+    cumulativeAvXe[..., 1:] = cumulativeAvXe[..., :1] + np.cumsum(np.diff(Av, axis=-1) * eAbundance[..., 1:], axis=-1)
+    return cumulativeAvXe
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def electronColumnDensity(halfExtinction, Av, eAbundance, cumulativeAvXe):
+    """
+    Finds the layer of interest and the electron column (in units of extinction) for an array of extinction values
+
+    - The layer of interest is the first layer where Av is greater than or equal to the given value
+    - The partial layer between the previous layer and the given value is weighted by the abundance of the previous
+      layer, as done by the original per-point integration
+    - If several profiles on the same Av grid are given (2d eAbundance), the layers are found once and the columns are
+      given for every profile: one row per profile and one column per extinction value (halfExtinction must be 1d)
+
+    :param halfExtinction: Half of the scaled extinction value of each BLOS point
+    :param Av: Extinction of each layer produced by chemical evolution code, ordered from least to greatest
+    :param eAbundance: Electron abundance of each layer (1d), or of each layer of several profiles (2d)
+    :param cumulativeAvXe: Running sum of ΔAv·x_e from cumulativeElectronColumn
+    :return: indLayerOfInterest: Index of the layer of interest for each value
+             column: Electron column (in units of extinction) for each value
+    """
+    halfExtinction = np.asarray(halfExtinction, dtype=float)
+    indLayerOfInterest = np.searchsorted(Av, halfExtinction, side='left')
+    if np.any(indLayerOfInterest >= len(Av)) or np.any(np.isnan(halfExtinction)):
+        raise IndexError('Extinction value is outside the range of the chemical evolution profile')
+
+    indPrevious = np.maximum(indLayerOfInterest - 1, 0)
+    column = cumulativeAvXe[..., indPrevious] + (halfExtinction - Av[indPrevious]) * eAbundance[..., indPrevious]
+    column = np.where(indLayerOfInterest == 0, cumulativeAvXe[..., :1], column)
+    return indLayerOfInterest, column
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def sweepReferencePoints(AvAbundancePath, ExtincRMPath, RefPointTable):
+    """
+    Calculates BLOS as a function of the number of reference points in a single pass.
+
+    - This gives the same values as calling CalculateB with RefPointTable.loc[:num] for every num and collecting the
+      'Magnetic_Field(uG)' column.  Only the fiducial RM and extinction change as a reference point is added, so their
+      running means are computed incrementally and BLOS is evaluated for all reference counts as one array operation.
+    - As in CalculateB, a point is left out (NaN) for a given number of reference points if it is one of the candidate
+      reference points or if its scaled extinction is negative.  Points which are left out with a single reference
+      point are not included in the table.
+
+    :param AvAbundancePath:  Path to extinction data produced by chemical evolution code
+    :param ExtincRMPath: Path to matched extinction and rotation measure data (produced in stage 02), or the table
+                             (pandas dataframe) read from it. The table is not modified.
+    :param RefPointTable: Table (pandas dataframe) of potential reference points, in the order they are added
+    :return: Table (pandas dataframe) of BLOS values.  The rows represent the individual BLOS points (indexed by ID#)
+             and the columns represent the number of reference points ('1', '2', ...)
+    """
+    conversionFactor = config.VExtinct_2_Hcol  # to convert extinction to H column density
+    pcTocm = config.pcTocm
+
+    # -------- LOAD MATCHED RM AND EXTINCTION DATA AND ABUNDANCE DATA --------
+    AllMatchedRMExtinctionData = readMatchedRMExtinction(ExtincRMPath)
+    Av, eAbundance = readAbundanceProfile(AvAbundancePath)
+    cumulativeAvXe = cumulativeElectronColumn(Av, eAbundance)
+    # -------- LOAD MATCHED RM AND EXTINCTION DATA AND ABUNDANCE DATA. --------
+
+    # -------- FIND FIDUCIAL REFERENCE VALUES FOR EVERY NUMBER OF REFERENCE POINTS --------
+    numRefPoints = len(RefPointTable)
+    count = np.arange(1, numRefPoints + 1)
+    fiducialRM = np.cumsum(np.array(RefPointTable['Rotation_Measure(rad/m2)'], dtype=float)) / count
+    fiducialExtinction = np.cumsum(np.array(RefPointTable['Extinction_Value'], dtype=float)) / count
+    # -------- FIND FIDUCIAL REFERENCE VALUES FOR EVERY NUMBER OF REFERENCE POINTS. --------
+
+    # -------- SCALE THE RM AND EXTINCTION DATA --------
+    # Each row corresponds to a number of reference points and each column to a BLOS point
+    RM = np.array(AllMatchedRMExtinctionData['Rotation_Measure(rad/m2)'], dtype=float)
+    Extinction = np.array(AllMatchedRMExtinctionData['Extinction_Value'], dtype=float)
+    ScaledRM = RM[np.newaxis, :] - fiducialRM[:, np.newaxis]
+    ScaledExtinction = Extinction[np.newaxis, :] - fiducialExtinction[:, np.newaxis]
+    # -------- SCALE THE RM AND EXTINCTION DATA. --------
+
+    # -------- CALCULATE THE MAGNETIC FIELD --------
+    LayerNe = electronColumnDensity(ScaledExtinction / 2, Av, eAbundance, cumulativeAvXe)[1] * conversionFactor
+    BLOS = ScaledRM / (0.812 * LayerNe * pcTocm * 2)
+    # -------- CALCULATE THE MAGNETIC FIELD. --------
+
+    # -------- REMOVE REFERENCE POINTS AND NEGATIVE EXTINCTION ENTRIES --------
+    # A point which is the k-th reference point (counting from 0) is a candidate for every number of reference points > k
+    refOrder = np.full(len(AllMatchedRMExtinctionData), numRefPoints)
+    refOrder[np.array(RefPointTable['ID#'], dtype=int)] = np.arange(numRefPoints)
+    isCandidate = refOrder[np.newaxis, :] <= np.arange(numRefPoints)[:, np.newaxis]
+    BLOS[isCandidate | (ScaledExtinction < 0)] = np.nan
+    # -------- REMOVE REFERENCE POINTS AND NEGATIVE EXTINCTION ENTRIES. --------
+
+    AllData = pd.DataFrame(BLOS.T, index=AllMatchedRMExtinctionData['ID#'], columns=[str(num) for num in count])
+    return AllData[~np.isnan(BLOS[0])]
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def calculateBVariants(AvAbundancePaths, ExtincRMPath, RefPointTable, saveFilePaths=None,
+                       ZeroNegativeExtinctionEntries=True, DeleteNegativeExtinctionEntries=True):
+    """
+    Calculates BLOS for several electron abundance profiles (eg. the density and temperature sensitivity variants) in a
+    single pass.
+
+    - CalculateB calls this with a single abundance profile.  The reference points, fiducial values, scaled RM and
+      scaled extinction do not depend on the profile, so they are computed once; the layers of interest are found once
+      for each Av grid shared by the profiles, and BLOS is evaluated for all profiles as one array operation.
+
+    :param AvAbundancePaths: List of paths to extinction data produced by chemical evolution code.  A profile may also
+                             be given as a pair of arrays (Av, eAbundance), eg. from AbundanceInterpolator.evaluate
+    :param ExtincRMPath: Path to matched extinction and rotation measure data (produced in stage 02), or the table
+                             (pandas dataframe) read from it. The table is not modified.
+    :param RefPointTable: Table (pandas dataframe) of potential reference points
+    :param saveFilePaths: List of paths to which the BLOS table of each profile is saved, as by CalculateB. If None,
+                          nothing is saved
+    :return: BLOS: 'Magnetic_Field(uG)' of each profile (rows) and BLOS point (columns), before negative extinction
+                   entries are zeroed or deleted
+             BLOSTables: List of the BLOS table (pandas dataframe) of each profile, as given by CalculateB
+    """
+    conversionFactor = config.VExtinct_2_Hcol  # to convert extinction to H column density
+    pcTocm = config.pcTocm
+    refData = RefPointTable
+
+    # -------- LOAD MATCHED RM AND EXTINCTION DATA --------
+    AllMatchedRMExtinctionData = readMatchedRMExtinction(ExtincRMPath)
+    # -------- LOAD MATCHED RM AND EXTINCTION DATA. --------
+
+    # -------- FIND FIDUCIAL REFERENCE VALUES --------
+    fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction = fiducialValues(refData)
+    # -------- FIND FIDUCIAL REFERENCE VALUES. --------
+
+    # -------- CREATE THE PART OF THE BLOS TABLE SHARED BY ALL PROFILES --------
+    # The rm points used as reference points should not be used to calculate BLOS
+    RMExtinctionData = AllMatchedRMExtinctionData.copy().drop(refData['ID#']).reset_index(drop=True)
+
+    cols = ['ID#', 'Ra(deg)', 'Dec(deg)', 'RM_Raw_Value', 'RM_Raw_Err', 'Scaled_RM', 'TotalRMScaledErrWithStDev',
+            'TotalRMScaledErrWithAvgErr', 'Extinction', 'Scaled_Extinction', 'eAbundance',
+            'BScaled_RM_ERR_with_0.05Uncty&StDev', 'BScaled_RM_ERR_with_0.05Uncty',
+            'Raw_Magnetic_FieldMagnetic_Field(uG)', 'Magnetic_Field(uG)',
+            'Reference_BField_RMErr(\u00B1)', 'BField_of_Min_Extinction', 'BField_of_Max_Extinction']
+    sharedData = pd.DataFrame(columns=cols)
+    sharedData['Ra(deg)'] = RMExtinctionData['Ra(deg)']
+    sharedData['Dec(deg)'] = RMExtinctionData['Dec(deg)']
+    sharedData['ID#'] = RMExtinctionData['ID#']
+    sharedData['RM_Raw_Value'] = RMExtinctionData['Rotation_Measure(rad/m2)']
+    sharedData['RM_Raw_Err'] = RMExtinctionData['RM_Err(rad/m2)']
+    sharedData['Extinction'] = RMExtinctionData['Extinction_Value']
+    sharedData['Scaled_RM'] = RMExtinctionData['Rotation_Measure(rad/m2)'] - fiducialRM
+    sharedData['Scaled_Extinction'] = RMExtinctionData['Extinction_Value'] - fiducialExtinction
+    sharedData['TotalRMScaledErrWithStDev'] = RMExtinctionData['RM_Err(rad/m2)'] + fiducialRMStd
+    sharedData['TotalRMScaledErrWithAvgErr'] = RMExtinctionData['RM_Err(rad/m2)'] + fiducialRMAvgErr
+
+    Scaled_Min_Extinction_Value = RMExtinctionData['Min_Extinction_Value'] - fiducialExtinction
+    Scaled_Max_Extinction_Value = RMExtinctionData['Max_Extinction_Value'] - fiducialExtinction
+    negativeScaledExtinctionIndex = sharedData[sharedData['Scaled_Extinction'] < 0].index.tolist()
+    # -------- CREATE THE PART OF THE BLOS TABLE SHARED BY ALL PROFILES. --------
+
+    # -------- LOAD ABUNDANCE DATA --------
+    # Profiles on the same Av grid are stacked so that their layers of interest are only found once
+    profileGroups = {}
+    for i, AvAbundancePath in enumerate(AvAbundancePaths):
+        if isinstance(AvAbundancePath, str):
+            Av, eAbundance = readAbundanceProfile(AvAbundancePath)
+        else:
+            Av, eAbundance = AvAbundancePath
+        group = profileGroups.setdefault(Av.tobytes(), (Av, [], []))
+        group[1].append(i)
+        group[2].append(eAbundance)
+    # -------- LOAD ABUNDANCE DATA. --------
+
+    # -------- CALCULATE THE ELECTRON COLUMN DENSITY OF EVERY PROFILE --------
+    numPoints = len(sharedData)
+    LayerNe = np.empty((len(AvAbundancePaths), numPoints))
+    LayerNeMinExt = np.empty((len(AvAbundancePaths), numPoints))
+    LayerNeMaxExt = np.empty((len(AvAbundancePaths), numPoints))
+    eAbundanceOfLayer = np.empty((len(AvAbundancePaths), numPoints))
+    for Av, indices, eAbundances in profileGroups.values():
+        eAbundances = np.array(eAbundances)
+        cumulativeAvXe = cumulativeElectronColumn(Av, eAbundances)
+        indLayerOfInterest, LayerNe[indices] = electronColumnDensity(sharedData['Scaled_Extinction'] / 2, Av,
+                                                                     eAbundances, cumulativeAvXe)
+        LayerNeMinExt[indices] = electronColumnDensity(Scaled_Min_Extinction_Value / 2, Av, eAbundances,
+                                                       cumulativeAvXe)[1]
+        LayerNeMaxExt[indices] = electronColumnDensity(Scaled_Max_Extinction_Value / 2, Av, eAbundances,
+                                                       cumulativeAvXe)[1]
+        eAbundanceOfLayer[indices] = eAbundances[:, indLayerOfInterest]
+
+    LayerNe = LayerNe * conversionFactor
+    LayerNeMinExt = LayerNeMinExt * conversionFactor
+    LayerNeMaxExt = LayerNeMaxExt * conversionFactor
+    # -------- CALCULATE THE ELECTRON COLUMN DENSITY OF EVERY PROFILE. --------
+
+    # -------- CALCULATE THE MAGNETIC FIELD OF EVERY PROFILE --------
+    RMRaw = np.array(sharedData['RM_Raw_Value'], dtype=float)
+    RMRawErr = np.array(sharedData['RM_Raw_Err'], dtype=float)
+    ScaledRM = np.array(sharedData['Scaled_RM'], dtype=float)
+
+    RawBLOS = RMRaw / (0.812 * LayerNe * pcTocm * 2)
+    BLOS = ScaledRM / (0.812 * LayerNe * pcTocm * 2)
+    BLOSRMErr = (RMRawErr / RMRaw) * BLOS
+    BLOSMinExt = ScaledRM / (0.812 * LayerNeMinExt * pcTocm * 2)
+    BLOSMaxExt = ScaledRM / (0.812 * LayerNeMaxExt * pcTocm * 2)
+    BLOSErrWithStDev = ((0.05 + fiducialRMStd) * BLOS) / ScaledRM
+    BLOSErr = (0.1 * BLOS) / ScaledRM
+    # -------- CALCULATE THE MAGNETIC FIELD OF EVERY PROFILE. --------
+
+    # -------- CREATE THE BLOS TABLE OF EVERY PROFILE --------
+    BLOSTables = []
+    for i in range(len(AvAbundancePaths)):
+        BLOSData = sharedData.copy()
+        BLOSData['eAbundance'] = eAbundanceOfLayer[i]
+        BLOSData['Raw_Magnetic_FieldMagnetic_Field(uG)'] = RawBLOS[i]
+        BLOSData['Magnetic_Field(uG)'] = BLOS[i]
+        BLOSData['Reference_BField_RMErr(\u00B1)'] = BLOSRMErr[i]
+        BLOSData['BField_of_Min_Extinction'] = BLOSMinExt[i]
+        BLOSData['BField_of_Max_Extinction'] = BLOSMaxExt[i]
+        BLOSData['BScaled_RM_ERR_with_0.05Uncty&StDev'] = BLOSErrWithStDev[i]
+        BLOSData['BScaled_RM_ERR_with_0.05Uncty'] = BLOSErr[i]
 
+        if ZeroNegativeExtinctionEntries:
+            BLOSData.loc[negativeScaledExtinctionIndex, ['Raw_Magnetic_FieldMagnetic_Field(uG)', 'Magnetic_Field(uG)',
+                                                         'Reference_BField_RMErr(\u00B1)', 'BField_of_Min_Extinction',
+                                                         'BField_of_Max_Extinction',
+                                                         'BScaled_RM_ERR_with_0.05Uncty&StDev',
+                                                         'BScaled_RM_ERR_with_0.05Uncty']] = 0
         if DeleteNegativeExtinctionEntries:
-            negativeScaledExtinctionIndex = self.BLOSData[self.BLOSData['Scaled_Extinction'] < 0].index.tolist()
-            self.BLOSData.drop(negativeScaledExtinctionIndex, inplace = True)
-        # -------- SAVE BLOS DATA --------
-        if saveFilePath != 'none':
-            self.BLOSData.to_csv(saveFilePath, index=False, sep='\t')
-        # -------- SAVE BLOS DATA. --------
+            BLOSData.drop(negativeScaledExtinctionIndex, inplace=True)
+
+        if saveFilePaths is not None and saveFilePaths[i] != 'none':
+            BLOSData.to_csv(saveFilePaths[i], index=False, sep='\t')
+        BLOSTables.append(BLOSData)
+    # -------- CREATE THE BLOS TABLE OF EVERY PROFILE. --------
+
+    return BLOS, BLOSTables
+# -------- FUNCTION DEFINITION. --------
@@ -20,7 +20,8 @@ def dec_dms2deg(dec_d, dec_m, dec_s):
     :param dec_s: arcsecond component of declination
     :return: Declination in degrees
     """
-    return (np.array(abs(dec_d)) + np.array(abs(dec_m))/60 + np.array(abs(dec_s))/3600) * np.sign(dec_d)
+    # copysign keeps the sign of declinations between -1 and 0 degrees, which are written with a degree of -00
+    return (np.abs(dec_d) + np.abs(dec_m)/60 + np.abs(dec_s)/3600) * np.copysign(1, dec_d)
 
 
 def ra_deg2hms(ra_deg):
@@ -60,10 +61,13 @@ def dec_deg2dms(dec_deg):
 
 
 def RADec2xy(RA, Dec, wcs):
-    xCoords = []
-    yCoords = []
-    for i in range(len(RA)):
-        pixelRow, pixelColumn = wcs.wcs_world2pix(RA[i], Dec[i], 0)
-        xCoords.append(pixelRow)
-        yCoords.append(pixelColumn)
+    """
+     This function converts right ascensions and declinations to pixel coordinates with a single call to the WCS
+    :param RA: Right ascension(s) in degrees
+    :param Dec: Declination(s) in degrees
+    :param wcs: World coordinate system of the fits file
+    :return xCoords: x pixel coordinate(s)
+    :return yCoords: y pixel coordinate(s)
+    """
+    xCoords, yCoords = wcs.wcs_world2pix(np.asarray(RA, dtype=float), np.asarray(Dec, dtype=float), 0)
     return xCoords, yCoords
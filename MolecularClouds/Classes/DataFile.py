@@ -3,10 +3,28 @@ This file contains the class definition needed to read rotation measure data fro
 catalogue
 
 -  Use of the SkyCoord package to convert coordinates may increase runtime. Conversions may be attempted with the
-    SkyCoord package if desired.  Code to accomplish this is left in comments throughout the file
+    SkyCoord package if desired.  Code to accomplish this is left in comments throughout the file (SkyCoord is then
+    imported from astropy.coordinates; it is not imported otherwise as it is slow to import)
+-  The catalogue is read column by column; coordinates are converted and the region of interest is selected with
+    array operations rather than row by row
+-  The first time a catalogue is read, it is converted to a binary cache next to the catalogue file (sorted by
+    declination) which is memory mapped in later runs, so only the declination band of the region is read from disk.
+    The cache is rebuilt whenever the catalogue file or the conversion of its coordinates changes.
 """
+import os
+import glob
+import hashlib
 import numpy as np
-from astropy.coordinates import SkyCoord
+import pandas as pd
+from . import ConversionLibrary as cl
+from .util import fileSignature
+
+# Columns of the Taylor et al. (2009) catalogue which are read, and their positions when the file is split on whitespace
+# (the +/- signs between values and their errors are separate entries)
+catalogueColumns = ('raHours', 'raMins', 'raSecs', 'raErrSecs', 'decDegs', 'decArcmins', 'decArcsecs', 'decErrArcsecs',
+                    'longitudeDegs', 'latitudeDegs', 'nvssStokesIs', 'stokesIErrs', 'AvePeakPIs', 'PIErrs',
+                    'polarizationPercets', 'mErrPercents', 'rotationMeasures', 'RMErrs')
+catalogueColumnIndices = (0, 1, 2, 4, 5, 6, 7, 9, 10, 11, 12, 14, 15, 17, 18, 20, 21, 23)
 
 
 # -------- FUNCTION DEFINITION --------
@@ -45,6 +63,96 @@ def dec_dms2deg(dec_d, dec_m, dec_s):
 # -------- FUNCTION DEFINITION. --------
 
 
+# -------- FUNCTION DEFINITION --------
+def readRMCatalogue(filename):
+    """
+    Reads a rotation measure catalogue in the format of the Taylor et al. (2009) catalogue into a table, one column per
+    quantity, and adds the right ascension and declination of every source in degrees
+
+    :param filename: Path to the file containing the rotation measure data (eg the Taylor et al (2009) catalogue)
+    :return: Table (pandas dataframe) with the columns in catalogueColumns as well as 'raDeg' and 'decDeg'
+    """
+    columns = np.loadtxt(filename, usecols=catalogueColumnIndices, unpack=True, ndmin=2)
+    catalogue = pd.DataFrame(dict(zip(catalogueColumns, columns)))
+
+    catalogue['raDeg'] = cl.ra_hms2deg(catalogue['raHours'], catalogue['raMins'], catalogue['raSecs'])
+    catalogue['decDeg'] = cl.dec_dms2deg(catalogue['decDegs'], catalogue['decArcmins'], catalogue['decArcsecs'])
+    return catalogue
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def loadRMCatalogue(filename):
+    """
+    Loads the binary cache of a rotation measure catalogue, building it first if the catalogue has no up to date cache.
+
+    - The cache is a structured array with the columns in catalogueColumns, 'raDeg', 'decDeg' and 'catalogueIndex'
+      (the row of the source in the catalogue file), sorted by declination.  It is saved as
+      <catalogue file>.<signature>.npy where the signature changes whenever the catalogue file, or the code which
+      converts its coordinates (this file and ConversionLibrary.py), changes.
+    - If the cache cannot be written (eg the data directory is read only) the catalogue is parsed in memory instead.
+
+    :param filename: Path to the file containing the rotation measure data (eg the Taylor et al (2009) catalogue)
+    :return: Structured array (memory mapped when read from the cache), sorted by declination
+    """
+    signature = hashlib.sha1(repr([fileSignature(filename), fileSignature(os.path.abspath(__file__)),
+                                   fileSignature(os.path.abspath(cl.__file__))]).encode()).hexdigest()[:16]
+    cachePath = '{}.{}.npy'.format(filename, signature)
+    try:
+        return np.load(cachePath, mmap_mode='r')
+    except (OSError, ValueError):
+        pass  # No cache yet, or it is being replaced by another process
+
+    catalogue = readRMCatalogue(filename)
+    catalogue['catalogueIndex'] = np.arange(len(catalogue))
+    catalogue = np.asarray(catalogue.sort_values('decDeg', kind='stable').to_records(index=False))
+
+    try:
+        # Remove caches of older versions of the catalogue file; other processes (eg in BatchRun.py) may be writing the
+        # current one at the same time, so it is kept and each process writes to its own temporary file
+        for staleCachePath in glob.glob(glob.escape(filename) + '.*.npy'):
+            if staleCachePath != cachePath:
+                try:
+                    os.remove(staleCachePath)
+                except FileNotFoundError:
+                    pass  # Already removed by another process
+        tempPath = '{}.{}.tmp'.format(cachePath, os.getpid())
+        with open(tempPath, 'wb') as f:
+            np.save(f, catalogue)
+        os.replace(tempPath, cachePath)
+        return np.load(cachePath, mmap_mode='r')
+    except (OSError, ValueError):
+        return catalogue
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def queryRMCatalogue(filename, raDegMin, raDegMax, decDegMin, decDegMax):
+    """
+    Fetches the sources within a box in right ascension and declination.
+
+    - The declination band is found by binary search on the cached catalogue (sorted by declination), so only that band
+      is read from disk; the right ascension limits are then applied to the band.
+
+    :param filename: Path to the file containing the rotation measure data (eg the Taylor et al (2009) catalogue)
+    :param raDegMin: Minimum right ascension in degrees (inclusive)
+    :param raDegMax: Maximum right ascension in degrees (exclusive)
+    :param decDegMin: Minimum declination in degrees (inclusive)
+    :param decDegMax: Maximum declination in degrees (inclusive)
+    :return: Table (pandas dataframe) of the sources within the box, in the order of the catalogue file
+    """
+    catalogue = loadRMCatalogue(filename)
+
+    indFirst = np.searchsorted(catalogue['decDeg'], decDegMin, side='left')
+    indLast = np.searchsorted(catalogue['decDeg'], decDegMax, side='right')
+    band = np.array(catalogue[indFirst:indLast])
+
+    inBox = (raDegMin <= band['raDeg']) & (band['raDeg'] < raDegMax)
+    sources = np.sort(band[inBox], order='catalogueIndex')
+    return pd.DataFrame(sources).drop(columns='catalogueIndex')
+# -------- FUNCTION DEFINITION. --------
+
+
 # -------- CLASS DEFINITION --------
 class DataFile:
     def __init__(self, filename, raHoursMax, raMinsMax, raSecMax, raHoursMin, raMinsMin,
@@ -90,33 +198,6 @@ class DataFile:
         102-105 F4.1   rad/m2   1-sigma error in RM
         """
 
-        raHours, raMins, raSecs, raErrSecs, decDegs, decArcmins, decArcsecs, decErrArcsecs, longitudeDegs, \
-            latitudeDegs, nvssStokesIs, stokesIErrs, AvePeakPIs, PIErrs, polarizationPercets, mErrPercents, \
-            rotationMeasures, RMErrs = np.loadtxt(filename, usecols=(0, 1, 2, 4, 5, 6, 7, 9, 10, 11, 12, 14, 15, 17,
-                                                                     18, 20, 21, 23), unpack=True)
-
-        self.targetRAHours = []  # Hour component of right ascension in hr:min:sec
-        self.targetRAMins = []  # Minute component of right ascension in hr:min:sec
-        self.targetRASecs = []  # Second component of right ascension in hr:min:sec
-        self.targetRaMinsSecs = []
-        self.targetRaHourMinSecToDeg = []
-        self.targetRAErrSecs = []
-        self.targetDecDegs = []  # Degree component of declination in deg:arcmin:arcsec
-        self.targetDecArcMins = []  # Arcminute component of declination in deg:arcmin:arcsec
-        self.targetDecArcSecs = []  # Arcsecond component of declination in deg:arcmin:arcsec
-        self.targetDecErrArcSecs = []
-        self.targetDecDegArcMinSecs = []
-        self.targetLongitudeDegs = []
-        self.targetLatitudeDegs = []
-        self.targetNvssStokesIs = []
-        self.targetStokesIErrs = []
-        self.targetAvePeakPIs = []
-        self.targetPIErrs = []
-        self.targetPolarizationPercets = []
-        self.targetMErrPercents = []
-        self.targetRotationMeasures = []
-        self.targetRMErrs = []
-
         radegMax = ra_hms2deg(raHoursMax, raMinsMax, raSecMax)  # <- If converting manually
         radegMin = ra_hms2deg(raHoursMin, raMinsMin, raSecMin)  # <- If converting manually
 
@@ -132,43 +213,40 @@ class DataFile:
         # -------- MAKE SKYCOORD OBJECTS FOR REGION OF INTEREST.  --------
 
         # -------- EXTRACT INFORMATION FROM THE REGION OF INTEREST --------
-        for index in range(len(raHours)):
-
-            # If converting manually:
-            radeg = ra_hms2deg(raHours[index], raMins[index], raMins[index])  # <- If converting manually
-            decdeg = dec_dms2deg(decDegs[index], decArcmins[index], decArcsecs[index])  # <- If converting manually
-
-            # If using SkyCoord:
-            # ---- Make given coordinate into a SkyCoord object and convert to degrees
-            # ra_hms = str(int(raHours[index])) + 'h' + str(int(raMins[index])) + 'm' + str(raSecs[index]) + 's'
-            # dec_dms = str(int(decDegs[index])) + 'd' + str(int(decArcmins[index])) + 'm' + str(decArcsecs[index]) + 's'
-            # coord = SkyCoord(ra=ra_hms, dec=dec_dms)
-            # radeg = coord.ra.degree
-            # decdeg = coord.dec.degree
-            # ---- Make given coordinate into a SkyCoord object and convert to degrees.
-
-            # If the coordinate is within the region of interest, extract information
-            if radegMin <= radeg < radegMax and decDegMin <= decdeg <= decDegMax:
-                self.targetRAHours.append(raHours[index])
-                self.targetRAMins.append(raMins[index])
-                self.targetRaMinsSecs.append(raMins[index] + ((raSecs[index]) / 60.0))
-                self.targetRaHourMinSecToDeg.append(radeg)
-                self.targetRASecs.append(raSecs[index])
-                self.targetRAErrSecs.append(raErrSecs[index])
-                self.targetDecDegs.append(decDegs[index])
-                self.targetDecArcMins.append(decArcmins[index])
-                self.targetDecArcSecs.append(decArcsecs[index])
-                self.targetDecDegArcMinSecs.append(decdeg)
-                self.targetDecErrArcSecs.append(decErrArcsecs[index])
-                self.targetLongitudeDegs.append(longitudeDegs[index])
-                self.targetLatitudeDegs.append(latitudeDegs[index])
-                self.targetNvssStokesIs.append(nvssStokesIs[index])
-                self.targetStokesIErrs.append(stokesIErrs[index])
-                self.targetAvePeakPIs.append(AvePeakPIs[index])
-                self.targetPIErrs.append(PIErrs[index])
-                self.targetPolarizationPercets.append(polarizationPercets[index])
-                self.targetMErrPercents.append(mErrPercents[index])
-                self.targetRotationMeasures.append(rotationMeasures[index])
-                self.targetRMErrs.append(RMErrs[index])
+        # If using SkyCoord, the coordinates of the catalogue can be converted in readRMCatalogue:
+        # ---- Make the catalogue coordinates into a SkyCoord object and convert to degrees
+        # ra_hms = catalogue['raHours'].astype(int).astype(str) + 'h' + catalogue['raMins'].astype(int).astype(str) \
+        #     + 'm' + catalogue['raSecs'].astype(str) + 's'
+        # dec_dms = catalogue['decDegs'].astype(int).astype(str) + 'd' + \
+        #     catalogue['decArcmins'].astype(int).astype(str) + 'm' + catalogue['decArcsecs'].astype(str) + 's'
+        # coord = SkyCoord(ra=list(ra_hms), dec=list(dec_dms))
+        # catalogue['raDeg'] = coord.ra.degree
+        # catalogue['decDeg'] = coord.dec.degree
+        # ---- Make the catalogue coordinates into a SkyCoord object and convert to degrees.
+
+        # Select the coordinates within the region of interest
+        self.targetData = queryRMCatalogue(filename, radegMin, radegMax, decDegMin, decDegMax)  # Table of all sources in the region of interest
+
+        self.targetRAHours = self.targetData['raHours'].to_numpy()  # Hour component of right ascension in hr:min:sec
+        self.targetRAMins = self.targetData['raMins'].to_numpy()  # Minute component of right ascension in hr:min:sec
+        self.targetRASecs = self.targetData['raSecs'].to_numpy()  # Second component of right ascension in hr:min:sec
+        self.targetRaMinsSecs = (self.targetData['raMins'] + self.targetData['raSecs'] / 60.0).to_numpy()
+        self.targetRaHourMinSecToDeg = self.targetData['raDeg'].to_numpy()
+        self.targetRAErrSecs = self.targetData['raErrSecs'].to_numpy()
+        self.targetDecDegs = self.targetData['decDegs'].to_numpy()  # Degree component of declination in deg:arcmin:arcsec
+        self.targetDecArcMins = self.targetData['decArcmins'].to_numpy()  # Arcminute component of declination in deg:arcmin:arcsec
+        self.targetDecArcSecs = self.targetData['decArcsecs'].to_numpy()  # Arcsecond component of declination in deg:arcmin:arcsec
+        self.targetDecErrArcSecs = self.targetData['decErrArcsecs'].to_numpy()
+        self.targetDecDegArcMinSecs = self.targetData['decDeg'].to_numpy()
+        self.targetLongitudeDegs = self.targetData['longitudeDegs'].to_numpy()
+        self.targetLatitudeDegs = self.targetData['latitudeDegs'].to_numpy()
+        self.targetNvssStokesIs = self.targetData['nvssStokesIs'].to_numpy()
+        self.targetStokesIErrs = self.targetData['stokesIErrs'].to_numpy()
+        self.targetAvePeakPIs = self.targetData['AvePeakPIs'].to_numpy()
+        self.targetPIErrs = self.targetData['PIErrs'].to_numpy()
+        self.targetPolarizationPercets = self.targetData['polarizationPercets'].to_numpy()
+        self.targetMErrPercents = self.targetData['mErrPercents'].to_numpy()
+        self.targetRotationMeasures = self.targetData['rotationMeasures'].to_numpy()
+        self.targetRMErrs = self.targetData['RMErrs'].to_numpy()
         # -------- EXTRACT INFORMATION FROM THE REGION OF INTEREST. --------
 # -------- CLASS DEFINITION. --------
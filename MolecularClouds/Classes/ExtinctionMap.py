@@ -0,0 +1,173 @@
+"""
+This file contains the class to prepare the extinction map of the region of interest.
+    - The fits image is converted to visual extinction if needed, and its bad (negative/no) values within the region of
+    interest are masked and, optionally, interpolated over
+    - Preprocessed maps are cached in the output directory of the region, keyed by the fits file, the region, the
+    settings used and the preprocessing code.  Later stages and reruns load the cached map instead of redoing the
+    interpolation.
+    - A cached map is reused by any request for a part of the image it covers
+    - As with FitsLoader, xOffset and yOffset give the location of the map within the full fits image
+"""
+import os
+import glob
+import math
+import hashlib
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import WCS
+from .FitsLoader import FitsLoader
+from .util import fileSignature, getBoxBounds
+from . import RefJudgeLib as rjl
+from . import config
+
+
+# -------- FUNCTION DEFINITION --------
+def preprocessExtinction(data, fitsDataType, boxXMin, boxXMax, boxYMin, boxYMax):
+    """
+    Converts the data to visual extinction and handles its bad (negative/no) values within the given box.
+    The input data is not modified.
+    :param data: 2d array of the fits image
+    :param fitsDataType: 'HydrogenColumnDensity' or 'VisualExtinction'
+    :param boxXMin: Left x-axis bound of the box in which bad values are handled, in pixels of the data (or nan)
+    :param boxXMax: Right x-axis bound of the box (or nan)
+    :param boxYMin: Bottom y-axis bound of the box (or nan)
+    :param boxYMax: Top y-axis bound of the box (or nan)
+    :return:
+        data: The preprocessed visual extinction map
+        badData: Mask of the points which are bad in the fits image
+    """
+    # If fitsDataType is column density, then convert to visual extinction
+    if fitsDataType == 'HydrogenColumnDensity':
+        data = data / config.VExtinct_2_Hcol
+    else:
+        data = np.array(data)
+
+    #Handle bad data (negative/no values) by interpolation.
+    xmin, xmax, ymin, ymax = getBoxBounds(data, boxXMin, boxXMax, boxYMin, boxYMax)
+
+    data[ymin:ymax, xmin:xmax][data[ymin:ymax, xmin:xmax] < 0] = np.nan
+    badData = np.isnan(data)
+    if config.doInterpExtinct:
+        data[ymin:ymax, xmin:xmax] = rjl.interpBadData(data[ymin:ymax, xmin:xmax], badData[ymin:ymax, xmin:xmax],
+                                                       config.interpEngine, config.interpWindow)
+    return data, badData
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def preprocessingKey(regionOfInterest):
+    """
+    Gives a key which changes whenever the fits file, the region of interest, the preprocessing settings or the
+    preprocessing code (this file and RefJudgeLib.py) change
+    :param regionOfInterest: Region of interest (Region)
+    :return: Hexadecimal string
+    """
+    settings = [fileSignature(regionOfInterest.fitsFilePath), regionOfInterest.fitsDataType,
+                regionOfInterest.xmin, regionOfInterest.xmax, regionOfInterest.ymin, regionOfInterest.ymax,
+                config.VExtinct_2_Hcol, config.doInterpExtinct, config.interpEngine, config.interpWindow,
+                fileSignature(os.path.abspath(__file__)), fileSignature(os.path.abspath(rjl.__file__))]
+    return hashlib.sha1(repr(settings).encode()).hexdigest()[:16]
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def unionBounds(boxMin, boxMax, regionMin, regionMax):
+    """
+    Gives the bounds covering both a box and the region of interest along one axis.  nan means the image edge.
+    :return: lower, upper
+    """
+    if math.isnan(boxMin) or math.isnan(regionMin):
+        lower = math.nan
+    else:
+        lower = min(boxMin, regionMin)
+    if math.isnan(boxMax) or math.isnan(regionMax):
+        upper = math.nan
+    else:
+        upper = max(boxMax, regionMax)
+    return lower, upper
+# -------- FUNCTION DEFINITION --------
+
+
+# -------- CLASS DEFINITION --------
+class ExtinctionMap:
+    def __init__(self, regionOfInterest, xmin=math.nan, xmax=math.nan, ymin=math.nan, ymax=math.nan, margin=None,
+                 cacheDir='none'):
+        """
+        Gives the preprocessed extinction map of the region of interest, covering at least the given pixel box
+
+        :param regionOfInterest: Region of interest (Region)
+        :param xmin: Left x-axis bound of the box needed, in pixels of the full image. If nan, the image edge is used
+        :param xmax: Right x-axis bound of the box needed (exclusive)
+        :param ymin: Bottom y-axis bound of the box needed
+        :param ymax: Top y-axis bound of the box needed (exclusive)
+        :param margin: Number of pixels added on each side of the box. If None, the configured crop margin is used
+        :param cacheDir: Directory in which preprocessed maps are cached. If 'none', no cache is used
+
+        Attributes:
+            data: Visual extinction map
+            badData: Mask of the points of the map whose extinction was not observed
+            wcs: World coordinate system of the map
+            xOffset, yOffset: Location of the map within the full fits image
+            fullShape: Shape of the full fits image
+        """
+        # The map always covers the whole region of interest, so the bad values are handled in the same way whichever
+        # box is requested
+        xmin, xmax = unionBounds(xmin, xmax, regionOfInterest.xmin, regionOfInterest.xmax)
+        ymin, ymax = unionBounds(ymin, ymax, regionOfInterest.ymin, regionOfInterest.ymax)
+        # The cropped image stays readable once the fits file is closed
+        with FitsLoader(regionOfInterest.fitsFilePath, xmin, xmax, ymin, ymax, margin) as fitsData:
+            image, imageWCS = fitsData.data, fitsData.wcs
+            x0, y0 = fitsData.xOffset, fitsData.yOffset
+            x1, y1 = x0 + image.shape[1], y0 + image.shape[0]
+            self.fullShape = fitsData.fullShape
+
+        key = preprocessingKey(regionOfInterest)
+
+        # -------- LOAD THE MAP FROM THE CACHE --------
+        if cacheDir != 'none':
+            for cachePath in glob.glob(os.path.join(cacheDir, 'ExtinctionMap_{}_*.npz'.format(key))):
+                try:
+                    cx0, cx1, cy0, cy1 = [int(item) for item in os.path.basename(cachePath)[:-4].split('_')[2:]]
+                except ValueError:
+                    continue
+                if cx0 <= x0 and x1 <= cx1 and cy0 <= y0 and y1 <= cy1:
+                    try:
+                        with np.load(cachePath) as cached:
+                            self.data = cached['data']
+                            self.badData = cached['badData']
+                            self.wcs = WCS(fits.Header.fromstring(str(cached['wcsHeader'])))
+                        self.xOffset, self.yOffset = cx0, cy0
+                        return
+                    except (OSError, ValueError, KeyError):
+                        continue
+        # -------- LOAD THE MAP FROM THE CACHE. --------
+
+        # -------- PREPROCESS THE MAP --------
+        self.data, self.badData = preprocessExtinction(image, regionOfInterest.fitsDataType,
+                                                       regionOfInterest.xmin - x0, regionOfInterest.xmax - x0,
+                                                       regionOfInterest.ymin - y0, regionOfInterest.ymax - y0)
+        self.wcs = imageWCS
+        self.xOffset, self.yOffset = x0, y0
+        # -------- PREPROCESS THE MAP. --------
+
+        # -------- SAVE THE MAP TO THE CACHE --------
+        if cacheDir != 'none':
+            cachePath = os.path.join(cacheDir, 'ExtinctionMap_{}_{}_{}_{}_{}.npz'.format(key, x0, x1, y0, y1))
+            try:
+                # Maps preprocessed from an older fits file, region, settings or code are stale; other processes (eg
+                # in BatchRun.py) may be removing them or writing a map at the same time, so each process writes to its
+                # own temporary file
+                for stalePath in glob.glob(os.path.join(cacheDir, 'ExtinctionMap_*.npz')):
+                    if not os.path.basename(stalePath).startswith('ExtinctionMap_{}_'.format(key)):
+                        try:
+                            os.remove(stalePath)
+                        except FileNotFoundError:
+                            pass  # Already removed by another process
+                tempPath = '{}.{}.tmp'.format(cachePath, os.getpid())
+                with open(tempPath, 'wb') as f:
+                    np.savez(f, data=self.data, badData=self.badData,
+                             wcsHeader=self.wcs.to_header_string(relax=True))
+                os.replace(tempPath, cachePath)
+            except OSError:
+                pass  # eg the output directory is read only; the map is then preprocessed again when needed
+        # -------- SAVE THE MAP TO THE CACHE. --------
+
+# -------- CLASS DEFINITION. --------
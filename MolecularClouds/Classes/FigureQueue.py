@@ -0,0 +1,94 @@
+"""
+This file contains the functions to render the figures of the stages, either in the stage's own process or in a
+background worker process while the stage carries on with its calculations.
+    - A figure is given as a plotting function (eg. from Figures.py) and its inputs.  The inputs are sent to the worker
+    (pickled), so they should be plain data such as arrays, tables and the region of interest rather than figures or
+    large images; the plotting function reads the fits file itself.
+    - In headless mode ([Figures] Headless in configStartSettings.ini) figures are saved but never shown, and, unless
+    [Figures] Background Rendering is False, they are rendered by a worker process using the Agg backend.  Otherwise they
+    are rendered in this process and shown with plt.show().
+    - waitForFigures waits for the figures sent to the worker to be saved; it is called at the end of each stage which
+    makes figures and before the user is asked a question (so the figures can be reviewed).
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from . import config
+
+# Worker process which renders figures in the background; made when the first figure is sent to it
+executor = None
+# Figures sent to the worker which have not yet been waited for
+pendingFigures = []
+
+
+# -------- FUNCTION DEFINITION --------
+def initWorker(configSnapshot):
+    """
+    Prepares the worker process to render figures without a display
+    """
+    import matplotlib
+    matplotlib.use('Agg')  # Also closes any figures inherited from the parent process
+    config.useSnapshot(configSnapshot)
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def renderInWorker(plotFunction, args, kwargs):
+    """
+    Renders a figure in the worker process
+    """
+    import matplotlib.pyplot as plt
+    try:
+        plotFunction(*args, **kwargs)
+    finally:
+        plt.close('all')
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def renderFigure(plotFunction, *args, **kwargs):
+    """
+    Renders a figure: in the background in headless mode, otherwise now, after which it is shown
+    :param plotFunction: Function which draws the figure on a new pyplot figure and saves it (eg. from Figures.py)
+    :param args: Positional inputs of plotFunction
+    :param kwargs: Keyword inputs of plotFunction
+    """
+    global executor
+    # The worker is forked, as the stage scripts would otherwise be rerun by it
+    if config.figuresHeadless and config.figuresInBackground and 'fork' in multiprocessing.get_all_start_methods():
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork'),
+                                           initializer=initWorker, initargs=(config.getSnapshot(),))
+        pendingFigures.append(executor.submit(renderInWorker, plotFunction, args, kwargs))
+        return
+
+    import matplotlib.pyplot as plt
+    plotFunction(*args, **kwargs)
+    if not config.figuresHeadless:
+        plt.show()
+    plt.close()
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def waitForFigures():
+    """
+    Waits for the figures sent to the worker process to be saved, raising the error of any which failed
+    """
+    while len(pendingFigures) > 0:
+        pendingFigures.pop(0).result()
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def closeFigureQueue():
+    """
+    Stops the worker process once it has rendered the figures sent to it; errors of figures which have not been waited
+    for are not raised.  This is needed before a process started by multiprocessing exits, as it would otherwise wait
+    for the worker forever.
+    """
+    global executor
+    if executor is not None:
+        executor.shutdown()
+        executor = None
+    pendingFigures.clear()
+# -------- FUNCTION DEFINITION. --------
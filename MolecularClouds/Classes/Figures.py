@@ -0,0 +1,221 @@
+"""
+This file contains the functions which draw and save the figures of the stages.
+    - Each function draws one figure from plain inputs (arrays, tables, the region of interest and the path to save the
+    figure to), so that it can be rendered in a background process (see FigureQueue.py)
+    - The maps draw their points over the styled background of the region of interest (see BaseMap.py), which is
+    rendered from the fits file only when it is not already cached
+    - The points of the maps are labelled as configured in [Figures] of configStartSettings.ini (see LabelPlacement.py)
+"""
+import numpy as np
+import matplotlib.pyplot as plt
+from .BaseMap import BaseMap
+from .LabelPlacement import placeLabels
+
+
+# -------- FUNCTION DEFINITION --------
+def adjustLabels(ax, x, y, labels, size, color):
+    """
+    Labels points with a text at each point, moving the texts apart with adjustText.  This is the free placement of
+    the map of the potential reference points (see LabelPlacement.placeLabels).
+    :param ax: Axes of the map
+    :param x: x coordinates of the points
+    :param y: y coordinates of the points
+    :param labels: Label of each point
+    :param size: Font size of the labels
+    :param color: Colour of the labels
+    """
+    import adjustText
+
+    text = []
+    for i in range(len(x)):
+        txt = ax.text(x[i], y[i], str(labels[i]), size=size, color=color, clip_on=True)
+        text.append(txt)
+    adjustText.adjust_text(text)
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def annotateLabels(ax, x, y, labels, size, color):
+    """
+    Labels points with a text starting at each point.  This is the free placement of the map of the BLOS points (see
+    LabelPlacement.placeLabels).
+    :param ax: Axes of the map
+    :param x: x coordinates of the points
+    :param y: y coordinates of the points
+    :param labels: Label of each point
+    :param size: Font size of the labels
+    :param color: Colour of the labels
+    """
+    for i, txt in enumerate(labels):
+        ax.annotate(txt, (x[i], y[i]), size=size, color=color)
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def plotRMMap(regionOfInterest, cloudName, x, y, color, size, saveFigurePath, cacheDir='none'):
+    """
+    Draws and saves the map of the rotation measures of the region of interest (stage 01)
+    :param regionOfInterest: Region of interest (RegionOfInterest.Region)
+    :param cloudName: Name of the region of interest
+    :param x: x pixel coordinates of the rotation measures in the fits image
+    :param y: y pixel coordinates of the rotation measures in the fits image
+    :param color: Marker colour of each rotation measure
+    :param size: Marker size of each rotation measure
+    :param saveFigurePath: Path the figure is saved to
+    :param cacheDir: Directory in which the background of the map is cached. If 'none', it is not cached on disk
+    """
+    baseMap = BaseMap(regionOfInterest, (8, 8), 120, fillBackground=True, cacheDir=cacheDir)
+    fig = plt.figure(figsize=(8, 8), dpi=120, facecolor='w', edgecolor='k')
+    ax = baseMap.draw(fig)
+
+    plt.title('Rotation Measure Data' + ' in the '+cloudName+' region\n', fontsize=12, y=1.08)
+    plt.scatter(x, y, marker='o', s=size, facecolor=color, linewidth=.5, edgecolors='black')
+    baseMap.limit(ax)
+
+    # ---- Style the legend
+    marker1 = plt.scatter([], [], s=10, facecolor=(1, 1, 1, 0.7), edgecolor='black')
+    marker2 = plt.scatter([], [], s=50, facecolor=(1, 1, 1, 0.7), edgecolor='black')
+    marker3 = plt.scatter([], [], s=100, facecolor=(1, 1, 1, 0.7), edgecolor='black')
+    marker4 = plt.scatter([], [], s=200, facecolor=(1, 1, 1, 0.7), edgecolor='black')
+    marker5 = plt.scatter([], [], s=100, facecolor=(1, 0, 0, 0.7), edgecolor='black')
+    marker6 = plt.scatter([], [], s=100, facecolor=(0, 0, 1, 0.7), edgecolor='black')
+    legend_markers = [marker1, marker2, marker3, marker4, marker5, marker6]
+
+    labels = [
+        str(10) + ' rad m' + r'$^{-2}$',
+        str(50) + ' rad m' + r'$^{-2}$',
+        str(100) + ' rad m' + r'$^{-2}$',
+        str(200) + ' rad m' + r'$^{-2}$',
+        'Negative RM',
+        'Positive RM', ]
+
+    legend = plt.legend(handles=legend_markers, labels=labels, scatterpoints=1)
+
+    frame = legend.get_frame()
+    frame.set_facecolor('1')
+    frame.set_alpha(0.4)
+    # ---- Style the legend.
+
+    baseMap.save(fig, ax, saveFigurePath, tight=True)
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def plotRefPointMap(regionOfInterest, cloudName, x, y, saveFigurePath, cacheDir='none'):
+    """
+    Draws and saves the map of the potential reference points of the region of interest (stage 03).  The points are
+    labelled with their number in order of increasing extinction.
+    :param regionOfInterest: Region of interest (RegionOfInterest.Region)
+    :param cloudName: Name of the region of interest
+    :param x: x pixel coordinates of the points in the fits image, in order of increasing extinction
+    :param y: y pixel coordinates of the points in the fits image, in order of increasing extinction
+    :param saveFigurePath: Path the figure is saved to
+    :param cacheDir: Directory in which the background of the map is cached. If 'none', it is not cached on disk
+    """
+    baseMap = BaseMap(regionOfInterest, (8, 8), 120, cacheDir=cacheDir)
+    fig = plt.figure(figsize=(8, 8), dpi=120, facecolor='w', edgecolor='k')
+    ax = baseMap.draw(fig)
+
+    plt.title('All Potential Reference Points' + ' in the ' + cloudName + ' region\n', fontsize=12, y=1.08)
+    plt.scatter(x, y, marker='o', facecolor='green', linewidth=.5, edgecolors='black', s=50)
+
+    baseMap.limit(ax)
+
+    # ---- Annotate the chosen reference points
+    # Each point is labelled in order of increasing extinction value, which is also the order of their importance
+    placeLabels(ax, x, y, [str(i + 1) for i in range(len(x))], adjustLabels)
+    # ---- Annotate the chosen reference points
+
+    baseMap.save(fig, ax, saveFigurePath)
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def plotBLOSPointMap(regionOfInterest, cloudName, x, y, n, color, size, saveFigurePath, cacheDir='none'):
+    """
+    Draws and saves the map of the BLOS points of the region of interest (stage 04)
+    :param regionOfInterest: Region of interest (RegionOfInterest.Region)
+    :param cloudName: Name of the region of interest
+    :param x: x pixel coordinates of the BLOS points in the fits image
+    :param y: y pixel coordinates of the BLOS points in the fits image
+    :param n: ID# of each BLOS point, with which it is annotated
+    :param color: Marker colour of each BLOS point
+    :param size: Marker size of each BLOS point
+    :param saveFigurePath: Path the figure is saved to
+    :param cacheDir: Directory in which the background of the map is cached. If 'none', it is not cached on disk
+    """
+    baseMap = BaseMap(regionOfInterest, (12, 10), 120, cacheDir=cacheDir)
+    fig = plt.figure(figsize=(12, 10), dpi=120, facecolor='w', edgecolor='k')
+    ax = baseMap.draw(fig)
+
+    plt.title(r'$\rm{B}_{LOS}$' + ' in the '+cloudName+' region\n\n\n', fontsize=12, linespacing=1)
+    plt.scatter(x, y, s=size, facecolor=color, marker='o', linewidth=.5, edgecolors='black')
+
+    baseMap.limit(ax)
+
+    # ---- Annotate the BLOS Points
+    placeLabels(ax, x, y, list(n), annotateLabels)
+    # ---- Annotate the BLOS Points.
+
+    # ---- Style the legend
+    marker1 = plt.scatter([], [], s=10/2, facecolor=(1, 1, 1, 0.7), edgecolor='black')
+    marker2 = plt.scatter([], [], s=100/2, facecolor=(1, 1, 1, 0.7), edgecolor='black')
+    marker3 = plt.scatter([], [], s=500/2, facecolor=(1, 1, 1, 0.7), edgecolor='black')
+    marker4 = plt.scatter([], [], s=1000/2, facecolor=(1, 1, 1, 0.7), edgecolor='black')
+    marker5 = plt.scatter([], [], s=100, facecolor=(1, 0, 0, 0.7), edgecolor='black')
+    marker6 = plt.scatter([], [], s=100, facecolor=(0, 0, 1, 0.7), edgecolor='black')
+    legend_markers = [marker1, marker2, marker4, marker5, marker6]
+
+    labels = [
+        str(10)+r'$\mu G$',
+        str(100)+r'$\mu G$',
+        str(1000) + "+"+r'$\mu G$',
+        'Away from us',
+        'Towards us',
+        ]
+
+    legend = plt.legend(handles=legend_markers, labels=labels, scatterpoints=1, ncol=2)
+
+    frame = legend.get_frame()
+    frame.set_facecolor('1')
+    frame.set_alpha(0.4)
+    # ---- Style the legend.
+
+    baseMap.save(fig, ax, saveFigurePath)
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def plotBLOSvsNRef(DataNoRef, cloudName, saveFigurePath, optimalNumRefPoints=None):
+    """
+    Draws and saves the calculated BLOS of each point as a function of the number of reference points (stage 03)
+    :param DataNoRef: Table of BLOS (rows: points, columns: number of reference points)
+    :param cloudName: Name of the region of interest
+    :param saveFigurePath: Path the figure is saved to
+    :param optimalNumRefPoints: If given, this number of reference points is marked as the suggested optimal number
+    """
+    plt.figure(figsize=(6, 4), dpi=120, facecolor='w', edgecolor='k')
+
+    plt.title('Calculated BLOS value as a function of the number of reference points \n ' + cloudName, fontsize=12,
+              y=1.08)
+    plt.xlabel('Number of reference points')
+    plt.ylabel('Calculated BLOS value ' + r'($\mu G$)')
+
+    x = [int(col) for col in DataNoRef.columns]
+    plt.xticks(x, list(DataNoRef.columns))
+
+    cmap = plt.get_cmap('terrain')
+    colors = [cmap(i) for i in np.linspace(0, 1, len(DataNoRef.index))]
+
+    # For each BLOS Point
+    for i, number in enumerate(DataNoRef.index):
+        plt.plot(x, list(DataNoRef.loc[number]), '-o', color=colors[i], markersize=3)
+
+    if optimalNumRefPoints is not None:
+        yLower, yUpper = plt.ylim()
+        plt.vlines(optimalNumRefPoints, yLower, yUpper, color='black',
+                   label='Suggested optimal number of reference points')
+        plt.legend(loc='center right', bbox_to_anchor=(1.1, 0.5), ncol=2, framealpha=1)
+
+    plt.savefig(saveFigurePath)
+# -------- FUNCTION DEFINITION. --------
@@ -4,13 +4,13 @@ It is used in the third stage of the BLOS Mapping Method.
 """
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import os
 import collections
-from .CalculateB import CalculateB
+from .CalculateB import sweepReferencePoints
 from .RegionOfInterest import Region
+from .FigureQueue import renderFigure
 #from statistics import mode -- Before v3.8, mode returns an error if there are multiple modes. This is not behavior we desire.
-import MolecularClouds.Classes.config as config
+from . import config
 
 def mode(listInput):
     '''
@@ -20,6 +20,98 @@ def mode(listInput):
     '''
     return collections.Counter(listInput).most_common()[0][0]
 
+
+# -------- FUNCTION DEFINITION --------
+def longestRunStarts(BLOSTable, thresholds, maxChunkSize=2 ** 22):
+    """
+    Applies the stability trend algorithm to every BLOS point for every threshold at once.
+
+    - The algorithm checks the values of adjacent pairs of BLOS values
+    - If the BLOS values are similar, ie their difference is within a given threshold, then this is called a "run"
+    - A run ends when the difference exceeds the threshold or at the end of the BLOS values
+    - The algorithm searches for the number of reference points where the longest run starts.  If several runs are
+      equally long, the first one is taken.
+
+    Runs are found with cumulative counters along the number of reference points: within the stretch since the last
+    difference exceeding the threshold, the number of similar pairs seen so far is the length of the current run.
+
+    :param BLOSTable: Table or 2d array of BLOS values.  Each row is a BLOS point and each column is the number of
+                      reference points, starting from 1
+    :param thresholds: Threshold values for the difference between adjacent BLOS values
+    :param maxChunkSize: Maximum number of (threshold, point, pair) entries held in memory at once
+    :return: runStart: Array (thresholds x points) of the number of reference points where the longest run starts.
+                       Entries are 0 if the BLOS point has no run at that threshold.
+             runLength: Array (thresholds x points) of the length of the longest run
+    """
+    BLOSValues = np.array(BLOSTable, dtype=float)
+    thresholds = np.atleast_1d(np.asarray(thresholds, dtype=float))
+    numPoints, numPairs = BLOSValues.shape[0], max(BLOSValues.shape[1] - 1, 0)
+
+    runStart = np.zeros((len(thresholds), numPoints), dtype=int)
+    runLength = np.zeros((len(thresholds), numPoints), dtype=int)
+    if numPairs == 0 or numPoints == 0:
+        return runStart, runLength
+
+    diff = np.abs(np.diff(BLOSValues, axis=1))[np.newaxis, :, :]
+    pairIndex = np.arange(numPairs)
+    chunk = max(1, maxChunkSize // (numPoints * numPairs))
+
+    for first in range(0, len(thresholds), chunk):
+        threshold = thresholds[first:first + chunk, np.newaxis, np.newaxis]
+        similar = diff <= threshold
+        # Comparisons with NaN are neither similar nor above the threshold, so they neither extend nor end a run
+        runEnds = diff > threshold
+
+        numSimilar = np.cumsum(similar, axis=2)
+        numSimilarAtLastEnd = np.maximum.accumulate(np.where(runEnds, numSimilar, 0), axis=2)
+        currentRun = numSimilar - numSimilarAtLastEnd
+
+        # The pair which started the current run is the latest similar pair with a run of one so far
+        runStartPair = np.maximum.accumulate(np.where(similar & (currentRun == 1), pairIndex, -1), axis=2)
+
+        indLongest = np.argmax(currentRun, axis=2)
+        longest = np.take_along_axis(currentRun, indLongest[:, :, np.newaxis], axis=2)[:, :, 0]
+        startPair = np.take_along_axis(runStartPair, indLongest[:, :, np.newaxis], axis=2)[:, :, 0]
+
+        hasRun = longest > 0
+        # The first BLOS value of a run starting at pair i corresponds to i + 1 reference points
+        runStart[first:first + chunk] = np.where(hasRun, startPair + 1, 0)
+        runLength[first:first + chunk] = np.where(hasRun, longest + 1, 0)
+
+    return runStart, runLength
+# -------- FUNCTION DEFINITION. --------
+
+# -------- FUNCTION DEFINITION --------
+def stabilityTrendOptimalNumRefPoints(BLOSTable, thresholds):
+    """
+    Finds the optimal number of reference points for each threshold: the number of reference points where the longest
+    run occurs most often among the BLOS points.
+
+    :param BLOSTable: Table or 2d array of BLOS values.  Each row is a BLOS point and each column is the number of
+                      reference points, starting from 1
+    :param thresholds: Threshold values for the difference between adjacent BLOS values
+    :return: Array of the optimal number of reference points for each threshold.  If ties occur, the value which
+             appears first among the BLOS points is taken, as with mode().  Entries are 0 if no BLOS point has a run.
+    """
+    runStart = longestRunStarts(BLOSTable, thresholds)[0]
+    numThresholds, numPoints = runStart.shape
+    if numPoints == 0:
+        return np.zeros(numThresholds, dtype=int)
+
+    rows = np.repeat(np.arange(numThresholds), numPoints)
+    values = runStart.ravel()
+    hasRun = values > 0
+
+    counts = np.zeros((numThresholds, runStart.max() + 1), dtype=int)
+    np.add.at(counts, (rows[hasRun], values[hasRun]), 1)
+    firstOccurrence = np.full(counts.shape, numPoints)
+    np.minimum.at(firstOccurrence, (rows[hasRun], values[hasRun]), np.tile(np.arange(numPoints), numThresholds)[hasRun])
+
+    # Most common value first, then the value which appears first
+    best = np.lexsort((firstOccurrence, -counts), axis=1)[:, 0]
+    return np.where(counts.max(axis=1) > 0, best, 0)
+# -------- FUNCTION DEFINITION. --------
+
 # -------- CLASS DEFINITION --------
 class FindOptimalRefPoints:
     def __init__(self, cloudName, potentialRefPoints, saveFigurePath):
@@ -38,33 +130,11 @@ class FindOptimalRefPoints:
         matchedRMExtinctionData = pd.read_csv(MatchedRMExtincPath, sep='\t')
         # -------- LOAD AND UNPACK MATCHED RM AND EXTINCTION DATA. --------
 
-        # -------- READ THE POTENTIAL REFERENCE POINT DATA --------
-        numPotentialRefPoints = len(potentialRefPoints)
-        # -------- READ THE POTENTIAL REFERENCE POINT DATA. --------
-
-        # -------- CREATE A TABLE FOR ALL BLOS DATA --------
-        # The rows of this table will represent the number of reference points and the columns of this table will
-        # represent the individual BLOS points.  Each entry in the table is a calculated BLOS value.
-        AllData = pd.DataFrame()
-        # -------- CREATE A TABLE FOR ALL BLOS DATA. --------
-
         # -------- CALCULATE BLOS AS A FUNCTION OF # REF POINTS --------
-        for num in range(numPotentialRefPoints):
-
-            # -------- Extract {num} points from the table of potential reference points
-            # The extracted potential reference points will be referred to as "candidates"
-            candidateRefPoints = potentialRefPoints.loc[:num]
-            # -------- Extract {num} points from the table of potential reference points.
-
-            # -------- Use the candidate reference points to calculate BLOS
-            B = CalculateB(regionOfInterest.AvFilePath, MatchedRMExtincPath, candidateRefPoints, saveFilePath='none')
-            BLOSData = B.BLOSData.set_index('ID#', drop=True)
-            # -------- Use the candidate reference points to calculate BLOS
-
-            # -------- Add calculated BLOS to the table of BLOS vs number of reference points
-            AllData[str(num+1)] = BLOSData['Magnetic_Field(uG)']
-            # -------- Add calculated BLOS to the table of BLOS vs number of reference points
-
+        # The rows of this table will represent the individual BLOS points and the columns of this table will
+        # represent the number of reference points.  Each entry in the table is a calculated BLOS value.
+        # The reference points are added in the order of the table of potential reference points.
+        AllData = sweepReferencePoints(regionOfInterest.AvFilePath, MatchedRMExtincPath, potentialRefPoints)
         # -------- CALCULATE BLOS AS A FUNCTION OF # REF POINTS. --------
 
         # -------- FIND OPTIMAL NUM REF POINTS --------
@@ -77,28 +147,8 @@ class FindOptimalRefPoints:
         DataNoRef.to_csv(os.path.join(config.dir_root, config.dir_fileOutput, config.prefix_OptRefPoints + cloudName + '.txt'), sep='\t')
 
         # -------- CREATE A FIGURE --------
-        plt.figure(figsize=(6, 4), dpi=120, facecolor='w', edgecolor='k')
-
-        plt.title('Calculated BLOS value as a function of the number of reference points \n ' + cloudName, fontsize=12,
-                  y=1.08)
-        plt.xlabel('Number of reference points')
-        plt.ylabel('Calculated BLOS value ' + r'($\mu G$)')
-
-        x = [int(col) for col in DataNoRef.columns]
-        plt.xticks(x, list(DataNoRef.columns))
-
-        cmap = plt.get_cmap('terrain')
-        colors = [cmap(i) for i in np.linspace(0, 1, len(DataNoRef.index))]
-
-        # For each BLOS Point
-        for i, number in enumerate(DataNoRef.index):
-            plt.plot(x, list(DataNoRef.loc[number]), '-o', label=str(Identifiers[i]), color=colors[i], markersize=3)
-
-        # plt.legend(loc='center right', bbox_to_anchor=(1.1, 0.5), ncol=2, framealpha=1, title='Identification Number')
-
-        plt.savefig(saveFigurePath)
-        plt.show()
-        plt.close()
+        from .Figures import plotBLOSvsNRef  # Only imported when a figure is made, as matplotlib is slow to import
+        renderFigure(plotBLOSvsNRef, DataNoRef, cloudName, saveFigurePath)
         print('Saving stability trend to ' + saveFigurePath)
         # -------- CREATE A FIGURE. --------
 
@@ -119,59 +169,14 @@ class FindOptimalRefPoints:
         We repeat this algorithm over all potential threshold values 
         '''
 
-        UpperLimit = max([max(abs(np.diff(list(DataNoRef.loc[number])))) for number in DataNoRef.index])
-        LowerLimit = min([min(abs(np.diff(list(DataNoRef.loc[number])))) for number in DataNoRef.index])
+        BLOSDifferences = np.abs(np.diff(np.array(DataNoRef, dtype=float), axis=1))
+        UpperLimit = np.nanmax(BLOSDifferences)
+        LowerLimit = np.nanmin(BLOSDifferences)
         thresholds = np.linspace(LowerLimit, UpperLimit, 500)
 
         TotalNumPoints = len(matchedRMExtinctionData)
 
-        Optimal_NumRefPoints = []
-
-        for threshold in thresholds:
-
-            LongestRun_NumRefPoints = []
-            LongestRun_Length = []
-
-            # For every point within the region of interest that was not used as a reference point:
-            for index in range(len(DataNoRef)):
-                y = list(DataNoRef.loc[index])  # List of BLOS values for the given point
-                x = list(np.arange(1, len(y) + 1))  # List of number of reference points
-
-                # -------- STABILITY TREND ALGORITHM --------
-                run_length = 1  # To keep track of how many similar values we get in a row
-                on_a_run = 0  # To indicate if we are on a run (1) or not (0)
-                run_started = []  # To keep track of the number of reference points where the run started
-                run = []  # To keep track of the total length of each run
-
-                # For each pair of adjacent BLOS values:
-                for i in range(1, len(y)):
-                    # Find the absolute difference in adjacent BLOS values
-                    diff = abs(y[i] - y[i - 1])
-
-                    if diff <= threshold:
-                        # If the difference is below the threshold, then we have started, or are in, a "run" of similar
-                        # values
-                        run_length += 1
-                        if on_a_run == 0:
-                            # We have started a new run
-                            on_a_run = 1
-                            run_started.append(x[i - 1])
-
-                    if diff > threshold or i == len(y) - 1:
-                        # If the difference was not below the threshold, or, if it is the end of the list of BLOS values
-                        if on_a_run == 1:
-                            # then if we were on a run, it ends
-                            run.append(run_length)
-                            on_a_run = 0
-                            run_length = 1
-                # -------- STABILITY TREND ALGORITHM --------
-
-                if len(run) > 0:
-                    # We want to find the number of reference points where the longest run occurred
-                    ind_longestRun = np.where(np.array(run) == max(run))[0][0]
-                    LongestRun_NumRefPoints.append(run_started[ind_longestRun])
-                    LongestRun_Length.append(max(run))
-            Optimal_NumRefPoints.append(mode(LongestRun_NumRefPoints))
+        Optimal_NumRefPoints = list(stabilityTrendOptimalNumRefPoints(DataNoRef, thresholds))
 
         # -------- FIND OPTIMAL NUM REF POINTS --------
         # The number of reference points should be greater than 3 and less than half the total number of points
@@ -0,0 +1,84 @@
+"""
+This file contains the class to load the part of a fits file which covers the region of interest.
+    - The fits file is opened with memory mapping, so only the pixels which are used are read from disk
+    - The image is cropped to the region of interest (plus a margin) before any conversion or copy is made
+    - A loader should be closed (or used in a with statement) once its image has been taken.  The cropped image stays
+    readable after the file is closed, as long as it is referenced.
+    - Pixel locations in the rest of the pipeline refer to the full image; xOffset and yOffset convert between the two:
+        x_full = x_cropped + xOffset,  y_full = y_cropped + yOffset
+"""
+import math
+from astropy.io import fits
+from astropy.wcs import WCS
+from . import config
+
+
+# -------- CLASS DEFINITION --------
+class FitsLoader:
+    def __init__(self, fitsFilePath, xmin=math.nan, xmax=math.nan, ymin=math.nan, ymax=math.nan, margin=None):
+        """
+        Opens a fits file and crops its image to the given pixel box
+
+        :param fitsFilePath: Path to the fits file
+        :param xmin: Left x-axis bound of the box, in pixels of the full image. If nan, the box starts at the image edge
+        :param xmax: Right x-axis bound of the box (exclusive). If nan, the box ends at the image edge
+        :param ymin: Bottom y-axis bound of the box. If nan, the box starts at the image edge
+        :param ymax: Top y-axis bound of the box (exclusive). If nan, the box ends at the image edge
+        :param margin: Number of pixels added on each side of the box. If None, the configured crop margin is used
+
+        Attributes:
+            hdulist: The opened fits file (see close)
+            header: Header of the fits file
+            fullWCS: World coordinate system of the full image
+            fullShape: Shape of the full image (ny, nx)
+            xOffset, yOffset: Location of the cropped image within the full image
+            data: Cropped image. This is a read-only view of the file; copy it before modifying it
+            wcs: World coordinate system of the cropped image
+        """
+        if margin is None:
+            margin = config.cropMargin
+
+        self.hdulist = fits.open(fitsFilePath, memmap=True)
+        hdu = self.hdulist[0]
+        self.header = hdu.header
+        self.fullWCS = WCS(self.header)
+        self.fullShape = (self.header['NAXIS2'], self.header['NAXIS1'])
+
+        # -------- DEFINE THE CROPPED REGION --------
+        x0 = 0 if math.isnan(xmin) else max(int(xmin) - int(margin), 0)
+        x1 = self.fullShape[1] if math.isnan(xmax) else min(int(math.ceil(xmax)) + int(margin), self.fullShape[1])
+        y0 = 0 if math.isnan(ymin) else max(int(ymin) - int(margin), 0)
+        y1 = self.fullShape[0] if math.isnan(ymax) else min(int(math.ceil(ymax)) + int(margin), self.fullShape[0])
+        x1 = max(x1, x0)
+        y1 = max(y1, y0)
+        self.xOffset = x0
+        self.yOffset = y0
+        # -------- DEFINE THE CROPPED REGION. --------
+
+        # -------- CROP THE IMAGE --------
+        # Slicing the memory mapped image only reads the rows of the cropped region from disk
+        self.data = hdu.data[y0:y1, x0:x1]
+        self.wcs = self.fullWCS[y0:y1, x0:x1]
+        # -------- CROP THE IMAGE. --------
+
+    def close(self):
+        """
+        Closes the fits file.  The memory map of the file is released once the cropped image is no longer referenced.
+        """
+        self.hdulist.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def extent(self):
+        """
+        Gives the extent of the cropped image in pixels of the full image, for use with imshow on axes which use fullWCS
+        :return: (left, right, bottom, top)
+        """
+        return (self.xOffset - 0.5, self.xOffset + self.data.shape[1] - 0.5,
+                self.yOffset - 0.5, self.yOffset + self.data.shape[0] - 0.5)
+
+# -------- CLASS DEFINITION. --------
@@ -0,0 +1,146 @@
+"""
+This file contains the functions to label the points of the maps so that they stay readable however many points a
+region of interest has.
+    - Only the points on the map are labelled, and at most [Figures] Label Limit of them (the first ones given, so
+    points should be given in order of importance).  The number of labels left out is noted in the corner of the map.
+    - With Free placement the labels are placed in the figure's own way (eg. adjustText in stage 03, which slows down
+    greatly with many labels).  With Grid placement each label is put at the first of a few positions about its point
+    which does not overlap a label already placed, or left out if there is none.  The labels already placed are kept in
+    a grid of cells about the height of a label, so each label is only checked against the labels near it.
+    - Auto uses Free placement for up to [Figures] Free Label Limit labels on the map, and Grid placement beyond
+"""
+import math
+import numpy as np
+from matplotlib.font_manager import FontProperties
+from . import config
+
+placements = ('Free', 'Grid', 'Auto')
+
+
+# -------- FUNCTION DEFINITION --------
+def pointsOnMap(ax, x, y):
+    """
+    Finds the points within the limits of the axes
+    :param ax: Axes of the map, already limited
+    :param x: x coordinates of the points
+    :param y: y coordinates of the points
+    :return: Indices of the points on the map, in the order given
+    """
+    xLower, xUpper = sorted(ax.get_xlim())
+    yLower, yUpper = sorted(ax.get_ylim())
+    onMap = (x >= xLower) & (x <= xUpper) & (y >= yLower) & (y <= yUpper)
+    return np.flatnonzero(onMap)
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def gridPlacement(xPix, yPix, widths, height, bounds, reserved=()):
+    """
+    Places labels greedily, in the order given, at the first position about their point which is within the bounds and
+    does not overlap a label already placed
+    :param xPix: x display coordinates (pixels) of the points
+    :param yPix: y display coordinates (pixels) of the points
+    :param widths: Width (pixels) of each label
+    :param height: Height (pixels) of the labels
+    :param bounds: (x0, y0, x1, y1) display bounds (pixels) the labels must be within
+    :param reserved: Boxes (x0, y0, x1, y1) no label may overlap
+    :return: List of (index of the point, x offset, y offset) of the lower left corner of each label placed, in pixels
+    """
+    cellSize = max(height, 1.)
+    cells = {}  # (column, row): boxes overlapping the cell
+
+    def cellsOf(box):
+        columns = range(math.floor(box[0] / cellSize), math.floor(box[2] / cellSize) + 1)
+        rows = range(math.floor(box[1] / cellSize), math.floor(box[3] / cellSize) + 1)
+        return [(column, row) for column in columns for row in rows]
+
+    def isFree(box):
+        for cell in cellsOf(box):
+            for other in cells.get(cell, []):
+                if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]:
+                    return False
+        return True
+
+    def occupy(box):
+        for cell in cellsOf(box):
+            cells.setdefault(cell, []).append(box)
+
+    for box in reserved:
+        occupy(box)
+
+    pad = height / 4
+    placed = []
+    for i in range(len(xPix)):
+        width = widths[i]
+        # Above right of the point first, then below right, above left and below left
+        for dx, dy in ((pad, pad), (pad, -height - pad), (-width - pad, pad), (-width - pad, -height - pad)):
+            box = (xPix[i] + dx, yPix[i] + dy, xPix[i] + dx + width, yPix[i] + dy + height)
+            if box[0] < bounds[0] or box[1] < bounds[1] or box[2] > bounds[2] or box[3] > bounds[3]:
+                continue
+            if isFree(box):
+                occupy(box)
+                placed.append((i, dx, dy))
+                break
+    return placed
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def placeLabels(ax, x, y, labels, freePlacement, size=9, color='w'):
+    """
+    Labels the points on a map in the configured way ([Figures] Label Placement)
+    :param ax: Axes of the map, already limited
+    :param x: x coordinates of the points
+    :param y: y coordinates of the points
+    :param labels: Label of each point
+    :param freePlacement: Function (ax, x, y, labels, size, color) which labels the points in the figure's own way
+    :param size: Font size of the labels
+    :param color: Colour of the labels
+    :return: Number of labels placed
+    """
+    if config.labelPlacement not in placements:
+        raise ValueError("[Figures] Label Placement must be one of {}, not '{}'".format(placements,
+                                                                                       config.labelPlacement))
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    onMap = pointsOnMap(ax, x, y)
+    shown = onMap[:max(config.labelLimit, 0)]
+    fig = ax.get_figure()
+    renderer = fig.canvas.get_renderer()
+    fontProperties = FontProperties(size=size)
+
+    # ---- Note the labels left out in the corner of the map
+    noteX, noteY = ax.transAxes.transform((0.01, 0.01))
+    noteText = '{} of {} labels left out'.format(len(onMap), len(onMap))
+    noteWidth, noteHeight, _ = renderer.get_text_width_height_descent(noteText, fontProperties, ismath=False)
+    noteBox = (noteX, noteY, noteX + noteWidth, noteY + noteHeight)
+    # ---- Note the labels left out in the corner of the map.
+
+    if config.labelPlacement == 'Free' or (config.labelPlacement == 'Auto' and len(shown) <= config.freeLabelLimit):
+        freePlacement(ax, x[shown], y[shown], [labels[i] for i in shown], size, color)
+        numPlaced = len(shown)
+    else:
+        # ---- Place the labels on a grid
+        xPix, yPix = ax.transData.transform(np.column_stack([x[shown], y[shown]])).T
+        measured = {}
+        for i in shown:
+            text = str(labels[i])
+            if text not in measured:
+                measured[text] = renderer.get_text_width_height_descent(text, fontProperties, ismath=False)[:2]
+        widths = [measured[str(labels[i])][0] for i in shown]
+        height = max([measured[text][1] for text in measured], default=0)
+
+        placed = gridPlacement(xPix, yPix, widths, height, ax.bbox.extents, reserved=[noteBox])
+        pointsPerPixel = 72. / fig.dpi
+        for i, dx, dy in placed:
+            point = shown[i]
+            ax.annotate(str(labels[point]), (x[point], y[point]), xytext=(dx * pointsPerPixel, dy * pointsPerPixel),
+                        textcoords='offset points', ha='left', va='bottom', size=size, color=color)
+        numPlaced = len(placed)
+        # ---- Place the labels on a grid.
+
+    if numPlaced < len(onMap):
+        ax.text(0.01, 0.01, '{} of {} labels left out'.format(len(onMap) - numPlaced, len(onMap)),
+                transform=ax.transAxes, ha='left', va='bottom', size=size, color=color)
+    return numPlaced
+# -------- FUNCTION DEFINITION. --------
@@ -0,0 +1,93 @@
+"""
+This file contains the class to match rotation measure points to extinction values.
+It is used in the second stage of the BLOS Mapping Method.
+    - Matching is based on physical proximity: each rotation measure is matched to the pixel it lies on, and the minimum
+    and maximum extinction within its error range are recorded
+    - All rotation measures are matched at once: sky positions are converted with one call to the world coordinate
+    system and the error ranges are gathered from the extinction map with array operations
+"""
+import numpy as np
+import pandas as pd
+from . import RefJudgeLib as rjl
+
+
+# -------- CLASS DEFINITION --------
+class MatchRMExtinction:
+    def __init__(self, data, badData, wcs, RMRa, RMDec, RMValue, RMErr, NDelt, xOffset=0, yOffset=0,
+                 saveFilePath='none'):
+        """
+        Takes an extinction map and rotation measure data for the region of interest and matches each rotation measure
+        to an extinction value
+
+        :param data: Extinction map (2d array)
+        :param badData: Mask (2d array) of the pixels of the map whose extinction was not observed (eg interpolated)
+        :param wcs: World coordinate system of the extinction map
+        :param RMRa: Right ascensions of the rotation measures in degrees
+        :param RMDec: Declinations of the rotation measures in degrees
+        :param RMValue: Rotation measures
+        :param RMErr: Errors in the rotation measures
+        :param NDelt: Number of pixels above, below, left and right of the rotation measure which make up its error range
+        :param xOffset: x location of the extinction map within the full fits image, if the map has been cropped
+        :param yOffset: y location of the extinction map within the full fits image, if the map has been cropped
+        :param saveFilePath: Path to which output is saved. If 'none', no file will be saved
+        """
+        RMRa = np.asarray(RMRa, dtype=float)
+        RMDec = np.asarray(RMDec, dtype=float)
+
+        # -------- LOCATION OF THE ROTATION MEASURES --------
+        py, px = wcs.world_to_array_index_values(RMRa, RMDec)  # Array indices of the rotation measures
+        py = np.atleast_1d(py)
+        px = np.atleast_1d(px)
+        # -------- LOCATION OF THE ROTATION MEASURES. --------
+
+        # -------- KEEP ROTATION MEASURES WHICH LIE ON A POINT WITH DATA --------
+        # The rm must lie within the given fits file:
+        inFile = (0 <= px) & (px < data.shape[1]) & (0 <= py) & (py < data.shape[0])
+        extinction = np.full(len(px), np.nan, dtype=np.result_type(data, 0.))
+        extinction[inFile] = data[py[inFile], px[inFile]]
+        # and on a point with data:
+        matched = inFile & (extinction != -1) & ~np.isnan(extinction)
+
+        px, py = px[matched], py[matched]
+        # -------- KEEP ROTATION MEASURES WHICH LIE ON A POINT WITH DATA. --------
+
+        # -------- MATCH ROTATION MEASURES TO EXTINCTION VALUES --------
+        ExtinctionRa, ExtinctionDec = wcs.wcs_pix2world(px, py, 0)
+
+        # ---- Find the minimum and maximum extinction within the error range of each rm
+        minValue, minX, minY, maxValue, maxX, maxY = rjl.getBoxExtrema(px, py, data, NDelt)
+        minRa, minDec = wcs.wcs_pix2world(minX, minY, 0)
+        maxRa, maxDec = wcs.wcs_pix2world(maxX, maxY, 0)
+        # ---- Find the minimum and maximum extinction within the error range of each rm.
+        # -------- MATCH ROTATION MEASURES TO EXTINCTION VALUES. --------
+
+        # -------- CREATE THE TABLE OF MATCHED DATA --------
+        self.MatchedRMExtinctionData = pd.DataFrame({
+            'ID#': np.arange(len(px)),  # numbering starts at 0
+            'Extinction_Index_x': px.astype(int) + xOffset,  # pixel of the full fits image
+            'Extinction_Index_y': py.astype(int) + yOffset,
+            'Ra(deg)': RMRa[matched],
+            'Dec(deg)': RMDec[matched],
+            'Rotation_Measure(rad/m2)': np.asarray(RMValue)[matched],
+            'RM_Err(rad/m2)': np.asarray(RMErr)[matched],
+            'RA_inExtincFile(degree)': ExtinctionRa,
+            'Dec_inExtincFile(degree)': ExtinctionDec,
+            'Extinction_Value': extinction[matched],
+            'Error_Range(pix)': np.full(len(px), NDelt),
+            'Min_Extinction_Value': minValue,
+            'Min_Extinction_Ra': minRa,
+            'Min_Extinction_Dec': minDec,
+            'Max_Extinction_Value': maxValue,
+            'Max_Extinction_RA': maxRa,
+            'Max_Extinction_dec': maxDec})
+
+        # Negative extinction is not physical; it may have been interpolated away. Mark these points.
+        self.IsExtinctionObserved = ~badData[py, px]
+        # -------- CREATE THE TABLE OF MATCHED DATA. --------
+
+        # -------- SAVE MATCHED DATA AS A TABLE --------
+        if saveFilePath != 'none':
+            self.MatchedRMExtinctionData.to_csv(saveFilePath, index=False, sep='\t')
+        # -------- SAVE MATCHED DATA AS A TABLE. --------
+
+# -------- CLASS DEFINITION. --------
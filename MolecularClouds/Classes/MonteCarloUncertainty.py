@@ -0,0 +1,176 @@
+"""
+This file contains the functions to estimate the uncertainty of the BLOS values by Monte Carlo sampling.
+It is used in the seventh stage (07) of the BLOS Mapping Method.
+    - In each sample, every rotation measure is drawn from a normal distribution about its value (with its error as the
+    standard deviation), every extinction is drawn uniformly between the least and greatest extinction found about its
+    point in stage 02, the reference points are drawn (with replacement) from the chosen reference points, and the
+    changes in the fiducial temperature and density are drawn uniformly within the configured ranges
+    - The electron abundance profile of each sample is interpolated (AbundanceInterpolator), so no files are read
+    while sampling, and BLOS is evaluated for a block of samples at once as array operations
+    - The samples are split into chunks which may be calculated by worker processes.  Each chunk has its own seed
+    derived from the configured seed, so the results do not depend on the number of workers
+    - Samples where a point has a negative scaled extinction, or an extinction beyond the abundance profile, are left out
+"""
+import os
+import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .AbundanceInterpolator import AbundanceInterpolator
+from .CalculateB import cumulativeElectronColumn
+from . import config
+
+# Percentiles reported for each BLOS point: the median and the range of one standard deviation of a normal distribution
+percentiles = (15.865, 50., 84.135)
+
+# Number of samples whose BLOS is evaluated at once, which bounds the memory used
+blockSize = 256
+
+# Inputs shared (read-only) by the chunks calculated in a worker process
+sharedInputs = None
+
+
+# -------- FUNCTION DEFINITION --------
+def initWorker(inputs, configSnapshot):
+    """
+    Keeps the inputs shared by all chunks in the worker process, and gives it the configuration of the parent process
+    """
+    global sharedInputs
+    config.useSnapshot(configSnapshot)
+    sharedInputs = inputs
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def takeLayers(values, ind):
+    """
+    Takes the value of the given layer of each profile for each point
+    :param values: Values of each layer (profile, layer)
+    :param ind: Layer of each point (profile, point)
+    :return: Values (profile, point)
+    """
+    return np.take_along_axis(values, ind, axis=1)
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def sampleBLOS(numSamples, seed):
+    """
+    Draws samples of the BLOS of every point
+    :param numSamples: Number of samples
+    :param seed: Seed (or numpy SeedSequence) of the random number generator
+    :return: BLOS of each sample (rows) and point (columns); nan where the sample is left out
+    """
+    inputs = sharedInputs
+    rng = np.random.default_rng(seed)
+    conversionFactor = config.VExtinct_2_Hcol  # to convert extinction to H column density
+    pcTocm = config.pcTocm
+    numPoints = len(inputs['RM'])
+    numRefPoints = len(inputs['refRM'])
+
+    BLOS = np.empty((numSamples, numPoints), dtype=np.float32)
+    for start in range(0, numSamples, blockSize):
+        size = min(blockSize, numSamples - start)
+
+        # -------- DRAW THE RM AND EXTINCTION DATA --------
+        RM = inputs['RM'] + rng.standard_normal((size, numPoints)) * inputs['RMErr']
+        Extinction = rng.uniform(inputs['minExtinction'], inputs['maxExtinction'], (size, numPoints))
+        # -------- DRAW THE RM AND EXTINCTION DATA. --------
+
+        # -------- DRAW THE REFERENCE POINTS AND FIND THE FIDUCIAL VALUES --------
+        refChoice = rng.integers(0, numRefPoints, (size, numRefPoints))
+        refRM = inputs['refRM'][refChoice] + rng.standard_normal((size, numRefPoints)) * inputs['refRMErr'][refChoice]
+        refExtinction = rng.uniform(inputs['refMinExtinction'][refChoice], inputs['refMaxExtinction'][refChoice])
+        ScaledRM = RM - np.mean(refRM, axis=1)[:, np.newaxis]
+        ScaledExtinction = Extinction - np.mean(refExtinction, axis=1)[:, np.newaxis]
+        # -------- DRAW THE REFERENCE POINTS AND FIND THE FIDUCIAL VALUES. --------
+
+        # -------- DRAW THE ABUNDANCE PROFILES --------
+        tempPercent = rng.uniform(-inputs['tempChange'], inputs['tempChange'], size)
+        densityPercent = rng.uniform(-inputs['densityChange'], inputs['densityChange'], size)
+        Av, eAbundance = inputs['interpolator'].evaluate(tempPercent, densityPercent)
+        cumulativeAvXe = cumulativeElectronColumn(Av, eAbundance)
+        # -------- DRAW THE ABUNDANCE PROFILES. --------
+
+        # -------- CALCULATE THE MAGNETIC FIELD --------
+        # As in CalculateB, the layer of interest is the first layer where Av >= half the scaled extinction
+        halfExtinction = ScaledExtinction / 2
+        indLayerOfInterest = np.empty(halfExtinction.shape, dtype=np.int64)
+        for i in range(size):
+            indLayerOfInterest[i] = np.searchsorted(Av[i], halfExtinction[i], side='left')
+        isValid = (ScaledExtinction >= 0) & (indLayerOfInterest < Av.shape[1])
+
+        indPrevious = np.maximum(indLayerOfInterest - 1, 0)
+        LayerNe = takeLayers(cumulativeAvXe, indPrevious) + \
+            (halfExtinction - takeLayers(Av, indPrevious)) * takeLayers(eAbundance, indPrevious)
+        LayerNe = np.where(indLayerOfInterest == 0, cumulativeAvXe[:, :1], LayerNe) * conversionFactor
+
+        BLOS[start:start + size] = np.where(isValid, ScaledRM / (0.812 * LayerNe * pcTocm * 2), np.nan)
+        # -------- CALCULATE THE MAGNETIC FIELD. --------
+    return BLOS
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def monteCarloBLOS(BLOSPointIDs, matchedTable, refPointTable, AvFileDir, numSamples, numWorkers=None, seed=None,
+                   tempChange=None, densityChange=None, chunkSize=2000):
+    """
+    Estimates the distribution of the BLOS of each point by Monte Carlo sampling
+    :param BLOSPointIDs: ID# of the BLOS points (eg. from the table produced in stage 04)
+    :param matchedTable: Table (pandas dataframe) of the matched rotation measure and extinction data (stage 02)
+    :param refPointTable: Table (pandas dataframe) of the chosen reference points
+    :param AvFileDir: Directory of the abundance profiles of the region of interest
+    :param numSamples: Number of samples
+    :param numWorkers: Number of worker processes. If None, the configured number is used; 1 calculates in this process
+    :param seed: Seed of the random number generator. If None, the configured seed is used
+    :param tempChange: Greatest change (%) of the fiducial temperature. If None, the configured value is used
+    :param densityChange: Greatest change (%) of the fiducial density. If None, the configured value is used
+    :param chunkSize: Number of samples in each chunk given to a worker
+    :return: Array (percentile, point) of the percentiles of BLOS given in 'percentiles'
+    """
+    if numWorkers is None:
+        numWorkers = config.monteCarloWorkers if config.monteCarloWorkers > 0 else os.cpu_count()
+    if seed is None:
+        seed = config.monteCarloSeed
+    if tempChange is None:
+        tempChange = config.monteCarloTempChange
+    if densityChange is None:
+        densityChange = config.monteCarloDensityChange
+
+    # -------- GATHER THE INPUTS --------
+    matchedTable = matchedTable.set_index('ID#')
+    points = matchedTable.loc[np.array(BLOSPointIDs)]
+    refPoints = matchedTable.loc[np.array(refPointTable['ID#'])]
+
+    columns = {'RM': 'Rotation_Measure(rad/m2)', 'RMErr': 'RM_Err(rad/m2)', 'minExtinction': 'Min_Extinction_Value',
+               'maxExtinction': 'Max_Extinction_Value'}
+    inputs = {'tempChange': tempChange, 'densityChange': densityChange,
+              'interpolator': AbundanceInterpolator(AvFileDir)}
+    for key, name in columns.items():
+        inputs[key] = np.array(points[name], dtype=float)
+        inputs['ref' + key[0].upper() + key[1:]] = np.array(refPoints[name], dtype=float)
+    # Checks that the ranges of the changes are within the abundance profiles before any sample is drawn
+    inputs['interpolator'].evaluate([-tempChange, tempChange], [-densityChange, densityChange])
+    # -------- GATHER THE INPUTS. --------
+
+    # -------- DRAW THE SAMPLES IN CHUNKS --------
+    chunkSizes = [min(chunkSize, numSamples - start) for start in range(0, numSamples, chunkSize)]
+    chunkSeeds = np.random.SeedSequence(seed).spawn(len(chunkSizes))
+    numWorkers = max(1, min(numWorkers, len(chunkSizes)))
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        numWorkers = 1  # The stage scripts would otherwise be rerun by each worker
+
+    if numWorkers == 1:
+        initWorker(inputs, config.getSnapshot())
+        chunks = [sampleBLOS(size, chunkSeed) for size, chunkSeed in zip(chunkSizes, chunkSeeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=numWorkers, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=initWorker, initargs=(inputs, config.getSnapshot())) as executor:
+            chunks = list(executor.map(sampleBLOS, chunkSizes, chunkSeeds))
+    BLOSSamples = np.concatenate(chunks)
+    # -------- DRAW THE SAMPLES IN CHUNKS. --------
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # Points left out of every sample have nan percentiles
+        return np.nanpercentile(BLOSSamples, percentiles, axis=0)
+# -------- FUNCTION DEFINITION. --------
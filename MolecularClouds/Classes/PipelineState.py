@@ -0,0 +1,132 @@
+"""
+This file contains the class which records what each stage of a region of interest was run with, so that BatchRun.py
+only reruns the stages whose inputs have changed.
+    - The fingerprint of a stage is a hash of the content of the stage script and the Classes package, of the input
+    files of the stage (the catalogue, fits file, cloud parameter file, configuration files, abundance profiles), of the
+    choices given to the stage, and of the content of the outputs of the stages it reads from
+    - The state is kept in PipelineState.json in the output folder of the region, with the fingerprint and the content
+    hash of the outputs of each stage which has been run
+    - A stage is up to date if its fingerprint is unchanged and its outputs are still as it left them
+    - The content hash of a file is kept with the size and modification time of the file, so unchanged files (eg. a
+    large fits file) are only read once
+"""
+import os
+import json
+import hashlib
+
+# Files in the output folder which are not outputs of the stages
+stateFileName = 'PipelineState.json'
+ignoredOutputExtensions = ('.npz', '.npy', '.tmp')
+
+
+# -------- CLASS DEFINITION --------
+class PipelineState:
+    def __init__(self, outputDir):
+        """
+        Loads the state of the stages of a region of interest
+
+        :param outputDir: Output folder of the region of interest
+
+        Attributes:
+            stages: Dictionary of stage: {'fingerprint': ..., 'outputs': {path relative to outputDir: content hash}}
+            hashes: Dictionary of file path: [size, modification time, content hash]
+        """
+        self.outputDir = outputDir
+        self.statePath = os.path.join(outputDir, stateFileName)
+        self.stages = {}
+        self.hashes = {}
+        try:
+            with open(self.statePath) as f:
+                state = json.load(f)
+            self.stages = state['stages']
+            self.hashes = state['hashes']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save(self):
+        """
+        Saves the state, replacing the state file in one step.  Nothing is saved before the output folder is made (in
+        stage 00b).
+        """
+        if not os.path.isdir(self.outputDir):
+            return
+        tempPath = self.statePath + '.tmp'
+        with open(tempPath, 'w') as f:
+            json.dump({'stages': self.stages, 'hashes': self.hashes}, f, indent=1, sort_keys=True)
+        os.replace(tempPath, self.statePath)
+
+    def contentHash(self, path):
+        """
+        Gives the hash of the content of a file, or None if there is no such file
+        :param path: Path to the file
+        :return: Hexadecimal string
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = os.path.abspath(path)
+        if key in self.hashes and self.hashes[key][:2] == [stat.st_size, stat.st_mtime_ns]:
+            return self.hashes[key][2]
+
+        sha = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        self.hashes[key] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+        return sha.hexdigest()
+
+    def fingerprint(self, inputPaths, choices, upstreamStages):
+        """
+        Gives the fingerprint of a stage
+        :param inputPaths: Paths to the input files of the stage, including the stage script
+        :param choices: Dictionary of the choices given to the stage
+        :param upstreamStages: Stages whose outputs the stage reads
+        :return: Hexadecimal string
+        """
+        inputs = {os.path.abspath(path): self.contentHash(path) for path in inputPaths}
+        upstreamOutputs = {stage: self.stages.get(stage, {}).get('outputs') for stage in upstreamStages}
+        description = json.dumps([inputs, choices, upstreamOutputs], sort_keys=True)
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def isUpToDate(self, stage, fingerprint):
+        """
+        Checks whether a stage was last run with the given fingerprint and its outputs are unchanged since
+        :param stage: Name of the stage
+        :param fingerprint: Fingerprint of the stage (from fingerprint)
+        :return: True or False
+        """
+        record = self.stages.get(stage)
+        if record is None or record['fingerprint'] != fingerprint:
+            return False
+        return all(self.contentHash(os.path.join(self.outputDir, path)) == outputHash
+                   for path, outputHash in record['outputs'].items())
+
+    def outputSignatures(self):
+        """
+        Gives the size and modification time of every file in the output folder, to find the files written by a stage
+        :return: Dictionary of path relative to the output folder: (size, modification time)
+        """
+        signatures = {}
+        for directory, subDirs, fileNames in os.walk(self.outputDir):
+            for fileName in fileNames:
+                if fileName.startswith(stateFileName) or fileName.endswith(ignoredOutputExtensions):
+                    continue
+                path = os.path.join(directory, fileName)
+                stat = os.stat(path)
+                signatures[os.path.relpath(path, self.outputDir)] = (stat.st_size, stat.st_mtime_ns)
+        return signatures
+
+    def record(self, stage, fingerprint, signaturesBefore):
+        """
+        Records that a stage has been run, with the files it wrote as its outputs
+        :param stage: Name of the stage
+        :param fingerprint: Fingerprint the stage was run with
+        :param signaturesBefore: outputSignatures from before the stage was run
+        """
+        signaturesAfter = self.outputSignatures()
+        outputs = {path: self.contentHash(os.path.join(self.outputDir, path))
+                   for path, signature in signaturesAfter.items() if signaturesBefore.get(path) != signature}
+        self.stages[stage] = {'fingerprint': fingerprint, 'outputs': outputs}
+
+# -------- CLASS DEFINITION. --------
@@ -3,11 +3,10 @@ This library contains functions involved with providing information to make deci
 exclude in script 3.
 '''
 import math
-import scipy.interpolate as interpolate
 import numpy as np
-from sklearn.linear_model import Ridge
+# scikit-learn, scipy.interpolate and scipy.ndimage are slow to import, so they are imported by the functions which
+# use them
 
-import copy
 
 # -------- FUNCTION DEFINITION --------
 def findWeightedCenter(data, xmin = np.nan, xmax = np.nan, ymin = np.nan, ymax = np.nan, maskWeight = 4):
@@ -23,14 +22,8 @@ def findWeightedCenter(data, xmin = np.nan, xmax = np.nan, ymin = np.nan, ymax =
         xCoord: The x-coordinate of the weighted center of the bound region (Float)
         yCoord: The y-coordinate of the weighted center of the bound region (Float)
     """
-    #Guard against modifying input data
-    locData = copy.deepcopy(data)
-
-    #Clean input data
-    locData[np.isnan(locData)] = 0
-    locData[np.isinf(locData)] = 0
-
-    #Find offsets in case we only care about a smaller region
+    #Find offsets in case we only care about a smaller region (a view, so the input data is not copied)
+    locData = data
     xOffset = 0
     yOffset = 0
     if not math.isnan(xmax) and not math.isnan(xmin):
@@ -40,6 +33,9 @@ def findWeightedCenter(data, xmin = np.nan, xmax = np.nan, ymin = np.nan, ymax =
         locData = locData[int(ymin):int(ymax), :]
         yOffset = ymin
 
+    #Clean input data: the input data is not modified, only the cleaned region is a new array
+    locData = np.where(np.isfinite(locData), locData, 0)
+
     #Weight the multipliers by position
     x = range(0, locData.shape[1])
     y = range(0, locData.shape[0])
@@ -47,7 +43,7 @@ def findWeightedCenter(data, xmin = np.nan, xmax = np.nan, ymin = np.nan, ymax =
 
     #Mask out all values not part of the cloud we care about
     lowExtinctMask = locData < 1.0 * maskWeight * np.sum(locData) / (locData.shape[0] * locData.shape[1])
-    locData[lowExtinctMask] = 0
+    locData[lowExtinctMask] = 0  # locData is our own cleaned copy of the region
 
     xCoord = ((X * locData).sum() / locData.sum().astype(float)) + xOffset
     yCoord = ((Y * locData).sum() / locData.sum().astype(float)) + yOffset
@@ -69,14 +65,8 @@ def getDividingLine(data, xmin = np.nan, xmax = np.nan, ymin = np.nan, ymax = np
         m: The multiplier, in mx+b (float)
         b: The offset, in mx+b (float)
     """
-    # Guard against modifying input data
-    locData = copy.deepcopy(data)
-
-    # Clean input data
-    locData[np.isnan(locData)] = 0
-    locData[np.isinf(locData)] = 0
-
-    # Find offsets in case we only care about a smaller region
+    # Find offsets in case we only care about a smaller region (a view, so the input data is not copied)
+    locData = data
     xOffset = 0
     yOffset = 0
     if not math.isnan(xmax) and not math.isnan(xmin):
@@ -86,6 +76,9 @@ def getDividingLine(data, xmin = np.nan, xmax = np.nan, ymin = np.nan, ymax = np
         locData = locData[int(ymin):int(ymax), :]
         yOffset = ymin
 
+    # Clean input data: the input data is not modified, only the cleaned region is a new array
+    locData = np.where(np.isfinite(locData), locData, 0)
+
     #Define masks and weights
     highExtinctMask = locData > maskWeight * np.sum(locData)/(locData.shape[0]*locData.shape[1])
     weights = locData[highExtinctMask]
@@ -98,6 +91,7 @@ def getDividingLine(data, xmin = np.nan, xmax = np.nan, ymin = np.nan, ymax = np
     y = coordsHighExtinct[:, 0]
 
     # Linear Predictor
+    from sklearn.linear_model import Ridge
     predictor = Ridge(alpha=0.1)
     predictor.fit(xInput, y, weights)
 
@@ -160,6 +154,57 @@ def getBoxRange(px, py, data, NDelt):
     return ind_xmin, ind_xmax, ind_ymin, ind_ymax
 # -------- FUNCTION DEFINITION --------
 
+# -------- FUNCTION DEFINITION --------
+def getBoxExtrema(px, py, data, NDelt, maxChunkSize=2 ** 22):
+    """
+    Finds the minimum and maximum value, and their locations, within the box around each of the given points.
+    The values are found with extremaBoxBatch; the boxes of the points are then gathered from the data, a chunk of
+    points at a time, to locate them.
+    :param px: x locations of the points (array of int)
+    :param py: y locations of the points (array of int)
+    :param data: The extinction dataset in question
+    :param NDelt: Number of pixels above, below, left and right of the point to check, in a square box.
+    :param maxChunkSize: Maximum number of (point, box pixel) entries held in memory at once
+    :return:
+        minValue, minX, minY: The minimum value within each box and its x and y location
+        maxValue, maxX, maxY: The maximum value within each box and its x and y location
+    If a value occurs more than once in a box, the first location scanning by column (x) then row (y) is given.
+    NaN values and locations outside the data are ignored.
+    """
+    px = np.asarray(px, dtype=int)
+    py = np.asarray(py, dtype=int)
+    NDelt = int(NDelt)
+    minValue, maxValue = extremaBoxBatch(px, py, data, NDelt)
+
+    # ---- Offsets within the box, in the order x then y
+    offsets = np.arange(-NDelt, NDelt + 1)
+    dx = np.repeat(offsets, len(offsets))
+    dy = np.tile(offsets, len(offsets))
+    # ---- Offsets within the box, in the order x then y.
+
+    minX, minY, maxX, maxY = (np.zeros(len(px), dtype=int) for _ in range(4))
+    chunk = max(1, maxChunkSize // len(dx))
+    for first in range(0, len(px), chunk):
+        points = slice(first, first + chunk)
+
+        # ---- Gather the boxes: one row per point
+        boxX = px[points, np.newaxis] + dx[np.newaxis, :]
+        boxY = py[points, np.newaxis] + dy[np.newaxis, :]
+        inData = (0 <= boxX) & (boxX < data.shape[1]) & (0 <= boxY) & (boxY < data.shape[0])
+        values = data[np.clip(boxY, 0, data.shape[0] - 1), np.clip(boxX, 0, data.shape[1] - 1)]
+        # ---- Gather the boxes: one row per point.
+
+        # ---- Locate the first occurrence of each extremum; a box with no values gives its first location
+        indMin = np.argmax(inData & (values == minValue[points, np.newaxis]), axis=1)
+        indMax = np.argmax(inData & (values == maxValue[points, np.newaxis]), axis=1)
+        rows = np.arange(len(indMin))
+        minX[points], minY[points] = boxX[rows, indMin], boxY[rows, indMin]
+        maxX[points], maxY[points] = boxX[rows, indMax], boxY[rows, indMax]
+        # ---- Locate the first occurrence of each extremum; a box with no values gives its first location.
+
+    return minValue, minX, minY, maxValue, maxX, maxY
+# -------- FUNCTION DEFINITION --------
+
 # -------- FUNCTION DEFINITION --------
 def nearHighExtinction(px, py, data, NDelt, highExtinctionThreshold):
     """
@@ -171,16 +216,170 @@ def nearHighExtinction(px, py, data, NDelt, highExtinctionThreshold):
     :param highExtinctionThreshold: The threshold beyond which a point is considered to be high extinction.
     :return: True or False, depending on if the point is near a point of high extinction or not.
     """
-    # ---- Find the extinction range for the given point
-    ind_xmin, ind_xmax, ind_ymin, ind_ymax = getBoxRange(px, py, data, NDelt)
-    # ---- Find the extinction range for the given point.
+    return bool(nearHighExtinctionBatch([px], [py], data, NDelt, highExtinctionThreshold)[0])
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def getBoxRanges(px, py, data, NDelt):
+    """
+    Returns the box ranges around each of the given points, as getBoxRange does for a single point.
+    Boxes which lie completely outside the data are empty (min == max).
+    :param px: x locations of the points (array of int)
+    :param py: y locations of the points (array of int)
+    :param data: The extinction dataset in question
+    :param NDelt: Number of pixels above, below, left and right of the point, in a square box.
+    :return: ind_xmin, ind_xmax, ind_ymin, ind_ymax (arrays of int)
+    """
+    px = np.asarray(px, dtype=int)
+    py = np.asarray(py, dtype=int)
+    NDelt = int(NDelt)
+
+    ind_xmin = np.clip(px - NDelt, 0, data.shape[1])
+    ind_xmax = np.clip(px + NDelt + 1, ind_xmin, data.shape[1])  # add 1 to be inclusive of the upper bound
+    ind_ymin = np.clip(py - NDelt, 0, data.shape[0])
+    ind_ymax = np.clip(py + NDelt + 1, ind_ymin, data.shape[0])  # add 1 to be inclusive of the upper bound
+    return ind_xmin, ind_xmax, ind_ymin, ind_ymax
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def integralImage(values):
+    """
+    Returns the integral image (summed-area table) of the values, padded with a leading row and column of zeros so
+    that integral[y, x] is the sum of values[:y, :x].
+    :param values: 2d array of numbers or booleans
+    :return: 2d array with one more row and column than the values
+    """
+    values = np.asarray(values)
+    dtype = np.int64 if values.dtype.kind in 'biu' else np.float64
+    integral = np.zeros((values.shape[0] + 1, values.shape[1] + 1), dtype=dtype)
+    np.cumsum(values, axis=0, dtype=dtype, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])
+    return integral
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def boxSums(integral, ind_xmin, ind_xmax, ind_ymin, ind_ymax):
+    """
+    Returns the sum of the values within each of the given boxes, each read from the integral image in constant time.
+    :param integral: Integral image of the values (see integralImage)
+    :param ind_xmin, ind_xmax, ind_ymin, ind_ymax: Box ranges (see getBoxRanges)
+    :return: Array of the sums
+    """
+    return (integral[ind_ymax, ind_xmax] - integral[ind_ymin, ind_xmax]
+            - integral[ind_ymax, ind_xmin] + integral[ind_ymin, ind_xmin])
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def cropToBoxes(data, ind_xmin, ind_xmax, ind_ymin, ind_ymax):
+    """
+    Crops the data to the region covered by the given boxes, so that tables built over the data (integral images,
+    filters) are only as large as the boxes need.
+    :param data: The extinction dataset in question
+    :param ind_xmin, ind_xmax, ind_ymin, ind_ymax: Box ranges (see getBoxRanges), at least one box
+    :return: The cropped data (a view) and the box ranges within it
+    """
+    xmin, xmax = ind_xmin.min(), max(ind_xmax.max(), ind_xmin.min())
+    ymin, ymax = ind_ymin.min(), max(ind_ymax.max(), ind_ymin.min())
+    return data[ymin:ymax, xmin:xmax], (ind_xmin - xmin, ind_xmax - xmin, ind_ymin - ymin, ind_ymax - ymin)
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def nearHighExtinctionBatch(px, py, data, NDelt, highExtinctionThreshold):
+    """
+    Checks to see if each of the given points is near a point of high extinction, as nearHighExtinction does for a
+    single point.  The high extinction points are counted once for the whole map, so each point is a constant-time
+    lookup whatever the size of its box.
+    :param px: x locations of the points (array of int)
+    :param py: y locations of the points (array of int)
+    :param data: The extinction dataset in question
+    :param NDelt: Number of pixels above, below, left and right of the point to check, in a square box.
+    :param highExtinctionThreshold: The threshold beyond which a point is considered to be high extinction.
+    :return: Boolean array, True where the point is near a point of high extinction.
+    """
+    boxRanges = getBoxRanges(px, py, data, NDelt)
+    if len(boxRanges[0]) == 0:
+        return np.zeros(0, dtype=bool)
+    region, boxRanges = cropToBoxes(data, *boxRanges)
+
+    integral = integralImage(region > highExtinctionThreshold)
+    return boxSums(integral, *boxRanges) > 0
+# -------- FUNCTION DEFINITION --------
 
-    # ---- Select the relevant data range and check if any point is greater than the threshold.
-    locData = copy.deepcopy(data[ind_ymin:ind_ymax, ind_xmin:ind_xmax])
-    mask = locData > highExtinctionThreshold
-    if np.sum(mask) > 0:
-        return True
-    return False
+# -------- FUNCTION DEFINITION --------
+def averageBoxBatch(px, py, data, NDelt):
+    """
+    Returns the average of a box around each of the given points, as averageBox does for a single point.
+    The sums are read from one integral image of the data, so no box is copied.
+    :param px: x locations of the points (array of int)
+    :param py: y locations of the points (array of int)
+    :param data: The extinction dataset in question
+    :param NDelt: Number of pixels above, below, left and right of the point, in a square box.
+    :return: Array of the averages. As with np.average, the average is nan if the box contains a nan value or lies
+             outside the data.
+    """
+    boxRanges = getBoxRanges(px, py, data, NDelt)
+    if len(boxRanges[0]) == 0:
+        return np.zeros(0)
+    region, (ind_xmin, ind_xmax, ind_ymin, ind_ymax) = cropToBoxes(data, *boxRanges)
+
+    isNaN = np.isnan(region)
+    sums = boxSums(integralImage(np.where(isNaN, 0., region)), ind_xmin, ind_xmax, ind_ymin, ind_ymax)
+    nanCounts = boxSums(integralImage(isNaN), ind_xmin, ind_xmax, ind_ymin, ind_ymax)
+    counts = (ind_xmax - ind_xmin) * (ind_ymax - ind_ymin)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        averages = sums / counts
+    averages[nanCounts > 0] = np.nan
+    return averages
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def extremaBoxBatch(px, py, data, NDelt):
+    """
+    Returns the minimum and maximum of a box around each of the given points.
+    Minimum and maximum filters are run once over the region covered by the boxes and read at the points.  The region
+    is padded by NDelt, so points off the data whose box overlaps the data are read there too.
+    :param px: x locations of the points (array of int)
+    :param py: y locations of the points (array of int)
+    :param data: The extinction dataset in question
+    :param NDelt: Number of pixels above, below, left and right of the point, in a square box.
+    :return:
+        minValues: Array of the minimum within each box
+        maxValues: Array of the maximum within each box
+    NaN values and the parts of boxes outside the data are ignored, as in getBoxExtrema; a box with no values gives nan.
+    """
+    import scipy.ndimage as ndimage
+
+    px = np.asarray(px, dtype=int)
+    py = np.asarray(py, dtype=int)
+    NDelt = int(NDelt)
+    minValues = np.full(len(px), np.nan, dtype=np.result_type(data, 0.))
+    maxValues = np.full(len(px), np.nan, dtype=np.result_type(data, 0.))
+
+    # ---- Keep the points whose box overlaps the data and crop the data to their boxes
+    boxRanges = getBoxRanges(px, py, data, NDelt)
+    overlaps = (boxRanges[1] > boxRanges[0]) & (boxRanges[3] > boxRanges[2])
+    if not np.any(overlaps):
+        return minValues, maxValues
+    ind_xmin, ind_xmax, ind_ymin, ind_ymax = (ind[overlaps] for ind in boxRanges)
+    region, _ = cropToBoxes(data, ind_xmin, ind_xmax, ind_ymin, ind_ymax)
+    # Location of each point within the region once it is padded by NDelt
+    xPadded = px[overlaps] - ind_xmin.min() + NDelt
+    yPadded = py[overlaps] - ind_ymin.min() + NDelt
+    # ---- Keep the points whose box overlaps the data and crop the data to their boxes.
+
+    isNaN = np.isnan(region)
+    size = 2 * NDelt + 1
+    minMap = ndimage.minimum_filter(np.pad(np.where(isNaN, np.inf, region), NDelt, constant_values=np.inf),
+                                    size=size, mode='constant', cval=np.inf)
+    maxMap = ndimage.maximum_filter(np.pad(np.where(isNaN, -np.inf, region), NDelt, constant_values=-np.inf),
+                                    size=size, mode='constant', cval=-np.inf)
+
+    minValues[overlaps] = minMap[yPadded, xPadded]
+    maxValues[overlaps] = maxMap[yPadded, xPadded]
+    minValues[np.isinf(minValues)] = np.nan
+    maxValues[np.isinf(maxValues)] = np.nan
+    return minValues, maxValues
 # -------- FUNCTION DEFINITION --------
 
 # -------- FUNCTION DEFINITION --------
@@ -217,38 +416,113 @@ def averageBox(px, py, data, NDelt):
     :param NDelt: Number of pixels above, below, left and right of the point to check, in a square box.
     :return: The average around that point, as defined by a box around it.
     """
-    # ---- Find the box range for the given point
-    ind_xmin, ind_xmax, ind_ymin, ind_ymax = getBoxRange(px, py, data, NDelt)
-    # ---- Find the box range for the given point.
-
-    # ---- Select the relevant data range and check if any point is greater than the threshold.
-    locData = copy.deepcopy(data[ind_ymin:ind_ymax, ind_xmin:ind_xmax])
-    return np.average(locData)
+    return averageBoxBatch([px], [py], data, NDelt)[0]
 # -------- FUNCTION DEFINITION --------
 
 # -------- FUNCTION DEFINITION --------
-def deepCopy(data):
-    return copy.deepcopy(data)
-# -------- FUNCTION DEFINITION --------
+def interpMask(data, mask, method='cubic', fill_value=0):
+    # Pixel locations of the known and missing points; no full-size coordinate grids are built
+    goodY, goodX = np.nonzero(~mask)
+    knownData = data[goodY, goodX]
+
+    missingY, missingX = np.nonzero(mask)
+
+    import scipy.interpolate as interpolate
+    interpMissingVals = interpolate.griddata((goodX, goodY), knownData, (missingX, missingY), method = method, fill_value = fill_value)
+
+    # The input data is not modified
+    returnData = np.array(data, copy=True)
+    returnData[missingY, missingX] = interpMissingVals
 
+    return returnData
 # -------- FUNCTION DEFINITION --------
-def interpMask(data, mask, method='cubic', fill_value=0):
-    width = data.shape[1]
-    height = data.shape[0]
-    x, y = np.meshgrid(np.arange(width), np.arange(height))
 
-    goodX = x[~mask]
-    goodY = y[~mask]
+# -------- FUNCTION DEFINITION --------
+def interpMaskLocal(data, mask, window=2, method='linear', fill_value=0):
+    """
+    Interpolates over the masked points using only the good points within a window around the masked points.
+    Far fewer points are triangulated than in interpMask when the masked points are sparse.
+    :param data: 2d numpy array of values
+    :param mask: 2d boolean array, True where data is to be interpolated over
+    :param window: Number of pixels around the masked points whose values are used in the interpolation (int)
+    :param method: Interpolation method passed to scipy.interpolate.griddata
+    :param fill_value: Value given to masked points which cannot be interpolated
+    :return: Copy of the data with the masked points interpolated over
+    """
+    returnData = np.array(data, copy=True)
+    if not np.any(mask):
+        return returnData
 
-    knownData = data[~mask]
+    import scipy.ndimage as ndimage
 
-    missingX = x[mask]
-    missingY = y[mask]
+    # ---- Good points within the window around the masked points
+    neighbourhood = ndimage.binary_dilation(mask, structure=np.ones((3, 3), dtype=bool), iterations=int(window))
+    goodY, goodX = np.nonzero(neighbourhood & ~mask)
+    missingY, missingX = np.nonzero(mask)
+    # ---- Good points within the window around the masked points.
 
-    interpMissingVals = interpolate.griddata((goodX, goodY), knownData, (missingX, missingY), method = method, fill_value = fill_value)
+    if len(goodX) == 0:
+        returnData[missingY, missingX] = fill_value
+        return returnData
 
-    returnData = copy.deepcopy(data)
+    import scipy.interpolate as interpolate
+    interpMissingVals = interpolate.griddata((goodX, goodY), data[goodY, goodX], (missingX, missingY),
+                                             method=method, fill_value=fill_value)
     returnData[missingY, missingX] = interpMissingVals
+    return returnData
+# -------- FUNCTION DEFINITION --------
 
+# -------- FUNCTION DEFINITION --------
+def interpMaskConvolution(data, mask, window=2, fill_value=0):
+    """
+    Fills the masked points by normalized convolution: the weighted average of the good points around each masked
+    point, with Gaussian weights. No triangulation is done.
+    :param data: 2d numpy array of values
+    :param mask: 2d boolean array, True where data is to be interpolated over
+    :param window: Standard deviation of the Gaussian weights, in pixels (float)
+    :param fill_value: Value given to masked points with no good points nearby
+    :return: Copy of the data with the masked points filled
+    """
+    returnData = np.array(data, copy=True)
+    if not np.any(mask):
+        return returnData
+
+    import scipy.ndimage as ndimage
+
+    weights = (~mask).astype(float)
+    values = np.where(mask, 0., data)
+    smoothedValues = ndimage.gaussian_filter(values, window, mode='constant')
+    smoothedWeights = ndimage.gaussian_filter(weights, window, mode='constant')
+
+    # Masked points with (almost) no good points within a few windows are not filled with a meaningful value
+    hasNeighbours = smoothedWeights[mask] > 1e-6
+    filledVals = np.full(np.count_nonzero(mask), fill_value, dtype=float)
+    filledVals[hasNeighbours] = smoothedValues[mask][hasNeighbours] / smoothedWeights[mask][hasNeighbours]
+    returnData[mask] = filledVals
     return returnData
 # -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def interpBadData(data, mask, engine='Global', window=2):
+    """
+    Interpolates over the bad data points of an extinction map with the chosen engine.
+    :param data: 2d numpy array of values
+    :param mask: 2d boolean array, True where data is bad
+    :param engine: 'Global' - linear interpolation over every good point (interpMask)
+                   'Local' - linear interpolation over the good points within the window of the bad points
+                   'Convolution' - normalized convolution with Gaussian weights of the given window
+                   Local and Convolution are faster on large maps, but as they only use the good points within the
+                   window they differ from Global where the bad points are not isolated (eg streaks or blocks). They
+                   are opt-in ([Judgement] Interpolation Engine); choose them only after checking the filled map.
+    :param window: Window size of the 'Local' and 'Convolution' engines, in pixels
+    :return: Copy of the data with the bad points interpolated over
+    """
+    if engine.lower() == 'global':
+        return interpMask(data, mask, 'linear')
+    elif engine.lower() == 'local':
+        return interpMaskLocal(data, mask, window, 'linear')
+    elif engine.lower() == 'convolution':
+        return interpMaskConvolution(data, mask, window)
+    else:
+        raise ValueError("Unknown interpolation engine '{}'; expected Global, Local or Convolution".format(engine))
+# -------- FUNCTION DEFINITION --------
@@ -36,7 +36,7 @@ TEMPLATE (with defaults)
 import os
 from sys import exit
 from configparser import ConfigParser
-import MolecularClouds.Classes.config as config
+from . import config
 '''
 currentDir = os.path.abspath(os.getcwd())
 '''
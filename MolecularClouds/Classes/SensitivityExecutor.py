@@ -0,0 +1,95 @@
+"""
+This file contains the functions to calculate BLOS for several variants of the electron abundance in parallel.
+It is used in the sensitivity stages (05a, 06a) of the BLOS Mapping Method.
+    - Each variant (one abundance file) is independent, so the variants are split into one group per worker process.
+    Each worker calculates its group in a single pass with calculateBVariants.
+    - The matched rotation measure and extinction table and the reference point table are read once and handed to each
+    worker when it starts; the workers only read them
+    - A variant which fails does not stop the others; its traceback is returned
+    - Workers are forked, since the stage scripts would otherwise be rerun by each worker. Where fork is not available
+    (e.g. Windows) the variants are calculated one after the other.
+"""
+import os
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from .CalculateB import calculateBVariants
+from . import config
+
+# Tables shared (read-only) by the variants calculated in a worker process
+sharedMatchedTable = None
+sharedRefPointTable = None
+
+
+# -------- FUNCTION DEFINITION --------
+def initWorker(matchedTable, refPointTable, configSnapshot):
+    """
+    Keeps the tables shared by all variants in the worker process, and gives it the configuration of the parent process
+    """
+    global sharedMatchedTable, sharedRefPointTable
+    config.useSnapshot(configSnapshot)
+    sharedMatchedTable = matchedTable
+    sharedRefPointTable = refPointTable
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def calculateVariants(names, AvAbundancePaths, saveFilePaths):
+    """
+    Calculates and saves BLOS for a group of variants of the electron abundance
+    :param names: Names of the variants
+    :param AvAbundancePaths: Paths to the extinction and electron abundance of each variant
+    :param saveFilePaths: Paths to which the BLOS of each variant is saved
+    :return: Dictionary of variant name: traceback of the error, for the variants which failed
+    """
+    try:
+        calculateBVariants(AvAbundancePaths, sharedMatchedTable, sharedRefPointTable, saveFilePaths)
+        return {}
+    except Exception:
+        if len(names) == 1:
+            return {names[0]: traceback.format_exc()}
+
+    # One of the variants failed, so each variant is calculated on its own to find which
+    failures = {}
+    for name, AvAbundancePath, saveFilePath in zip(names, AvAbundancePaths, saveFilePaths):
+        failures.update(calculateVariants([name], [AvAbundancePath], [saveFilePath]))
+    return failures
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def runSensitivityVariants(variants, MatchedRMExtincPath, refPointTable, numWorkers=None):
+    """
+    Calculates BLOS for each variant of the electron abundance, in parallel
+    :param variants: Dictionary of variant name: (path to the abundance file, path to which BLOS is saved)
+    :param MatchedRMExtincPath: Path to the matched rotation measure and extinction data (produced in stage 02)
+    :param refPointTable: Table (pandas dataframe) of the reference points
+    :param numWorkers: Number of worker processes. If None, the configured number is used; 1 calculates in this process
+    :return: Dictionary of variant name: traceback, for the variants which failed
+    """
+    if numWorkers is None:
+        numWorkers = config.sensitivityWorkers if config.sensitivityWorkers > 0 else os.cpu_count()
+    numWorkers = max(1, min(numWorkers, len(variants)))
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        numWorkers = 1
+
+    matchedTable = pd.read_csv(MatchedRMExtincPath, sep='\t')
+    # Split the variants into one group per worker
+    names = list(variants)
+    groups = [names[i::numWorkers] for i in range(numWorkers)]
+    groupArgs = [(group, [variants[name][0] for name in group], [variants[name][1] for name in group])
+                 for group in groups]
+
+    failures = {}
+    if numWorkers == 1:
+        initWorker(matchedTable, refPointTable, config.getSnapshot())
+        failures.update(calculateVariants(*groupArgs[0]))
+    else:
+        with ProcessPoolExecutor(max_workers=numWorkers, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=initWorker, initargs=(matchedTable, refPointTable, config.getSnapshot())) as executor:
+            for groupFailures in executor.map(calculateVariants, *zip(*groupArgs)):
+                failures.update(groupFailures)
+
+    return {name: failures[name] for name in names if name in failures}
+# -------- FUNCTION DEFINITION. --------
@@ -1,57 +1,184 @@
 """
 In this file global variables which are used across all modules are defined.
 They are adjusted in the Config[Setting].ini accordingly
+    - The .ini files are read from the folder of the stage scripts (the folder above this package), whatever the current
+    directory is
+    - The files are read once, when a variable is first used, into an immutable snapshot (ConfigSnapshot) whose fields
+    are the variables of this module.  Worker processes are given the snapshot (see useSnapshot) rather than reading
+    the files again, so every process of a run uses the same configuration
 """
+import os
+from collections import namedtuple
 from configparser import ConfigParser
-# -------- DEFINE STARTING VARIABLES. --------
-configStartSettings = ConfigParser()
-configStartSettings.read('configStartSettings.ini')
-cloudJeansLength = configStartSettings['Cloud'].getfloat('Cloud Jeans Length')
-
-doInterpExtinct = configStartSettings['Judgement'].getboolean('Interpolate Bad Extinction Values')
-
-offDiskLatitude = configStartSettings['Judgement'].getfloat('Off Disk Latitude')
-onDiskAvThresh = configStartSettings['Judgement'].getfloat('On Disk Extinction Threshold')
-offDiskAvThresh = configStartSettings['Judgement'].getfloat('Off Disk Extinction Threshold')
-pixelCheckMultiplier = configStartSettings['Judgement'].getint('Pixel Check Range Multiplier')
-highExtinctionThreshMultiplier = configStartSettings['Judgement'].getfloat('High Extinction Threshold Multiplier')
-anomalousSTDNum = configStartSettings['Judgement'].getfloat('Anomalous Values Standard Deviation')
-# -------- DEFINE STARTING VARIABLES. --------
-
-# -------- DEFINE DIRECTORIES AND NAMES. --------
-configDirectoryAndNames = ConfigParser()
-configDirectoryAndNames.read('configDirectoryAndNames.ini')
-
-#Output Directories
-dir_root = configDirectoryAndNames['Output File Locations'].get('Root')
-dir_fileOutput = configDirectoryAndNames['Output File Locations'].get('File Output')
-dir_plots = configDirectoryAndNames['Output File Locations'].get('Plots')
-dir_densitySensitivity = configDirectoryAndNames['Output File Locations'].get('Density Sensitivity')
-dir_temperatureSensitivity = configDirectoryAndNames['Output File Locations'].get('Temperature Sensitivity')
-#Output Name Prefixes
-prefix_rmMapping = configDirectoryAndNames['Output File Prefixes'].get('RM Mapping')
-prefix_RMExtinctionMatch = configDirectoryAndNames['Output File Prefixes'].get('RM-Extinction Matching')
-prefix_allPotRefPoints = configDirectoryAndNames['Output File Prefixes'].get('All Potential Reference Points')
-prefix_selRefPoints = configDirectoryAndNames['Output File Prefixes'].get('Selected Reference Points')
-prefix_refData = configDirectoryAndNames['Output File Prefixes'].get('Reference Data')
-prefix_BLOSPointData = configDirectoryAndNames['Output File Prefixes'].get('BLOS Point Data')
-prefix_BLOSPointFig = configDirectoryAndNames['Output File Prefixes'].get('BLOS Point Figure')
-prefix_BLOSUncertainty = configDirectoryAndNames['Output File Prefixes'].get('BLOS Uncertainties')
-prefix_OptRefPoints = configDirectoryAndNames['Output File Prefixes'].get('Optimal Reference Points')
-#Input Directories
-dir_data = configDirectoryAndNames['Input File Locations'].get('Input Data')
-dir_cloudParameters = configDirectoryAndNames['Input File Locations'].get('Cloud Parameter Data')
-dir_chemAbundance = configDirectoryAndNames['Input File Locations'].get('Chemical Abundance Data')
-#Input File Names
-file_RMCatalogue = configDirectoryAndNames['Input File Names'].get('RM Catalogue')
-# -------- DEFINE DIRECTORIES AND NAMES. --------
-
-# -------- DEFINE CONSTANTS. --------
-configConstants = ConfigParser()
-configConstants.read('configConstants.ini')
-
-# Visual extinction to hydrogen column density.
-VExtinct_2_Hcol = configConstants['Conversion Factors'].getfloat('Visual Extinction to Hydrogen Column Density')
-# Parsec to cm
-pcTocm = configConstants['Conversion Factors'].getfloat('Parsecs to Centimeters')
-# -------- DEFINE CONSTANTS. --------
+
+configDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ConfigSnapshot = namedtuple('ConfigSnapshot', [
+    'cloudJeansLength', 'doInterpExtinct', 'interpEngine', 'interpWindow', 'offDiskLatitude', 'onDiskAvThresh',
+    'offDiskAvThresh', 'pixelCheckMultiplier', 'highExtinctionThreshMultiplier', 'anomalousSTDNum', 'cropMargin',
+    'sensitivityWorkers', 'batchWorkers', 'monteCarloSamples', 'monteCarloWorkers', 'monteCarloSeed',
+    'monteCarloTempChange', 'monteCarloDensityChange', 'figuresHeadless', 'figuresInBackground', 'labelPlacement',
+    'freeLabelLimit', 'labelLimit',
+    'dir_root', 'dir_fileOutput', 'dir_plots', 'dir_densitySensitivity', 'dir_temperatureSensitivity',
+    'prefix_rmMapping', 'prefix_RMExtinctionMatch', 'prefix_allPotRefPoints', 'prefix_selRefPoints', 'prefix_refData',
+    'prefix_BLOSPointData', 'prefix_BLOSPointFig', 'prefix_BLOSUncertainty', 'prefix_OptRefPoints',
+    'dir_data', 'dir_cloudParameters', 'dir_chemAbundance', 'file_RMCatalogue',
+    'VExtinct_2_Hcol', 'pcTocm',
+    # The contents of the .ini files, as tuples of (section, ((key, value), ...))
+    'startSettingsSections', 'directoryAndNamesSections', 'constantsSections'])
+
+# The snapshot in use; None until the configuration is first used
+snapshot = None
+
+
+# -------- FUNCTION DEFINITION --------
+def parserSections(parser):
+    """
+    Gives the contents of a ConfigParser in an immutable form
+    :param parser: ConfigParser
+    :return: Tuple of (section, ((key, value), ...))
+    """
+    return tuple((section, tuple(parser.items(section, raw=True))) for section in parser.sections())
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def sectionsParser(sections):
+    """
+    Makes a ConfigParser from the contents given by parserSections
+    :param sections: Tuple of (section, ((key, value), ...))
+    :return: ConfigParser
+    """
+    parser = ConfigParser()
+    parser.read_dict({section: dict(items) for section, items in sections})
+    return parser
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def readSnapshot(directory=configDir):
+    """
+    Reads the configuration files
+    :param directory: Folder of the .ini files
+    :return: ConfigSnapshot
+    """
+    # -------- DEFINE STARTING VARIABLES. --------
+    configStartSettings = ConfigParser()
+    configStartSettings.read(os.path.join(directory, 'configStartSettings.ini'))
+    cloudJeansLength = configStartSettings['Cloud'].getfloat('Cloud Jeans Length')
+
+    doInterpExtinct = configStartSettings['Judgement'].getboolean('Interpolate Bad Extinction Values')
+    interpEngine = configStartSettings['Judgement'].get('Interpolation Engine', fallback='Global')  # Global, Local or Convolution
+    interpWindow = configStartSettings['Judgement'].getint('Interpolation Window', fallback=2)
+
+    offDiskLatitude = configStartSettings['Judgement'].getfloat('Off Disk Latitude')
+    onDiskAvThresh = configStartSettings['Judgement'].getfloat('On Disk Extinction Threshold')
+    offDiskAvThresh = configStartSettings['Judgement'].getfloat('Off Disk Extinction Threshold')
+    pixelCheckMultiplier = configStartSettings['Judgement'].getint('Pixel Check Range Multiplier')
+    highExtinctionThreshMultiplier = configStartSettings['Judgement'].getfloat('High Extinction Threshold Multiplier')
+    anomalousSTDNum = configStartSettings['Judgement'].getfloat('Anomalous Values Standard Deviation')
+
+    cropMargin = configStartSettings.getint('Processing', 'Crop Margin', fallback=50)  # [pix] kept around the region of interest
+    sensitivityWorkers = configStartSettings.getint('Processing', 'Sensitivity Workers', fallback=1)  # 0 to use all cores
+
+    batchWorkers = configStartSettings.getint('Batch', 'Workers', fallback=0)  # 0 to use all cores
+
+    monteCarloSamples = configStartSettings.getint('Monte Carlo', 'Samples', fallback=0)  # 0 to skip the Monte Carlo estimate
+    monteCarloWorkers = configStartSettings.getint('Monte Carlo', 'Workers', fallback=1)  # 0 to use all cores
+    monteCarloSeed = configStartSettings.get('Monte Carlo', 'Seed', fallback='').strip()
+    monteCarloSeed = int(monteCarloSeed) if monteCarloSeed != '' else None
+    monteCarloTempChange = configStartSettings.getfloat('Monte Carlo', 'Temperature Change', fallback=20.)  # [%]
+    monteCarloDensityChange = configStartSettings.getfloat('Monte Carlo', 'Density Change', fallback=50.)  # [%]
+
+    figuresHeadless = configStartSettings.getboolean('Figures', 'Headless', fallback=False)  # Save figures without showing them
+    figuresInBackground = configStartSettings.getboolean('Figures', 'Background Rendering', fallback=True)  # When headless
+    labelPlacement = configStartSettings.get('Figures', 'Label Placement', fallback='Auto')  # Free, Grid or Auto
+    freeLabelLimit = configStartSettings.getint('Figures', 'Free Label Limit', fallback=100)  # Most labels placed freely by Auto
+    labelLimit = configStartSettings.getint('Figures', 'Label Limit', fallback=500)  # Most labels on a map
+    # -------- DEFINE STARTING VARIABLES. --------
+
+    # -------- DEFINE DIRECTORIES AND NAMES. --------
+    configDirectoryAndNames = ConfigParser()
+    configDirectoryAndNames.read(os.path.join(directory, 'configDirectoryAndNames.ini'))
+
+    #Output Directories
+    dir_root = configDirectoryAndNames['Output File Locations'].get('Root')
+    dir_fileOutput = configDirectoryAndNames['Output File Locations'].get('File Output')
+    dir_plots = configDirectoryAndNames['Output File Locations'].get('Plots')
+    dir_densitySensitivity = configDirectoryAndNames['Output File Locations'].get('Density Sensitivity')
+    dir_temperatureSensitivity = configDirectoryAndNames['Output File Locations'].get('Temperature Sensitivity')
+    #Output Name Prefixes
+    prefix_rmMapping = configDirectoryAndNames['Output File Prefixes'].get('RM Mapping')
+    prefix_RMExtinctionMatch = configDirectoryAndNames['Output File Prefixes'].get('RM-Extinction Matching')
+    prefix_allPotRefPoints = configDirectoryAndNames['Output File Prefixes'].get('All Potential Reference Points')
+    prefix_selRefPoints = configDirectoryAndNames['Output File Prefixes'].get('Selected Reference Points')
+    prefix_refData = configDirectoryAndNames['Output File Prefixes'].get('Reference Data')
+    prefix_BLOSPointData = configDirectoryAndNames['Output File Prefixes'].get('BLOS Point Data')
+    prefix_BLOSPointFig = configDirectoryAndNames['Output File Prefixes'].get('BLOS Point Figure')
+    prefix_BLOSUncertainty = configDirectoryAndNames['Output File Prefixes'].get('BLOS Uncertainties')
+    prefix_OptRefPoints = configDirectoryAndNames['Output File Prefixes'].get('Optimal Reference Points')
+    #Input Directories
+    dir_data = configDirectoryAndNames['Input File Locations'].get('Input Data')
+    dir_cloudParameters = configDirectoryAndNames['Input File Locations'].get('Cloud Parameter Data')
+    dir_chemAbundance = configDirectoryAndNames['Input File Locations'].get('Chemical Abundance Data')
+    #Input File Names
+    file_RMCatalogue = configDirectoryAndNames['Input File Names'].get('RM Catalogue')
+    # -------- DEFINE DIRECTORIES AND NAMES. --------
+
+    # -------- DEFINE CONSTANTS. --------
+    configConstants = ConfigParser()
+    configConstants.read(os.path.join(directory, 'configConstants.ini'))
+
+    # Visual extinction to hydrogen column density.
+    VExtinct_2_Hcol = configConstants['Conversion Factors'].getfloat('Visual Extinction to Hydrogen Column Density')
+    # Parsec to cm
+    pcTocm = configConstants['Conversion Factors'].getfloat('Parsecs to Centimeters')
+    # -------- DEFINE CONSTANTS. --------
+
+    startSettingsSections = parserSections(configStartSettings)
+    directoryAndNamesSections = parserSections(configDirectoryAndNames)
+    constantsSections = parserSections(configConstants)
+    values = locals()
+    return ConfigSnapshot(**{field: values[field] for field in ConfigSnapshot._fields})
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def useSnapshot(newSnapshot):
+    """
+    Makes the variables of this module those of a snapshot.  Used as the initializer of worker processes.
+    The ConfigParsers configStartSettings, configDirectoryAndNames and configConstants are remade from the snapshot.
+    :param newSnapshot: ConfigSnapshot (eg. from getSnapshot in the parent process)
+    """
+    global snapshot
+    snapshot = newSnapshot
+    globals().update(newSnapshot._asdict())
+    globals().update(configStartSettings=sectionsParser(newSnapshot.startSettingsSections),
+                     configDirectoryAndNames=sectionsParser(newSnapshot.directoryAndNamesSections),
+                     configConstants=sectionsParser(newSnapshot.constantsSections))
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def getSnapshot():
+    """
+    Gives the snapshot in use, reading the configuration files if they have not been read yet
+    :return: ConfigSnapshot
+    """
+    if snapshot is None:
+        useSnapshot(readSnapshot())
+    return snapshot
+# -------- FUNCTION DEFINITION. --------
+
+
+# -------- FUNCTION DEFINITION --------
+def __getattr__(name):
+    """
+    Reads the configuration files when a variable of this module is first used
+    """
+    if snapshot is None and not name.startswith('__'):
+        getSnapshot()
+        if name in globals():
+            return globals()[name]
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+# -------- FUNCTION DEFINITION. --------
@@ -1,4 +1,10 @@
 import math
+import os
+import hashlib
+from .FigureQueue import waitForFigures
+
+# Answers given to askUser in a batch run, keyed by choice (see BatchRun.py). None when running interactively.
+batchAnswers = None
 
 
 def getBoxBounds(data, boxXMin, boxXMax, boxYMin, boxYMax):
@@ -15,3 +21,30 @@ def getBoxBounds(data, boxXMin, boxXMax, boxYMin, boxYMax):
     if not math.isnan(boxYMax):
         ymax = int(boxYMax)
     return xmin, xmax, ymin, ymax
+
+
+def fileSignature(path):
+    """
+    Gives a short signature of a file which changes whenever the file is modified.  Used to key caches.
+    :param path: Path to the file
+    :return: Hexadecimal string built from the size and modification time of the file
+    """
+    stat = os.stat(path)
+    return hashlib.sha1('{}:{}'.format(stat.st_size, stat.st_mtime_ns).encode()).hexdigest()[:16]
+
+
+def askUser(prompt, choice, batchDefault=''):
+    """
+    Asks the user for a choice.  In a batch run the answer is taken from batchAnswers instead, falling back to the
+    given default, and is printed after the prompt so the log reads as an interactive session would.
+    :param prompt: Text shown to the user
+    :param choice: Name of the choice, which keys batchAnswers
+    :param batchDefault: Answer used in a batch run when batchAnswers has none for this choice
+    :return: The answer (string)
+    """
+    if batchAnswers is None:
+        waitForFigures()  # So the figures made so far can be reviewed before answering
+        return input(prompt)
+    answer = str(batchAnswers.get(choice, batchDefault))
+    print(prompt + answer)
+    return answer